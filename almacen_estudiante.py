@@ -0,0 +1,495 @@
+"""Almacén SQLite de los datos de la app de escritorio
+
+Una fila por registro diario (usuario, fecha) con columnas numéricas, y una
+fila por entrada del historial de recetas. El archivo usa WAL y cada escritura
+es una transacción corta, así dos instancias de la app pueden escribir a la vez.
+
+Para migrar a mano el JSON anterior (la app lo hace sola al iniciar):
+
+    python almacen_estudiante.py --migrar datos_estudiante.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from metricas import registro as registro_metricas
+
+# Base de datos por defecto, junto al JSON que reemplaza
+RUTA_ALMACEN = "datos_estudiante.db"
+RUTA_DATOS_JSON = "datos_estudiante.json"
+
+VERSION_ESQUEMA = 1
+
+CAMPOS_NUMERICOS = ("sueno", "agua", "ejercicio", "estres", "estudio")
+CAMPOS_TEXTO = ("comidas", "notas")
+CAMPOS_REGISTRO = CAMPOS_NUMERICOS + CAMPOS_TEXTO
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    nombre TEXT PRIMARY KEY,
+    creado TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS registros_diarios (
+    usuario TEXT NOT NULL REFERENCES usuarios(nombre),
+    fecha TEXT NOT NULL,
+    sueno REAL,
+    agua REAL,
+    ejercicio REAL,
+    estres INTEGER,
+    estudio REAL,
+    comidas TEXT NOT NULL DEFAULT '',
+    notas TEXT NOT NULL DEFAULT '',
+    actualizado TEXT NOT NULL,
+    PRIMARY KEY (usuario, fecha)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS historial_recetas (
+    id INTEGER PRIMARY KEY,
+    usuario TEXT NOT NULL REFERENCES usuarios(nombre),
+    fecha TEXT NOT NULL,
+    ingredientes TEXT NOT NULL,
+    recetas TEXT NOT NULL,
+    origen TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS historial_usuario_fecha ON historial_recetas (usuario, fecha);
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+"""
+
+
+def convertir_numero(valor, campo="valor"):
+    """Convertir lo escrito en el formulario ("8", "7,5", "") a número o None"""
+    if valor is None or isinstance(valor, (int, float)):
+        return valor
+    texto = str(valor).strip().replace(",", ".")
+    if not texto:
+        return None
+    try:
+        return float(texto)
+    except ValueError:
+        raise ValueError(f"'{valor}' no es un número válido para {campo}") from None
+
+
+def formatear_numero(valor):
+    """Mostrar un número guardado en el formulario sin decimales sobrantes"""
+    if valor is None:
+        return ""
+    return f"{valor:g}"
+
+
+def normalizar_registro(registro, estricto=True):
+    """Pasar un registro del formulario (o del JSON anterior) a los tipos de las columnas
+
+    Con `estricto=False` los valores que no se pueden convertir quedan vacíos en
+    lugar de lanzar ValueError (se usa al migrar datos viejos).
+    """
+    normalizado = {}
+    for campo in CAMPOS_NUMERICOS:
+        try:
+            numero = convertir_numero(registro.get(campo), campo)
+        except ValueError:
+            if estricto:
+                raise
+            numero = None
+        if campo == "estres" and numero is not None:
+            numero = int(round(numero))
+        normalizado[campo] = numero
+    for campo in CAMPOS_TEXTO:
+        normalizado[campo] = registro.get(campo) or ""
+    return normalizado
+
+
+class _Transaccion:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK
+
+    IMMEDIATE toma el bloqueo de escritura al inicio: si otra instancia está
+    escribiendo, sqlite espera hasta `segundos_espera` en lugar de fallar a mitad
+    de la transacción.
+    """
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def __enter__(self):
+        self.conexion.execute("BEGIN IMMEDIATE")
+        return self.conexion
+
+    def __exit__(self, tipo, error, traza):
+        self.conexion.execute("COMMIT" if tipo is None else "ROLLBACK")
+        return False
+
+
+class AlmacenEstudiante:
+    """Usuarios, registros diarios e historial de recetas en SQLite"""
+
+    def __init__(self, ruta=RUTA_ALMACEN, segundos_espera=5.0, sincronizacion="NORMAL"):
+        self.ruta = ruta
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        # Autocommit: las transacciones se abren explícitamente con BEGIN IMMEDIATE
+        self._conexion = sqlite3.connect(ruta, timeout=segundos_espera, isolation_level=None,
+                                         check_same_thread=False)
+        self._conexion.row_factory = sqlite3.Row
+        self._candado = threading.Lock()
+        with self._candado:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            # NORMAL sobrevive a un cierre inesperado de la app; FULL también a un corte de luz
+            self._conexion.execute(f"PRAGMA synchronous={sincronizacion}")
+            self._conexion.execute("PRAGMA foreign_keys=ON")
+            with self._transaccion():
+                for sentencia in _ESQUEMA.split(";"):
+                    if sentencia.strip():
+                        self._conexion.execute(sentencia)
+                self._conexion.execute(f"PRAGMA user_version={VERSION_ESQUEMA}")
+
+    def _transaccion(self):
+        return _Transaccion(self._conexion)
+
+    def cerrar(self):
+        """Cerrar la conexión (hace checkpoint del WAL)"""
+        with self._candado:
+            self._conexion.close()
+
+    def crear_usuario(self, nombre):
+        """Registrar un usuario si todavía no existe"""
+        with self._candado, self._transaccion():
+            self._conexion.execute(
+                "INSERT OR IGNORE INTO usuarios (nombre, creado) VALUES (?, ?)",
+                (nombre, datetime.now().isoformat(timespec="seconds")))
+
+    def usuarios(self):
+        """Nombres de todos los usuarios"""
+        with self._candado:
+            return [fila["nombre"] for fila in self._conexion.execute("SELECT nombre FROM usuarios ORDER BY nombre")]
+
+    def obtener_registro(self, usuario, fecha):
+        """Registro de un día como diccionario ({} si no hay)"""
+        with self._candado:
+            fila = self._conexion.execute(
+                f"SELECT {', '.join(CAMPOS_REGISTRO)} FROM registros_diarios WHERE usuario = ? AND fecha = ?",
+                (usuario, fecha)).fetchone()
+        return dict(fila) if fila else {}
+
+    def registros_entre(self, usuario, desde, hasta):
+        """Registros de un rango de fechas (inclusivo) como {fecha: registro}"""
+        with self._candado:
+            filas = self._conexion.execute(
+                f"SELECT fecha, {', '.join(CAMPOS_REGISTRO)} FROM registros_diarios "
+                "WHERE usuario = ? AND fecha BETWEEN ? AND ? ORDER BY fecha",
+                (usuario, desde, hasta)).fetchall()
+        return {fila["fecha"]: {campo: fila[campo] for campo in CAMPOS_REGISTRO} for fila in filas}
+
+    def guardar_registro(self, usuario, fecha, registro):
+        """Guardar (o reemplazar) el registro de un día y devolverlo normalizado
+
+        Lanza ValueError si un número no es válido.
+        """
+        normalizado = normalizar_registro(registro)
+        with self._candado, self._transaccion():
+            self._upsert_registro(usuario, fecha, normalizado)
+        return normalizado
+
+    def _upsert_registro(self, usuario, fecha, normalizado):
+        self._conexion.execute(
+            "INSERT OR IGNORE INTO usuarios (nombre, creado) VALUES (?, ?)",
+            (usuario, datetime.now().isoformat(timespec="seconds")))
+        columnas = ", ".join(CAMPOS_REGISTRO)
+        marcadores = ", ".join("?" for _ in CAMPOS_REGISTRO)
+        actualizaciones = ", ".join(f"{campo} = excluded.{campo}" for campo in CAMPOS_REGISTRO)
+        self._conexion.execute(
+            f"INSERT INTO registros_diarios (usuario, fecha, {columnas}, actualizado) "
+            f"VALUES (?, ?, {marcadores}, ?) "
+            f"ON CONFLICT (usuario, fecha) DO UPDATE SET {actualizaciones}, actualizado = excluded.actualizado",
+            (usuario, fecha, *(normalizado[campo] for campo in CAMPOS_REGISTRO),
+             datetime.now().isoformat(timespec="seconds")))
+
+    def agregar_historial(self, usuario, ingredientes, recetas, origen, fecha=None):
+        """Agregar una entrada al historial de recetas del usuario"""
+        with self._candado, self._transaccion():
+            self._insertar_historial(usuario, {
+                "fecha": fecha or datetime.now().isoformat(timespec="seconds"),
+                "ingredientes": ingredientes,
+                "recetas": recetas,
+                "origen": origen
+            })
+
+    def _insertar_historial(self, usuario, entrada):
+        self._conexion.execute(
+            "INSERT INTO historial_recetas (usuario, fecha, ingredientes, recetas, origen) VALUES (?, ?, ?, ?, ?)",
+            (usuario, entrada["fecha"], json.dumps(list(entrada.get("ingredientes", [])), ensure_ascii=False),
+             json.dumps(list(entrada.get("recetas", [])), ensure_ascii=False), entrada.get("origen", "")))
+
+    def historial_recetas(self, usuario, limite=50):
+        """Últimas entradas del historial de recetas, de la más reciente a la más antigua"""
+        with self._candado:
+            filas = self._conexion.execute(
+                "SELECT fecha, ingredientes, recetas, origen FROM historial_recetas "
+                "WHERE usuario = ? ORDER BY fecha DESC, id DESC LIMIT ?",
+                (usuario, limite)).fetchall()
+        return [{
+            "fecha": fila["fecha"],
+            "ingredientes": json.loads(fila["ingredientes"]),
+            "recetas": json.loads(fila["recetas"]),
+            "origen": fila["origen"]
+        } for fila in filas]
+
+    def escribir_lote(self, usuarios=(), registros=None, historial=()):
+        """Escribir varios cambios en una sola transacción
+
+        `registros` es {(usuario, fecha): registro normalizado} e `historial` una
+        lista de (usuario, entrada). Si algo falla no se escribe nada.
+        """
+        with self._candado, self._transaccion():
+            for usuario in usuarios:
+                self._conexion.execute(
+                    "INSERT OR IGNORE INTO usuarios (nombre, creado) VALUES (?, ?)",
+                    (usuario, datetime.now().isoformat(timespec="seconds")))
+            for (usuario, fecha), normalizado in (registros or {}).items():
+                self._upsert_registro(usuario, fecha, normalizado)
+            for usuario, entrada in historial:
+                self._insertar_historial(usuario, entrada)
+
+    def migrar_json(self, ruta_json=RUTA_DATOS_JSON):
+        """Importar una sola vez el archivo JSON anterior; devuelve cuántos registros se importaron
+
+        La marca de migración se lee y escribe dentro de la misma transacción, así
+        que si dos instancias arrancan a la vez solo una importa los datos. El
+        JSON no se modifica y queda como respaldo.
+        """
+        if not os.path.exists(ruta_json):
+            return 0
+        with self._candado, self._transaccion():
+            marca = self._conexion.execute("SELECT valor FROM meta WHERE clave = 'json_migrado'").fetchone()
+            if marca is not None:
+                return 0
+            with open(ruta_json, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            importados = 0
+            for usuario, datos_usuario in datos.items():
+                self._conexion.execute(
+                    "INSERT OR IGNORE INTO usuarios (nombre, creado) VALUES (?, ?)",
+                    (usuario, datetime.now().isoformat(timespec="seconds")))
+                for fecha, registro in datos_usuario.get("registros_diarios", {}).items():
+                    self._upsert_registro(usuario, fecha, normalizar_registro(registro, estricto=False))
+                    importados += 1
+                for entrada in datos_usuario.get("historial_recetas", []):
+                    self._insertar_historial(usuario, entrada)
+            self._conexion.execute(
+                "INSERT INTO meta (clave, valor) VALUES ('json_migrado', ?)",
+                (f"{os.path.abspath(ruta_json)} {datetime.now().isoformat(timespec='seconds')}",))
+        return importados
+
+
+class AlmacenDiferido:
+    """Escritura diferida sobre un AlmacenEstudiante
+
+    Los métodos de escritura solo validan y encolan el cambio, así que regresan
+    al instante en el hilo de la interfaz. Un hilo de fondo junta los cambios
+    que llegan durante `segundos_espera` (el último registro de un día gana) y
+    los escribe en una sola transacción. Las lecturas ven los cambios aún no
+    escritos. Si la escritura falla se reintenta con espera creciente y se avisa
+    con `al_fallar(error)`; cada lote durable se avisa con `al_confirmar(cambios)`
+    (ambos se llaman desde el hilo de fondo).
+    """
+
+    def __init__(self, almacen, segundos_espera=0.5, segundos_reintento_maximo=30.0,
+                 al_confirmar=None, al_fallar=None):
+        self.almacen = almacen
+        self.segundos_espera = segundos_espera
+        self.segundos_reintento_maximo = segundos_reintento_maximo
+        self.al_confirmar = al_confirmar
+        self.al_fallar = al_fallar
+        self.confirmados = 0
+        self.ultima_confirmacion = None
+        self.ultimo_error = None
+        self._usuarios = set()
+        self._registros = {}
+        self._historial = []
+        # Lote que se está escribiendo: sigue visible para las lecturas hasta el commit
+        self._en_escritura = ({}, [])
+        self._escribiendo = False
+        self._vaciar = False
+        self._cerrado = False
+        self._condicion = threading.Condition()
+        self._hilo = threading.Thread(target=self._trabajar, name="almacen-diferido", daemon=True)
+        self._hilo.start()
+
+    def _hay_pendientes(self):
+        return bool(self._usuarios or self._registros or self._historial)
+
+    def crear_usuario(self, nombre):
+        """Encolar el alta de un usuario"""
+        with self._condicion:
+            self._usuarios.add(nombre)
+            self._condicion.notify_all()
+
+    def guardar_registro(self, usuario, fecha, registro):
+        """Validar y encolar el registro de un día; devuelve el registro normalizado
+
+        Lanza ValueError si un número no es válido.
+        """
+        normalizado = normalizar_registro(registro)
+        with self._condicion:
+            self._registros[(usuario, fecha)] = normalizado
+            self._condicion.notify_all()
+        return dict(normalizado)
+
+    def agregar_historial(self, usuario, ingredientes, recetas, origen, fecha=None):
+        """Encolar una entrada del historial de recetas"""
+        entrada = {
+            "fecha": fecha or datetime.now().isoformat(timespec="seconds"),
+            "ingredientes": list(ingredientes),
+            "recetas": list(recetas),
+            "origen": origen
+        }
+        with self._condicion:
+            self._historial.append((usuario, entrada))
+            self._condicion.notify_all()
+
+    def _registros_pendientes(self):
+        """Cambios sin confirmar, del más viejo al más nuevo"""
+        registros = dict(self._en_escritura[0])
+        registros.update(self._registros)
+        return registros
+
+    def usuarios(self):
+        """Nombres de todos los usuarios, incluidos los aún no escritos"""
+        with self._condicion:
+            pendientes = set(self._usuarios) | {usuario for usuario, _ in self._registros_pendientes()}
+        return sorted(set(self.almacen.usuarios()) | pendientes)
+
+    def obtener_registro(self, usuario, fecha):
+        """Registro de un día, viendo primero los cambios pendientes"""
+        with self._condicion:
+            pendiente = self._registros_pendientes().get((usuario, fecha))
+        if pendiente is not None:
+            return dict(pendiente)
+        return self.almacen.obtener_registro(usuario, fecha)
+
+    def registros_entre(self, usuario, desde, hasta):
+        """Registros de un rango de fechas, con los cambios pendientes encima"""
+        with self._condicion:
+            pendientes = {
+                fecha: dict(normalizado) for (dueno, fecha), normalizado in self._registros_pendientes().items()
+                if dueno == usuario and desde <= fecha <= hasta
+            }
+        registros = self.almacen.registros_entre(usuario, desde, hasta)
+        registros.update(pendientes)
+        return dict(sorted(registros.items()))
+
+    def historial_recetas(self, usuario, limite=50):
+        """Historial de recetas, con las entradas pendientes al principio"""
+        with self._condicion:
+            pendientes = [entrada for dueno, entrada in self._en_escritura[1] + self._historial if dueno == usuario]
+        return (pendientes[::-1] + self.almacen.historial_recetas(usuario, limite))[:limite]
+
+    def pendientes(self):
+        """Cantidad de cambios que todavía no son durables"""
+        with self._condicion:
+            return (len(self._usuarios) + len(self._registros) + len(self._historial)
+                    + len(self._en_escritura[0]) + len(self._en_escritura[1]))
+
+    def vaciar(self, timeout=5.0):
+        """Escribir ya lo pendiente; devuelve True si todo quedó guardado antes del timeout"""
+        limite = time.monotonic() + timeout
+        with self._condicion:
+            # Sin nada encolado no hay que apurar al hilo: la marca solo se limpia tras escribir
+            if self._hay_pendientes():
+                self._vaciar = True
+                self._condicion.notify_all()
+            while self._hay_pendientes() or self._escribiendo:
+                restante = limite - time.monotonic()
+                if restante <= 0 or not self._hilo.is_alive():
+                    return False
+                self._condicion.wait(restante)
+            return True
+
+    def cerrar(self, timeout=5.0):
+        """Vaciar, detener el hilo y cerrar el almacén; devuelve True si no quedó nada sin guardar"""
+        durable = self.vaciar(timeout)
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+        self._hilo.join(timeout)
+        if durable:
+            self.almacen.cerrar()
+        return durable
+
+    def _trabajar(self):
+        reintento = self.segundos_espera
+        while True:
+            with self._condicion:
+                while not self._hay_pendientes() and not self._cerrado:
+                    self._condicion.wait()
+                if self._cerrado and not self._hay_pendientes():
+                    return
+                # Juntar los cambios que lleguen durante la ventana de espera
+                limite = time.monotonic() + self.segundos_espera
+                while not (self._vaciar or self._cerrado):
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicion.wait(restante)
+                usuarios, registros, historial = self._usuarios, self._registros, self._historial
+                self._usuarios, self._registros, self._historial = set(), {}, []
+                self._en_escritura = (registros, historial)
+                self._escribiendo = True
+
+            inicio = time.perf_counter()
+            cambios = len(usuarios) + len(registros) + len(historial)
+            try:
+                self.almacen.escribir_lote(usuarios, registros, historial)
+            except Exception as error:
+                registro_metricas.contar("escritorio_persistencia", "error")
+                with self._condicion:
+                    # Devolver el lote a la cola sin pisar cambios más nuevos del mismo día
+                    self._usuarios |= usuarios
+                    self._registros = {**registros, **self._registros}
+                    self._historial = historial + self._historial
+                    self._en_escritura = ({}, [])
+                    self._escribiendo = False
+                    self.ultimo_error = error
+                    self._condicion.notify_all()
+                if self.al_fallar:
+                    self.al_fallar(error)
+                with self._condicion:
+                    if self._cerrado:
+                        return
+                    self._condicion.wait(reintento)
+                reintento = min(reintento * 2, self.segundos_reintento_maximo)
+                continue
+
+            registro_metricas.registrar("escritorio_persistencia", "escritura", time.perf_counter() - inicio, cambios=cambios)
+            reintento = self.segundos_espera
+            with self._condicion:
+                self._en_escritura = ({}, [])
+                self._escribiendo = False
+                self._vaciar = False
+                self.confirmados += cambios
+                self.ultima_confirmacion = time.time()
+                self.ultimo_error = None
+                self._condicion.notify_all()
+            if self.al_confirmar:
+                self.al_confirmar(cambios)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--migrar", metavar="JSON", default=RUTA_DATOS_JSON)
+    parser.add_argument("--ruta", default=RUTA_ALMACEN)
+    args = parser.parse_args()
+
+    almacen = AlmacenEstudiante(args.ruta)
+    importados = almacen.migrar_json(args.migrar)
+    print(f"{importados} registros importados a {args.ruta} ({len(almacen.usuarios())} usuarios)")
+    almacen.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 import streamlit as st
-import base64
-from io import BytesIO
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import hashlib
 from PIL import Image
 import os
-from openai import OpenAI
 from dotenv import load_dotenv
+import pipeline_recetas
+from cache_recetas import CacheRecetas
+from cache_vision import CacheVision
+from cliente_resiliente import ServicioNoDisponible
+from coalescencia import ClienteVueloUnico
+from preprocesamiento import crear_miniatura
+from hash_perceptual import UMBRAL_HAMMING, IndicePerceptual
+from indice_recetas import IndiceRecetas
+from metricas import iniciar_servidor_metricas, medir, registro
+from pasarela_llm import ClienteDeUsuario, crear_pasarela
+from streaming import GeneracionEspeculativa, RenderizadorStream, multiplexar_streams
 
 # Cargar variables de entorno desde archivo .env
 load_dotenv()
@@ -23,114 +33,81 @@ def obtener_cliente_openai():
     if not clave_api:
         st.error("⚠️ Por favor configura tu clave de API de OpenAI (OPENAI_API_KEY)")
         st.stop()
-    return OpenAI(api_key=clave_api)
+    # Las peticiones idénticas en curso de varias sesiones comparten una sola llamada;
+    # la pasarela elige el modelo de cada etapa y lanza peticiones de respaldo
+    return ClienteVueloUnico(crear_pasarela(clave_api))
 
-def codificar_imagen(imagen):
-    """Convertir imagen PIL a cadena base64"""
-    buffer = BytesIO()
-    imagen.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+# Cache de análisis de imágenes compartida entre sesiones
+@st.cache_resource
+def obtener_cache_vision():
+    return CacheVision()
+
+# Cache de recetas y sugerencias por conjunto canónico de ingredientes
+@st.cache_resource
+def obtener_cache_recetas():
+    return CacheRecetas(ruta=os.path.join(".cache", "recetas.json"))
+
+# Recetas ya generadas, indexadas por ingrediente, para responder sin llamar al modelo
+@st.cache_resource
+def obtener_indice_recetas():
+    return IndiceRecetas()
 
-def analizar_imagen_para_ingredientes(cliente, imagen):
-    """Usar GPT-4 Vision para identificar ingredientes en la imagen"""
-    imagen_base64 = codificar_imagen(imagen)
+# Índice de hashes perceptuales para reconocer fotos casi iguales
+@st.cache_resource
+def obtener_indice_perceptual():
+    return IndicePerceptual()
+
+# Vista previa reducida por contenido: no se decodifica la foto completa en cada rerun
+@st.cache_data(max_entries=32, show_spinner=False)
+def obtener_miniatura(id_imagen, _datos):
+    with medir("ingredientes", "miniatura"):
+        return crear_miniatura(_datos)
+
+# Endpoint /metrics en formato Prometheus (solo si METRICAS_PUERTO está definido)
+@st.cache_resource
+def obtener_servidor_metricas():
+    return iniciar_servidor_metricas()
+
+def mostrar_error(etapa, mensaje, error):
+    """Mostrar el error de una etapa; si el servicio está saturado, como aviso"""
+    registro.contar(etapa, "error")
+    if isinstance(error, ServicioNoDisponible):
+        st.warning(f"⏳ {str(error)}")
+    else:
+        st.error(f"{mensaje}: {str(error)}")
+
+def analizar_imagen_para_ingredientes(cliente, imagen, estructurado=False, umbral=UMBRAL_HAMMING, forzar=False,
+                                      al_usar_cache=None):
+    """Usar GPT-4 Vision para identificar ingredientes en la imagen (devuelve fragmentos de texto)"""
+    def al_reutilizar(distancia):
+        st.session_state.distancia_reutilizada = distancia
     
     try:
-        stream = cliente.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """Analiza esta imagen de un refrigerador o alimentos. 
-                            Lista todos los ingredientes y alimentos que puedas identificar.
-                            Formatea tu respuesta como una lista simple con viñetas con solo los nombres de los ingredientes.
-                            Sé específico pero conciso (ej: 'pechuga de pollo', 'pimiento rojo', 'leche entera').
-                            Solo lista elementos que puedas identificar claramente."""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{imagen_base64}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500,
-            stream=True
-        )
-        return stream
+        return pipeline_recetas.analizar_imagen(
+            cliente, imagen, obtener_cache_vision(), estructurado,
+            indice=obtener_indice_perceptual(), umbral=umbral, forzar=forzar, al_reutilizar=al_reutilizar,
+            al_usar_cache=al_usar_cache)
     except Exception as error:
-        st.error(f"Error al analizar imagen: {str(error)}")
+        mostrar_error("ingredientes", "Error al analizar imagen", error)
         return None
 
-def generar_recetas(cliente, ingredientes):
+def generar_recetas(cliente, ingredientes, estructurado=False, usar_indice=True):
     """Generar recetas basadas en ingredientes disponibles con streaming"""
     try:
-        stream = cliente.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Eres un asistente chef útil que crea recetas prácticas y deliciosas."
-                },
-                {
-                    "role": "user",
-                    "content": f"""Basándote en estos ingredientes disponibles:
-                    
-{ingredientes}
-
-Por favor sugiere 3 recetas que se puedan hacer con estos ingredientes. Para cada receta:
-1. Dale un nombre atractivo
-2. Lista los ingredientes necesarios (de la lista disponible)
-3. Proporciona instrucciones breves paso a paso
-4. Menciona el tiempo aproximado de cocción
-
-Formatea cada receta claramente con encabezados y hazla fácil de seguir."""
-                }
-            ],
-            max_tokens=1500,
-            stream=True
-        )
-        return stream
+        return pipeline_recetas.generar_recetas(
+            cliente, ingredientes, obtener_cache_recetas(), estructurado,
+            indice=obtener_indice_recetas() if usar_indice else None)
     except Exception as error:
-        st.error(f"Error al generar recetas: {str(error)}")
+        mostrar_error("recetas", "Error al generar recetas", error)
         return None
 
-def sugerir_ingredientes_adicionales(cliente, ingredientes_actuales):
+def sugerir_ingredientes_adicionales(cliente, ingredientes_actuales, estructurado=False):
     """Sugerir ingredientes para comprar para más variedad de recetas con streaming"""
     try:
-        stream = cliente.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Eres un asesor culinario útil."
-                },
-                {
-                    "role": "user",
-                    "content": f"""Basándote en estos ingredientes actuales:
-                    
-{ingredientes_actuales}
-
-Sugiere 5-7 ingredientes adicionales que:
-1. Complementen lo que ya está disponible
-2. Permitan muchas más posibilidades de recetas
-3. Sean prácticos y de uso común
-4. Tengan buena vida útil
-
-Para cada sugerencia, explica brevemente (en 1 oración) por qué es útil."""
-                }
-            ],
-            max_tokens=800,
-            stream=True
-        )
-        return stream
+        return pipeline_recetas.sugerir_ingredientes(
+            cliente, ingredientes_actuales, obtener_cache_recetas(), estructurado)
     except Exception as error:
-        st.error(f"Error al sugerir ingredientes: {str(error)}")
+        mostrar_error("sugerencias", "Error al sugerir ingredientes", error)
         return None
 
 # Aplicación principal
@@ -152,6 +129,26 @@ def main():
             if clave_api:
                 os.environ["OPENAI_API_KEY"] = clave_api
         
+        estructurado = st.toggle(
+            "📦 Modo estructurado (JSON)",
+            help="Pide respuestas en JSON compacto y arma el texto localmente: usa menos tokens de salida"
+        )
+        usar_indice = st.toggle(
+            "📚 Usar recetas guardadas",
+            value=True,
+            help="Si ya hay recetas guardadas que puedes hacer con tus ingredientes, se muestran sin consultar a la IA"
+        )
+        anticipar = st.toggle(
+            "⚡ Generación anticipada",
+            value=True,
+            help="Empieza a crear recetas mientras todavía se detectan ingredientes; si la lista final cambia mucho, se vuelven a generar"
+        )
+        umbral_similitud = st.slider(
+            "🔁 Tolerancia para fotos similares",
+            min_value=0, max_value=16, value=UMBRAL_HAMMING,
+            help="Bits distintos (de 64) permitidos para reutilizar el análisis de una foto casi igual"
+        )
+        
         st.markdown("---")
         st.markdown("""
         ### 💡 Consejos
@@ -160,8 +157,11 @@ def main():
         - También puedes subir fotos existentes
         """)
     
-    # Inicializar cliente
-    cliente = obtener_cliente_openai()
+    # Inicializar cliente (el uso de tokens se anota por sesión)
+    contexto = get_script_run_ctx()
+    usuario = f"web-{contexto.session_id[:8]}" if contexto else "web"
+    cliente = ClienteDeUsuario(obtener_cliente_openai(), usuario)
+    obtener_servidor_metricas()
     
     # Cargador de archivos
     st.header("📸 Sube la Foto de tu Refrigerador")
@@ -172,14 +172,16 @@ def main():
     )
     
     if archivo_subido is not None:
-        # Mostrar la imagen subida
-        imagen = Image.open(archivo_subido)
+        # Crear un identificador único para esta imagen a partir de su contenido
+        datos_imagen = archivo_subido.getvalue()
+        id_imagen = hashlib.sha256(datos_imagen).hexdigest()
         
+        # Mostrar la imagen subida
         st.subheader("📸 Tu Imagen")
-        st.image(imagen, use_column_width=True)
+        st.image(obtener_miniatura(id_imagen, datos_imagen), use_column_width=True)
         
-        # Crear un identificador único para esta imagen
-        id_imagen = hash(archivo_subido.name + str(archivo_subido.size))
+        # Generación de recetas lanzada antes de terminar de detectar ingredientes
+        especulacion = None
         
         # Verificar si ya procesamos esta imagen
         if 'id_imagen_procesada' not in st.session_state or st.session_state.id_imagen_procesada != id_imagen:
@@ -188,55 +190,112 @@ def main():
             st.session_state.ingredientes = ""
             st.session_state.recetas = ""
             st.session_state.sugerencias = ""
+            # Entradas con las que se generó cada etapa (para regenerar solo lo que cambió)
+            st.session_state.claves_etapas = {}
+            st.session_state.distancia_reutilizada = None
+            forzar = st.session_state.pop('forzar_analisis', False)
+            
+            # La foto completa solo se decodifica aquí, cuando hay que analizarla
+            with medir("ingredientes", "decodificacion"):
+                imagen = Image.open(archivo_subido)
+                imagen.load()
             
             # PASO 1: Analizar ingredientes
             st.markdown("---")
             st.header("🔍 Analizando Ingredientes...")
-            contenedor_ingredientes = st.empty()
-            texto_completo_ingredientes = ""
+            renderizador_ingredientes = RenderizadorStream(st.empty())
             
-            stream_ingredientes = analizar_imagen_para_ingredientes(cliente, imagen)
+            desde_cache = []
+            stream_ingredientes = analizar_imagen_para_ingredientes(
+                cliente, imagen, estructurado, umbral_similitud, forzar,
+                al_usar_cache=lambda: desde_cache.append(True))
+            # Si la lista sale de la cache llega completa de una vez: no hay nada que adelantar
+            if anticipar and not estructurado and not desde_cache:
+                especulacion = GeneracionEspeculativa(
+                    lambda texto: generar_recetas(cliente, texto, estructurado, usar_indice),
+                    preparar_hilo=add_script_run_ctx
+                )
             if stream_ingredientes:
-                for chunk in stream_ingredientes:
-                    if chunk.choices[0].delta.content:
-                        texto_completo_ingredientes += chunk.choices[0].delta.content
-                        contenedor_ingredientes.markdown(texto_completo_ingredientes)
-                
-                st.session_state.ingredientes = texto_completo_ingredientes
-                st.success("✅ ¡Ingredientes identificados!")
+                try:
+                    for fragmento in stream_ingredientes:
+                        renderizador_ingredientes.agregar(fragmento)
+                        if especulacion:
+                            especulacion.agregar(fragmento)
+                except Exception as error:
+                    # Stream cortado o JSON inválido en modo estructurado, como en las otras etapas
+                    mostrar_error("ingredientes", "Error al analizar imagen", error)
+                    if especulacion:
+                        especulacion.cancelar()
+                else:
+                    st.session_state.ingredientes = renderizador_ingredientes.finalizar()
+                    st.success("✅ ¡Ingredientes identificados!")
+            elif especulacion:
+                especulacion.cancelar()
+        
+        # PASO 2 y 3: Generar en paralelo solo las etapas cuyas entradas cambiaron
+        if st.session_state.get('ingredientes'):
+            ingredientes = st.session_state.ingredientes
+            claves = {
+                "recetas": pipeline_recetas.clave_recetas(ingredientes, estructurado),
+                "sugerencias": pipeline_recetas.clave_sugerencias(ingredientes, estructurado)
+            }
+            claves_etapas = st.session_state.setdefault('claves_etapas', {})
+            pendientes = [nombre for nombre, clave in claves.items() if claves_etapas.get(nombre) != clave]
+            
+            if not pendientes and st.session_state.pop('regeneracion_pedida', False):
+                st.info("ℹ️ La lista de ingredientes no cambió; se conservan las recetas y sugerencias actuales.")
             
-            # PASO 2: Generar recetas
-            if st.session_state.ingredientes:
+            renderizadores = {}
+            estados = {}
+            if "recetas" in pendientes:
                 st.markdown("---")
                 st.header("👨‍🍳 Generando Recetas...")
-                contenedor_recetas = st.empty()
-                texto_completo_recetas = ""
-                
-                stream_recetas = generar_recetas(cliente, st.session_state.ingredientes)
-                if stream_recetas:
-                    for chunk in stream_recetas:
-                        if chunk.choices[0].delta.content:
-                            texto_completo_recetas += chunk.choices[0].delta.content
-                            contenedor_recetas.markdown(texto_completo_recetas)
-                    
-                    st.session_state.recetas = texto_completo_recetas
-                    st.success("✅ ¡Recetas creadas!")
-                
-                # PASO 3: Sugerir ingredientes adicionales
+                renderizadores["recetas"] = RenderizadorStream(st.empty())
+                estados["recetas"] = st.empty()
+            
+            if "sugerencias" in pendientes:
                 st.markdown("---")
                 st.header("🛒 Sugiriendo Ingredientes para Comprar...")
-                contenedor_sugerencias = st.empty()
-                texto_completo_sugerencias = ""
-                
-                stream_sugerencias = sugerir_ingredientes_adicionales(cliente, st.session_state.ingredientes)
-                if stream_sugerencias:
-                    for chunk in stream_sugerencias:
-                        if chunk.choices[0].delta.content:
-                            texto_completo_sugerencias += chunk.choices[0].delta.content
-                            contenedor_sugerencias.markdown(texto_completo_sugerencias)
-                    
-                    st.session_state.sugerencias = texto_completo_sugerencias
-                    st.success("✅ ¡Sugerencias listas!")
+                renderizadores["sugerencias"] = RenderizadorStream(st.empty())
+                estados["sugerencias"] = st.empty()
+            
+            if especulacion and especulacion.iniciada:
+                # Reutilizar las recetas que ya se están generando si la lista final es parecida
+                generar = lambda: pipeline_recetas.reconciliar_recetas(
+                    especulacion, ingredientes, obtener_cache_recetas())
+            else:
+                generar = lambda: generar_recetas(cliente, ingredientes, estructurado, usar_indice)
+            fabricas = {
+                "recetas": generar,
+                "sugerencias": lambda: sugerir_ingredientes_adicionales(cliente, ingredientes, estructurado)
+            }
+            fabricas = {nombre: fabricas[nombre] for nombre in pendientes}
+            for nombre, fragmento in multiplexar_streams(fabricas, preparar_hilo=add_script_run_ctx):
+                if isinstance(fragmento, Exception):
+                    mostrar_error(nombre, "Error durante la generación", fragmento)
+                    continue
+                renderizadores[nombre].agregar(fragmento)
+            
+            mensajes = {"recetas": "✅ ¡Recetas creadas!", "sugerencias": "✅ ¡Sugerencias listas!"}
+            st.session_state.pop('regeneracion_pedida', None)
+            for nombre, renderizador in renderizadores.items():
+                # Se recuerda el intento aunque falle, para no repetirlo en cada interacción
+                claves_etapas[nombre] = claves[nombre]
+                texto = renderizador.finalizar()
+                st.session_state[nombre] = texto
+                if texto:
+                    estados[nombre].success(mensajes[nombre])
+        
+        # Avisar si se reutilizó el análisis de una foto casi igual
+        if st.session_state.get('distancia_reutilizada') is not None:
+            st.info(
+                f"🔁 Esta foto es muy parecida a una ya analizada "
+                f"({st.session_state.distancia_reutilizada} bits de diferencia); se reutilizaron sus ingredientes."
+            )
+            if st.button("🔄 Forzar nuevo análisis"):
+                st.session_state.forzar_analisis = True
+                st.session_state.id_imagen_procesada = None
+                st.rerun()
         
         # Mostrar resultados guardados
         if st.session_state.get('ingredientes'):
@@ -252,10 +311,13 @@ def main():
                     height=150
                 )
                 if st.button("Actualizar y Regenerar Todo"):
+                    # La foto no cambió: no se repite el análisis de visión, solo las etapas
+                    # cuyo conjunto de ingredientes normalizado cambió (y las que fallaron)
                     st.session_state.ingredientes = ingredientes_editados
-                    # Limpiar el ID para forzar regeneración
-                    st.session_state.id_imagen_procesada = None
-                    st.success("✅ ¡Regenerando con ingredientes actualizados!")
+                    st.session_state.regeneracion_pedida = True
+                    for etapa in ("recetas", "sugerencias"):
+                        if not st.session_state.get(etapa):
+                            st.session_state.claves_etapas.pop(etapa, None)
                     st.rerun()
         
         if st.session_state.get('recetas'):
@@ -1,17 +1,22 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
-import json
+import importlib
 import os
-from datetime import datetime, date, timedelta
-from openai import OpenAI
+import queue
+from datetime import datetime, date
+from functools import partial
 from dotenv import load_dotenv
-import base64
-from io import BytesIO
 import threading
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+import time
+from almacen_estudiante import RUTA_DATOS_JSON, AlmacenDiferido, AlmacenEstudiante, formatear_numero
+from cache_vision import CacheVision, calcular_clave_imagen
+from indice_recetas import IndiceRecetas, componer_texto, nombres_recetas
+from ingredientes import conjunto_canonico
+from metricas import iniciar_servidor_metricas, medir, medir_stream, registro
+from preprocesamiento import preparar_imagen, url_datos
+from streaming import extraer_texto
+from tareas_escritorio import EjecutorTareas, TareaCancelada
 
 # Cargar variables de entorno
 load_dotenv()
@@ -20,6 +25,27 @@ load_dotenv()
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
+# Módulos pesados (openai ~0.5 s, matplotlib ~0.4 s, numpy) que no hacen falta para
+# pintar el login: se importan donde se usan y se precargan en segundo plano
+# mientras el usuario escribe su nombre
+MODULOS_DIFERIDOS = ("pasarela_llm", "graficas_dashboard", "serie_diaria")
+
+# Ventana de los promedios que acompañan a cada vista del dashboard
+PERIODOS_DASHBOARD = {
+    "Semana": ("semana", 7, "📅 Tu Semana Completa"),
+    "Mes": ("mes", 30, "🗓️ Tus Últimas 5 Semanas"),
+    "Año": ("anio", 365, "📆 Tu Último Año"),
+}
+# Cada cuánto el hilo de Tk vuelca lo que llega de las tareas (~20 cuadros por segundo)
+INTERVALO_DRENADO_MS = 50
+
+UNIDADES = {"sueno": "h", "agua": " vasos", "ejercicio": " min", "estudio": "h", "estres": "/10"}
+
+PROMPT_INGREDIENTES = "Analiza esta imagen y lista todos los ingredientes que veas. Solo nombres, en formato de lista con viñetas."
+# Instrucciones fijas primero y el dato variable al final, para aprovechar la cache de prefijos
+PROMPT_RECETAS = "Sugiere 2-3 recetas fáciles para estudiantes con los ingredientes que te indique. Incluye nombre, ingredientes e instrucciones breves."
+PROMPT_CONSEJO = "Como mentor de estudiantes, da consejos prácticos sobre el tema que te indique. Sé específico, motivador y útil. Máximo 300 palabras."
+
 class AplicacionEstudiante(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -30,23 +56,97 @@ class AplicacionEstudiante(ctk.CTk):
         
         # Variables
         self.nombre_usuario = None
-        self.datos_usuario = self.cargar_datos()
+        # Con la escritura fuera del hilo de la interfaz se puede pagar el fsync de cada commit
+        almacen = AlmacenEstudiante(sincronizacion="FULL")
+        # Importar una sola vez los datos del archivo JSON anterior
+        almacen.migrar_json(RUTA_DATOS_JSON)
+        # Las escrituras se hacen en segundo plano para no congelar la ventana; el hilo
+        # de escritura no toca Tk: deja cada aviso en una cola que vacía drenar_tareas
+        self.avisos_guardado = queue.Queue()
+        self.almacen = AlmacenDiferido(
+            almacen,
+            al_confirmar=lambda cambios: self.avisos_guardado.put(("confirmado", None)),
+            al_fallar=lambda error: self.avisos_guardado.put(("error", error))
+        )
+        self.label_guardado = None
+        self.label_loading = None
+        self.caja_resultados = None
+        self.caja_respuesta = None
+        self.graficas = None
+        self.serie = None
+        self.periodo_dashboard = "Semana"
+        # Un solo cliente para todas las tareas, creado la primera vez que se usa
         self.cliente_openai = None
+        self.candado_cliente = threading.Lock()
+        # Una tarea vigente por módulo: elegir otra foto o tema descarta la anterior
+        self.tareas = EjecutorTareas()
+        self.cache_vision = CacheVision()
+        self.indice_recetas = IndiceRecetas()
+        self.servidor_metricas = iniciar_servidor_metricas()
+        
+        # Guardar lo pendiente antes de cerrar la ventana
+        self.protocol("WM_DELETE_WINDOW", self.cerrar_aplicacion)
         
         # Mostrar pantalla de login
         self.mostrar_login()
+        
+        # Precargar cuando el login ya se pintó
+        self.after_idle(self.precargar_modulos)
+        
+        # Mostrar lo que envían las tareas (fragmentos, resultados, errores)
+        self.id_drenado = self.after(INTERVALO_DRENADO_MS, self.drenar_tareas)
     
-    def cargar_datos(self):
-        """Cargar datos guardados del usuario"""
-        if os.path.exists("datos_estudiante.json"):
-            with open("datos_estudiante.json", "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
+    def drenar_tareas(self):
+        """Volcar en la interfaz las colas de las tareas y del guardado y programar la siguiente vuelta"""
+        try:
+            self.tareas.drenar()
+            while True:
+                try:
+                    estado, error = self.avisos_guardado.get_nowait()
+                except queue.Empty:
+                    break
+                self.mostrar_estado_guardado(estado, error)
+        finally:
+            self.id_drenado = self.after(INTERVALO_DRENADO_MS, self.drenar_tareas)
+    
+    def precargar_modulos(self):
+        """Importar en segundo plano los módulos que se usan después de iniciar sesión"""
+        def importar():
+            with medir("escritorio_arranque", "precarga"):
+                for nombre in MODULOS_DIFERIDOS:
+                    try:
+                        importlib.import_module(nombre)
+                    except ImportError:
+                        # Se vuelve a intentar (y se muestra el error) al usarlo
+                        registro.contar("escritorio_arranque", "precarga_error")
+        
+        threading.Thread(target=importar, name="precarga", daemon=True).start()
     
-    def guardar_datos(self):
-        """Guardar datos del usuario"""
-        with open("datos_estudiante.json", "w", encoding="utf-8") as f:
-            json.dump(self.datos_usuario, f, indent=2, ensure_ascii=False)
+    def cerrar_aplicacion(self):
+        """Escribir los cambios pendientes y cerrar"""
+        if not self.almacen.vaciar(timeout=5.0):
+            salir = messagebox.askyesno(
+                "Cambios sin guardar",
+                f"No se pudieron guardar {self.almacen.pendientes()} cambios "
+                f"({self.almacen.ultimo_error or 'tiempo agotado'}).\n¿Cerrar de todos modos?"
+            )
+            if not salir:
+                return
+        self.after_cancel(self.id_drenado)
+        self.tareas.cerrar()
+        self.almacen.cerrar(timeout=1.0)
+        self.destroy()
+    
+    def mostrar_estado_guardado(self, estado, error=None):
+        """Indicar en el encabezado si los cambios ya están guardados en disco"""
+        if self.label_guardado is None or not self.label_guardado.winfo_exists():
+            return
+        if estado == "pendiente":
+            self.label_guardado.configure(text="💾 Guardando...", text_color="gray")
+        elif estado == "confirmado" and not self.almacen.pendientes():
+            self.label_guardado.configure(text=f"💾 Guardado {datetime.now().strftime('%H:%M:%S')}", text_color="gray")
+        elif estado == "error":
+            self.label_guardado.configure(text=f"⚠️ Sin guardar, reintentando: {error}", text_color="#ef4444")
     
     def mostrar_login(self):
         """Pantalla de login inicial"""
@@ -112,13 +212,12 @@ class AplicacionEstudiante(ctk.CTk):
         if nombre:
             self.nombre_usuario = nombre
             
-            # Crear datos del usuario si no existen
-            if nombre not in self.datos_usuario:
-                self.datos_usuario[nombre] = {
-                    "registros_diarios": {},
-                    "historial_recetas": []
-                }
-                self.guardar_datos()
+            # Crear el usuario si no existe
+            self.almacen.crear_usuario(nombre)
+            
+            # Todos sus registros en columnas, para los promedios y las vistas por mes y año
+            from serie_diaria import SerieDiaria
+            self.serie = SerieDiaria(self.almacen.registros_entre(nombre, date.min.isoformat(), date.max.isoformat()))
             
             self.mostrar_dashboard()
         else:
@@ -150,6 +249,9 @@ class AplicacionEstudiante(ctk.CTk):
         )
         fecha_label.pack(side="left", padx=10)
         
+        self.label_guardado = ctk.CTkLabel(header_frame, text="", font=ctk.CTkFont(size=12), text_color="gray")
+        self.label_guardado.pack(side="left", padx=10)
+        
         # Botón cerrar sesión
         btn_salir = ctk.CTkButton(
             header_frame,
@@ -274,63 +376,95 @@ class AplicacionEstudiante(ctk.CTk):
             return "#ef4444"  # Rojo
     
     def crear_dashboard(self):
-        """Crear dashboard con gráficas circulares y progreso semanal"""
-        # Limpiar dashboard
-        for widget in self.dashboard_frame.winfo_children():
-            widget.destroy()
-        
-        # Obtener datos de hoy
-        fecha_hoy = date.today().isoformat()
-        datos_hoy = {}
-        
-        if self.nombre_usuario in self.datos_usuario:
-            datos_hoy = self.datos_usuario[self.nombre_usuario]["registros_diarios"].get(fecha_hoy, {})
+        """Crear los widgets del dashboard una sola vez; actualizar_dashboard solo cambia su contenido"""
+        if self.graficas is None:
+            from graficas_dashboard import GraficasDashboard
+            # Las figuras de matplotlib sobreviven a cerrar sesión y volver a entrar
+            self.graficas = GraficasDashboard(convertir=lambda imagen: ctk.CTkImage(imagen, size=imagen.size))
         
         # Si no hay datos de hoy
-        if not datos_hoy:
-            label_sin_datos = ctk.CTkLabel(
-                self.dashboard_frame,
-                text="📝 No hay datos de hoy. ¡Registra tu día para ver tu progreso!",
-                font=ctk.CTkFont(size=18, weight="bold"),
-                text_color="gray"
-            )
-            label_sin_datos.pack(pady=80)
-            return
+        self.label_sin_datos = ctk.CTkLabel(
+            self.dashboard_frame,
+            text="📝 No hay datos de hoy. ¡Registra tu día para ver tu progreso!",
+            font=ctk.CTkFont(size=18, weight="bold"),
+            text_color="gray"
+        )
+        
+        self.contenido_dashboard = ctk.CTkFrame(self.dashboard_frame, fg_color="transparent")
         
         # Título
-        titulo_dash = ctk.CTkLabel(
-            self.dashboard_frame,
-            text=f"📊 Tu Progreso de Hoy - {datetime.now().strftime('%d de %B')}",
+        self.titulo_dashboard = ctk.CTkLabel(
+            self.contenido_dashboard,
+            text="",
             font=ctk.CTkFont(size=20, weight="bold")
         )
-        titulo_dash.pack(pady=(15, 5))
+        self.titulo_dashboard.pack(pady=(15, 5))
+        
+        # Gráficas circulares
+        self.label_donuts = ctk.CTkLabel(self.contenido_dashboard, text="")
+        self.label_donuts.pack(fill="x", padx=20, pady=10)
+        
+        # Frame inferior: Progreso semanal
+        semana_frame = ctk.CTkFrame(self.contenido_dashboard, fg_color="transparent")
+        semana_frame.pack(fill="both", expand=True, padx=20, pady=(5, 10))
+        
+        # Título y selector del periodo
+        encabezado_semana = ctk.CTkFrame(semana_frame, fg_color="transparent")
+        encabezado_semana.pack(fill="x", pady=(5, 5))
+        
+        self.titulo_semana = ctk.CTkLabel(
+            encabezado_semana,
+            text="",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        self.titulo_semana.pack(side="left", padx=10)
         
-        # Frame superior: Gráficas circulares
-        donuts_frame = ctk.CTkFrame(self.dashboard_frame, fg_color="transparent")
-        donuts_frame.pack(fill="x", padx=20, pady=10)
+        selector_periodo = ctk.CTkSegmentedButton(
+            encabezado_semana,
+            values=list(PERIODOS_DASHBOARD),
+            command=self.cambiar_periodo_dashboard
+        )
+        selector_periodo.set(self.periodo_dashboard)
+        selector_periodo.pack(side="right", padx=10)
+        
+        self.label_resumen = ctk.CTkLabel(
+            semana_frame,
+            text="",
+            font=ctk.CTkFont(size=12),
+            text_color="gray",
+            justify="left"
+        )
+        self.label_resumen.pack(side="bottom", pady=(5, 0))
+        
+        self.label_semana = ctk.CTkLabel(semana_frame, text="")
+        
+        self.actualizar_dashboard()
+    
+    def actualizar_dashboard(self):
+        """Actualizar en su lugar las gráficas circulares y el progreso semanal"""
+        # Obtener datos de hoy
+        fecha_hoy = date.today().isoformat()
+        datos_hoy = self.almacen.obtener_registro(self.nombre_usuario, fecha_hoy)
         
-        # Configurar matplotlib
-        plt.style.use('dark_background')
+        if not datos_hoy:
+            self.contenido_dashboard.pack_forget()
+            self.label_sin_datos.pack(pady=80)
+            return
+        self.label_sin_datos.pack_forget()
+        self.contenido_dashboard.pack(fill="both", expand=True)
         
-        # Crear figura con 4 gráficas circulares
-        fig = Figure(figsize=(12, 3), facecolor='#2b2b2b')
+        self.titulo_dashboard.configure(text=f"📊 Tu Progreso de Hoy - {datetime.now().strftime('%d de %B')}")
         
         # Objetivos diarios
-        objetivos = {
-            "sueno": 8,      # 8 horas = 100%
-            "agua": 8,       # 8 vasos = 100%
-            "ejercicio": 30, # 30 min = 100%
-            "estudio": 6,    # 6 horas = 100%
-            "estres": 10     # 10 es máximo (menos es mejor)
-        }
+        from serie_diaria import OBJETIVOS as objetivos
         
         # Obtener valores de hoy
         valores = {
-            "sueno": float(datos_hoy.get("sueno", 0) or 0),
-            "agua": float(datos_hoy.get("agua", 0) or 0),
-            "ejercicio": float(datos_hoy.get("ejercicio", 0) or 0),
-            "estudio": float(datos_hoy.get("estudio", 0) or 0),
-            "estres": int(datos_hoy.get("estres", 5))
+            "sueno": datos_hoy["sueno"] or 0,
+            "agua": datos_hoy["agua"] or 0,
+            "ejercicio": datos_hoy["ejercicio"] or 0,
+            "estudio": datos_hoy["estudio"] or 0,
+            "estres": datos_hoy["estres"] or 5
         }
         
         # Calcular porcentajes
@@ -342,122 +476,50 @@ class AplicacionEstudiante(ctk.CTk):
             "estres": self.calcular_porcentaje_metrica(valores["estres"], objetivos["estres"], es_inverso=True)
         }
         
+        # (porcentaje, valor, color según rendimiento) en el orden de TITULOS_DONUTS
         metricas = [
-            ("💤 Sueño", porcentajes["sueno"], f"{valores['sueno']:.1f}h", "#3b82f6"),
-            ("💧 Agua", porcentajes["agua"], f"{int(valores['agua'])} vasos", "#10b981"),
-            ("🏃 Ejercicio", porcentajes["ejercicio"], f"{int(valores['ejercicio'])} min", "#8b5cf6"),
-            ("📚 Estudio", porcentajes["estudio"], f"{valores['estudio']:.1f}h", "#f59e0b")
+            (porcentajes["sueno"], f"{valores['sueno']:.1f}h"),
+            (porcentajes["agua"], f"{int(valores['agua'])} vasos"),
+            (porcentajes["ejercicio"], f"{int(valores['ejercicio'])} min"),
+            (porcentajes["estudio"], f"{valores['estudio']:.1f}h")
         ]
+        self.label_donuts.configure(image=self.graficas.imagen_donuts(
+            [(porcentaje, valor, self.obtener_color_porcentaje(porcentaje)) for porcentaje, valor in metricas]))
         
-        for i, (titulo, porcentaje, valor, color_base) in enumerate(metricas):
-            ax = fig.add_subplot(1, 4, i + 1)
-            
-            # Color según rendimiento
-            color = self.obtener_color_porcentaje(porcentaje)
-            
-            # Crear donut chart
-            sizes = [porcentaje, 100 - porcentaje]
-            colors = [color, '#1e1e1e']
-            
-            wedges, texts = ax.pie(sizes, colors=colors, startangle=90,
-                                   wedgeprops=dict(width=0.4, edgecolor='#2b2b2b', linewidth=2))
-            
-            # Texto en el centro
-            ax.text(0, 0.15, f'{porcentaje}%', ha='center', va='center',
-                   fontsize=20, fontweight='bold', color='white')
-            ax.text(0, -0.15, valor, ha='center', va='center',
-                   fontsize=10, color='gray')
-            
-            # Título
-            ax.set_title(titulo, fontsize=11, fontweight='bold', pad=10)
-        
-        fig.tight_layout(pad=2)
-        
-        # Incrustar donuts
-        canvas = FigureCanvasTkAgg(fig, donuts_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill="x")
-        
-        # Frame inferior: Progreso semanal
-        semana_frame = ctk.CTkFrame(self.dashboard_frame, fg_color="transparent")
-        semana_frame.pack(fill="both", expand=True, padx=20, pady=(5, 10))
-        
-        # Título semana
-        titulo_semana = ctk.CTkLabel(
-            semana_frame,
-            text="📅 Tu Semana Completa",
-            font=ctk.CTkFont(size=16, weight="bold")
-        )
-        titulo_semana.pack(pady=(5, 5))
-        
-        # Obtener datos de la semana
-        datos_semana = self.obtener_datos_semana()
-        
-        if datos_semana["fechas"]:
-            # Crear gráfica de barras para la semana
-            fig2 = Figure(figsize=(11, 2.5), facecolor='#2b2b2b')
-            ax = fig2.add_subplot(111)
-            
-            # Preparar datos
-            dias = datos_semana["fechas_cortas"]
-            x = range(len(dias))
-            width = 0.2
-            
-            # Crear barras para cada métrica
-            ax.bar([i - 1.5*width for i in x], datos_semana["sueno"], width, 
-                  label='💤 Sueño', color='#3b82f6', alpha=0.8)
-            ax.bar([i - 0.5*width for i in x], datos_semana["agua"], width,
-                  label='💧 Agua', color='#10b981', alpha=0.8)
-            ax.bar([i + 0.5*width for i in x], [e/2 for e in datos_semana["estres"]], width,
-                  label='😰 Estrés', color='#ef4444', alpha=0.8)
-            ax.bar([i + 1.5*width for i in x], datos_semana["estudio"], width,
-                  label='📚 Estudio', color='#f59e0b', alpha=0.8)
-            
-            ax.set_xticks(x)
-            ax.set_xticklabels(dias)
-            ax.legend(loc='upper left', fontsize=9, ncol=4)
-            ax.set_ylabel('Valores', fontsize=10)
-            ax.grid(True, alpha=0.2, axis='y')
-            ax.set_ylim(0, 12)
-            
-            fig2.tight_layout()
-            
-            canvas2 = FigureCanvasTkAgg(fig2, semana_frame)
-            canvas2.draw()
-            canvas2.get_tk_widget().pack(fill="both", expand=True)
-    
-    def obtener_datos_semana(self):
-        """Obtener datos de los últimos 7 días"""
-        datos = {
-            "fechas": [],
-            "fechas_cortas": [],
-            "sueno": [],
-            "agua": [],
-            "estres": [],
-            "estudio": []
-        }
+        self.actualizar_periodo_dashboard()
+    
+    def cambiar_periodo_dashboard(self, periodo):
+        """Cambiar entre la vista de semana, mes y año"""
+        self.periodo_dashboard = periodo
+        self.actualizar_periodo_dashboard()
+    
+    def actualizar_periodo_dashboard(self):
+        """Actualizar las barras y los promedios del periodo elegido"""
+        periodo, ventana, titulo = PERIODOS_DASHBOARD[self.periodo_dashboard]
+        self.titulo_semana.configure(text=titulo)
+        
+        datos_periodo = self.serie.agrupar(periodo)
+        if datos_periodo["fechas"]:
+            self.label_semana.configure(image=self.graficas.imagen_periodo(datos_periodo))
+            self.label_semana.pack(fill="both", expand=True)
+        else:
+            self.label_semana.pack_forget()
         
-        # Últimos 7 días
-        hoy = date.today()
-        for i in range(6, -1, -1):
-            fecha = hoy - timedelta(days=i)
-            fecha_str = fecha.isoformat()
-            
-            if self.nombre_usuario in self.datos_usuario:
-                registro = self.datos_usuario[self.nombre_usuario]["registros_diarios"].get(fecha_str, {})
-                
-                if registro:  # Solo agregar si hay datos
-                    datos["fechas"].append(fecha)
-                    # Formato corto: Lun, Mar, etc.
-                    dias_semana = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
-                    datos["fechas_cortas"].append(dias_semana[fecha.weekday()])
-                    
-                    datos["sueno"].append(float(registro.get("sueno", 0) or 0))
-                    datos["agua"].append(float(registro.get("agua", 0) or 0))
-                    datos["estres"].append(int(registro.get("estres", 5)))
-                    datos["estudio"].append(float(registro.get("estudio", 0) or 0))
-        
-        return datos
+        self.label_resumen.configure(text=self.texto_resumen(ventana))
+    
+    def texto_resumen(self, ventana):
+        """Promedio, cumplimiento de la meta y racha de cada métrica en la ventana"""
+        promedios = self.serie.promedios(ventana)
+        cumplimiento = self.serie.tasas_cumplimiento(ventana)
+        partes = []
+        for campo, titulo in (("sueno", "💤"), ("agua", "💧"), ("ejercicio", "🏃"), ("estudio", "📚"), ("estres", "😰")):
+            if promedios[campo] is None:
+                continue
+            partes.append(
+                f"{titulo} {promedios[campo]:.1f}{UNIDADES[campo]} · meta {cumplimiento[campo]:.0%}"
+                f" · racha {self.serie.racha(campo)}"
+            )
+        return f"Últimos {ventana} días:   " + "     ".join(partes) if partes else ""
     
     def abrir_modulo_registro(self):
         """Módulo de registro diario"""
@@ -478,7 +540,7 @@ class AplicacionEstudiante(ctk.CTk):
         titulo.pack(pady=20)
         
         fecha_hoy = date.today().isoformat()
-        datos_hoy = self.datos_usuario[self.nombre_usuario]["registros_diarios"].get(fecha_hoy, {})
+        datos_hoy = self.almacen.obtener_registro(self.nombre_usuario, fecha_hoy)
         
         # Horas de sueño
         label_sueno = ctk.CTkLabel(scroll_frame, text="💤 Horas de Sueño:", font=ctk.CTkFont(size=16))
@@ -491,7 +553,7 @@ class AplicacionEstudiante(ctk.CTk):
             height=40
         )
         entry_sueno.pack(pady=5)
-        entry_sueno.insert(0, datos_hoy.get("sueno", ""))
+        entry_sueno.insert(0, formatear_numero(datos_hoy.get("sueno")))
         
         # Comidas del día
         label_comidas = ctk.CTkLabel(scroll_frame, text="🍽️ Comidas del Día:", font=ctk.CTkFont(size=16))
@@ -512,7 +574,7 @@ class AplicacionEstudiante(ctk.CTk):
             height=40
         )
         entry_agua.pack(pady=5)
-        entry_agua.insert(0, datos_hoy.get("agua", ""))
+        entry_agua.insert(0, formatear_numero(datos_hoy.get("agua")))
         
         # Ejercicio
         label_ejercicio = ctk.CTkLabel(scroll_frame, text="🏃 Ejercicio (minutos):", font=ctk.CTkFont(size=16))
@@ -525,7 +587,7 @@ class AplicacionEstudiante(ctk.CTk):
             height=40
         )
         entry_ejercicio.pack(pady=5)
-        entry_ejercicio.insert(0, datos_hoy.get("ejercicio", ""))
+        entry_ejercicio.insert(0, formatear_numero(datos_hoy.get("ejercicio")))
         
         # Nivel de estrés
         label_estres = ctk.CTkLabel(scroll_frame, text="😰 Nivel de Estrés (1-10):", font=ctk.CTkFont(size=16))
@@ -533,7 +595,7 @@ class AplicacionEstudiante(ctk.CTk):
         
         slider_estres = ctk.CTkSlider(scroll_frame, from_=1, to=10, width=400, number_of_steps=9)
         slider_estres.pack(pady=5)
-        slider_estres.set(datos_hoy.get("estres", 5))
+        slider_estres.set(datos_hoy.get("estres") or 5)
         
         valor_estres = ctk.CTkLabel(scroll_frame, text=f"{int(slider_estres.get())}", font=ctk.CTkFont(size=14))
         valor_estres.pack()
@@ -554,7 +616,7 @@ class AplicacionEstudiante(ctk.CTk):
             height=40
         )
         entry_estudio.pack(pady=5)
-        entry_estudio.insert(0, datos_hoy.get("estudio", ""))
+        entry_estudio.insert(0, formatear_numero(datos_hoy.get("estudio")))
         
         # Notas adicionales
         label_notas = ctk.CTkLabel(scroll_frame, text="📝 Notas del Día:", font=ctk.CTkFont(size=16))
@@ -566,19 +628,25 @@ class AplicacionEstudiante(ctk.CTk):
         
         # Botón guardar
         def guardar_registro():
-            self.datos_usuario[self.nombre_usuario]["registros_diarios"][fecha_hoy] = {
-                "sueno": entry_sueno.get(),
-                "comidas": entry_comidas.get("1.0", "end-1c"),
-                "agua": entry_agua.get(),
-                "ejercicio": entry_ejercicio.get(),
-                "estres": int(slider_estres.get()),
-                "estudio": entry_estudio.get(),
-                "notas": entry_notas.get("1.0", "end-1c")
-            }
-            self.guardar_datos()
+            try:
+                normalizado = self.almacen.guardar_registro(self.nombre_usuario, fecha_hoy, {
+                    "sueno": entry_sueno.get(),
+                    "comidas": entry_comidas.get("1.0", "end-1c"),
+                    "agua": entry_agua.get(),
+                    "ejercicio": entry_ejercicio.get(),
+                    "estres": int(slider_estres.get()),
+                    "estudio": entry_estudio.get(),
+                    "notas": entry_notas.get("1.0", "end-1c")
+                })
+            except ValueError as e:
+                messagebox.showwarning("Dato inválido", str(e), parent=ventana)
+                return
+            self.mostrar_estado_guardado("pendiente")
+            # Solo se ajustan los acumulados desde hoy
+            self.serie.actualizar(fecha_hoy, normalizado)
             
             # Actualizar dashboard
-            self.crear_dashboard()
+            self.actualizar_dashboard()
             
             # Cerrar ventana
             ventana.destroy()
@@ -600,6 +668,9 @@ class AplicacionEstudiante(ctk.CTk):
         ventana = ctk.CTkToplevel(self)
         ventana.title("🍳 Generador de Recetas")
         ventana.geometry("900x800")
+        # Un análisis de una ventana anterior ya no tiene dónde mostrarse
+        self.tareas.cancelar("recetas")
+        ventana.protocol("WM_DELETE_WINDOW", lambda: self.cerrar_modulo(ventana, "recetas"))
         
         # Frame principal con scroll
         scroll_frame = ctk.CTkScrollableFrame(ventana)
@@ -613,8 +684,6 @@ class AplicacionEstudiante(ctk.CTk):
         )
         titulo.pack(pady=20)
         
-        # Variable para imagen
-        self.imagen_seleccionada = None
         self.label_imagen = None
         
         # Botón subir imagen
@@ -646,6 +715,8 @@ class AplicacionEstudiante(ctk.CTk):
         if archivo:
             # Mostrar imagen
             imagen = Image.open(archivo)
+            # Vista previa con decodificación reducida (modo draft de JPEG)
+            imagen.draft("RGB", (400, 400))
             imagen.thumbnail((400, 400))
             photo = ctk.CTkImage(imagen, size=(400, 400))
             
@@ -656,120 +727,200 @@ class AplicacionEstudiante(ctk.CTk):
             label_img.image = photo
             label_img.pack()
             
-            self.imagen_seleccionada = Image.open(archivo)
-            
-            # Analizar automáticamente
-            threading.Thread(target=self.analizar_imagen_threading, daemon=True).start()
-    
-    def analizar_imagen_threading(self):
-        """Analizar imagen en thread separado"""
-        if not self.cliente_openai:
-            clave_api = os.getenv("OPENAI_API_KEY")
-            if not clave_api:
-                self.after(0, lambda: messagebox.showerror(
-                    "Error",
-                    "Por favor configura tu OPENAI_API_KEY en el archivo .env"
-                ))
+            if not self.verificar_clave_api():
                 return
-            self.cliente_openai = OpenAI(api_key=clave_api)
-        
-        # Limpiar resultados previos
-        self.after(0, lambda: self.limpiar_resultados())
-        
-        # Mostrar loading
-        self.after(0, lambda: self.mostrar_loading("Analizando ingredientes..."))
-        
-        # Analizar
-        ingredientes = self.analizar_imagen_openai(self.imagen_seleccionada)
-        
-        if ingredientes:
-            self.after(0, lambda: self.mostrar_resultados("🥗 Ingredientes Detectados", ingredientes))
             
-            # Generar recetas
-            self.after(0, lambda: self.mostrar_loading("Generando recetas deliciosas..."))
-            recetas = self.generar_recetas_openai(ingredientes)
+            self.limpiar_resultados()
+            self.mostrar_loading("Analizando ingredientes...")
+            
+            # Analizar automáticamente; la imagen va con la tarea, no en un atributo compartido
+            self.tareas.lanzar("recetas", self.analizar_imagen_threading, Image.open(archivo))
+    
+    def verificar_clave_api(self):
+        """Avisar si falta la clave antes de lanzar una tarea"""
+        if os.getenv("OPENAI_API_KEY"):
+            return True
+        messagebox.showerror(
+            "Error",
+            "Por favor configura tu OPENAI_API_KEY en el archivo .env"
+        )
+        return False
+    
+    def obtener_cliente(self):
+        """Cliente de OpenAI compartido por todas las tareas, creado una sola vez"""
+        with self.candado_cliente:
+            if self.cliente_openai is None:
+                from pasarela_llm import crear_pasarela
+                self.cliente_openai = crear_pasarela(os.getenv("OPENAI_API_KEY"))
+            return self.cliente_openai
+    
+    def cerrar_modulo(self, ventana, canal):
+        """Cerrar la ventana de un módulo descartando su tarea en curso"""
+        self.tareas.cancelar(canal)
+        ventana.destroy()
+    
+    def analizar_imagen_threading(self, token, imagen):
+        """Analizar imagen y generar recetas en un hilo del ejecutor"""
+        try:
+            ingredientes = self.analizar_imagen_openai(token, imagen)
             
-            if recetas:
-                self.after(0, lambda: self.mostrar_resultados("📖 Tus Recetas", recetas))
+            if ingredientes:
+                # Si ya se eligió otra foto no se piden recetas para esta
+                token.verificar()
+                self.tareas.publicar(token, self.mostrar_loading, "Generando recetas deliciosas...")
+                self.generar_recetas_openai(token, ingredientes)
+        finally:
+            # Sin texto o con error no debe quedar el mensaje de carga
+            self.tareas.publicar(token, self.quitar_loading)
     
-    def analizar_imagen_openai(self, imagen):
-        """Analizar imagen con OpenAI"""
+    def analizar_imagen_openai(self, token, imagen):
+        """Analizar imagen con OpenAI mostrando los ingredientes a medida que llegan"""
+        from pasarela_llm import modelo_etapa
+        titulo = "🥗 Ingredientes Detectados"
+        modelo = modelo_etapa("escritorio_ingredientes")
+        clave = calcular_clave_imagen(imagen, PROMPT_INGREDIENTES, modelo)
+        texto_guardado = self.cache_vision.obtener(clave)
+        if texto_guardado is not None:
+            registro.contar("escritorio_ingredientes", "cache_acierto")
+            self.tareas.publicar(token, self.escribir_resultado, titulo, texto_guardado)
+            return texto_guardado
+        
         try:
-            buffer = BytesIO()
-            imagen.save(buffer, format="PNG")
-            imagen_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            with medir("escritorio_ingredientes", "codificacion") as atributos:
+                imagen_preparada = preparar_imagen(imagen)
+                atributos["bytes"] = imagen_preparada.bytes_codificados
             
-            respuesta = self.cliente_openai.chat.completions.create(
-                model="gpt-4o",
+            inicio = time.perf_counter()
+            stream = self.obtener_cliente().chat.completions.create(
+                etapa="escritorio_ingredientes",
+                usuario=self.nombre_usuario,
+                stream=True,
                 messages=[{
                     "role": "user",
                     "content": [{
                         "type": "text",
-                        "text": "Analiza esta imagen y lista todos los ingredientes que veas. Solo nombres, en formato de lista con viñetas."
+                        "text": PROMPT_INGREDIENTES
                     }, {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{imagen_base64}"}
+                        "image_url": {"url": url_datos(imagen_preparada)}
                     }]
-                }],
-                max_tokens=500
+                }]
             )
-            return respuesta.choices[0].message.content
+            contenido = self.tareas.transmitir(
+                token, medir_stream("escritorio_ingredientes", extraer_texto(stream), inicio),
+                partial(self.escribir_resultado, titulo))
+            if contenido:
+                self.cache_vision.guardar(clave, contenido, modelo)
+            return contenido
+        except TareaCancelada:
+            raise
         except Exception as e:
-            self.after(0, lambda: messagebox.showerror("Error", f"Error al analizar: {str(e)}"))
+            registro.contar("escritorio_ingredientes", "error")
+            self.tareas.publicar(token, messagebox.showerror, "Error", f"Error al analizar: {str(e)}")
             return None
     
-    def generar_recetas_openai(self, ingredientes):
-        """Generar recetas con OpenAI"""
+    def generar_recetas_openai(self, token, ingredientes):
+        """Generar recetas con OpenAI en streaming (o desde las recetas ya guardadas)"""
+        titulo = "📖 Tus Recetas"
+        elegidas = self.indice_recetas.buscar(ingredientes, minimo_recetas=2)
+        if elegidas:
+            registro.contar("escritorio_recetas", "indice_acierto")
+            recetas = componer_texto(elegidas)
+            self.tareas.publicar(token, self.escribir_resultado, titulo, recetas)
+            self.tareas.publicar(token, self.registrar_historial_recetas, ingredientes, recetas, "guardadas")
+            return recetas
+        
         try:
-            respuesta = self.cliente_openai.chat.completions.create(
-                model="gpt-4o",
+            inicio = time.perf_counter()
+            stream = self.obtener_cliente().chat.completions.create(
+                etapa="escritorio_recetas",
+                usuario=self.nombre_usuario,
+                stream=True,
                 messages=[{
+                    "role": "system",
+                    "content": PROMPT_RECETAS
+                }, {
                     "role": "user",
-                    "content": f"Con estos ingredientes: {ingredientes}\n\nSugiere 2-3 recetas fáciles para estudiantes. Incluye nombre, ingredientes e instrucciones breves."
-                }],
-                max_tokens=1000
+                    "content": f"Ingredientes: {ingredientes}"
+                }]
             )
-            return respuesta.choices[0].message.content
+            contenido = self.tareas.transmitir(
+                token, medir_stream("escritorio_recetas", extraer_texto(stream), inicio),
+                partial(self.escribir_resultado, titulo))
+            if contenido:
+                self.indice_recetas.agregar_texto(contenido)
+                # Al historial solo va lo que se llega a mostrar
+                self.tareas.publicar(token, self.registrar_historial_recetas, ingredientes, contenido, "ia")
+            return contenido
+        except TareaCancelada:
+            raise
         except Exception as e:
+            registro.contar("escritorio_recetas", "error")
+            self.tareas.publicar(token, messagebox.showerror, "Error", f"Error al generar recetas: {str(e)}")
             return None
     
+    def registrar_historial_recetas(self, ingredientes, recetas, origen):
+        """Guardar en el historial del usuario las recetas que se le mostraron"""
+        self.almacen.agregar_historial(
+            self.nombre_usuario, list(conjunto_canonico(ingredientes)), nombres_recetas(recetas), origen)
+    
     def limpiar_resultados(self):
         """Limpiar frame de resultados"""
         for widget in self.frame_resultados.winfo_children():
             widget.destroy()
+        self.label_loading = None
+        self.caja_resultados = None
     
     def mostrar_loading(self, texto):
-        """Mostrar mensaje de loading"""
-        self.limpiar_resultados()
-        label = ctk.CTkLabel(
+        """Mostrar mensaje de loading debajo de los resultados que ya hay"""
+        self.quitar_loading()
+        self.label_loading = ctk.CTkLabel(
             self.frame_resultados,
             text=texto,
             font=ctk.CTkFont(size=16),
             text_color="gray"
         )
-        label.pack(pady=20)
+        self.label_loading.pack(pady=20)
     
-    def mostrar_resultados(self, titulo, contenido):
-        """Mostrar resultados en el frame"""
-        # Título
-        label_titulo = ctk.CTkLabel(
-            self.frame_resultados,
-            text=titulo,
-            font=ctk.CTkFont(size=20, weight="bold")
-        )
-        label_titulo.pack(pady=(20, 10))
-        
-        # Contenido
-        textbox = ctk.CTkTextbox(self.frame_resultados, width=700, height=200)
-        textbox.pack(pady=10)
-        textbox.insert("1.0", contenido)
+    def quitar_loading(self):
+        """Quitar el mensaje de loading si sigue visible"""
+        if self.label_loading is not None and self.label_loading.winfo_exists():
+            self.label_loading.destroy()
+        self.label_loading = None
+    
+    def escribir_resultado(self, titulo, texto):
+        """Agregar texto a la caja de `titulo`; la caja se crea al llegar el primer fragmento"""
+        if self.caja_resultados is None or self.caja_resultados[0] != titulo:
+            self.quitar_loading()
+            
+            # Título
+            label_titulo = ctk.CTkLabel(
+                self.frame_resultados,
+                text=titulo,
+                font=ctk.CTkFont(size=20, weight="bold")
+            )
+            label_titulo.pack(pady=(20, 10))
+            
+            # Contenido
+            textbox = ctk.CTkTextbox(self.frame_resultados, width=700, height=200)
+            textbox.pack(pady=10)
+            self.caja_resultados = (titulo, textbox)
+        self.agregar_al_final(self.caja_resultados[1], texto)
+    
+    def agregar_al_final(self, textbox, texto):
+        """Insertar en una caja de solo lectura y desplazarla hasta el final"""
+        textbox.configure(state="normal")
+        textbox.insert("end", texto)
         textbox.configure(state="disabled")
+        textbox.see("end")
     
     def abrir_modulo_asistente(self):
         """Módulo de asistente de estudio"""
         ventana = ctk.CTkToplevel(self)
         ventana.title("🧠 Asistente de Estudio")
         ventana.geometry("900x700")
+        self.tareas.cancelar("consejo")
+        ventana.protocol("WM_DELETE_WINDOW", lambda: self.cerrar_modulo(ventana, "consejo"))
         
         # Frame principal con scroll
         scroll_frame = ctk.CTkScrollableFrame(ventana)
@@ -852,37 +1003,43 @@ class AplicacionEstudiante(ctk.CTk):
     
     def obtener_consejo(self, tema, parent):
         """Obtener consejo de IA"""
-        threading.Thread(target=lambda: self.obtener_consejo_threading(tema), daemon=True).start()
-    
-    def obtener_consejo_threading(self, tema):
-        """Obtener consejo en thread separado"""
-        if not self.cliente_openai:
-            clave_api = os.getenv("OPENAI_API_KEY")
-            if not clave_api:
-                self.after(0, lambda: messagebox.showerror(
-                    "Error",
-                    "Por favor configura tu OPENAI_API_KEY en el archivo .env"
-                ))
-                return
-            self.cliente_openai = OpenAI(api_key=clave_api)
+        if not self.verificar_clave_api():
+            return
         
         # Limpiar respuesta previa
-        self.after(0, lambda: self.limpiar_respuesta())
-        self.after(0, lambda: self.mostrar_loading_respuesta())
+        self.limpiar_respuesta()
+        self.mostrar_loading_respuesta()
         
+        # Otro tema pedido antes de que llegue la respuesta reemplaza al anterior
+        self.tareas.lanzar(
+            "consejo", self.obtener_consejo_threading, tema,
+            al_terminar=self.terminar_respuesta,
+            al_fallar=lambda e: messagebox.showerror("Error", f"Error: {str(e)}")
+        )
+    
+    def obtener_consejo_threading(self, token, tema):
+        """Obtener consejo en un hilo del ejecutor, mostrándolo a medida que llega"""
         try:
-            respuesta = self.cliente_openai.chat.completions.create(
-                model="gpt-4o",
+            inicio = time.perf_counter()
+            stream = self.obtener_cliente().chat.completions.create(
+                etapa="escritorio_consejo",
+                usuario=self.nombre_usuario,
+                stream=True,
                 messages=[{
+                    "role": "system",
+                    "content": PROMPT_CONSEJO
+                }, {
                     "role": "user",
-                    "content": f"Como mentor de estudiantes, dame consejos prácticos sobre: {tema}. Sé específico, motivador y útil. Máximo 300 palabras."
-                }],
-                max_tokens=500
+                    "content": f"Tema: {tema}"
+                }]
             )
-            contenido = respuesta.choices[0].message.content
-            self.after(0, lambda: self.mostrar_respuesta(contenido))
-        except Exception as e:
-            self.after(0, lambda: messagebox.showerror("Error", f"Error: {str(e)}"))
+            return self.tareas.transmitir(
+                token, medir_stream("escritorio_consejo", extraer_texto(stream), inicio), self.escribir_respuesta)
+        except TareaCancelada:
+            raise
+        except Exception:
+            registro.contar("escritorio_consejo", "error")
+            raise
     
     def pregunta_personalizada(self, parent):
         """Ventana para pregunta personalizada"""
@@ -899,6 +1056,7 @@ class AplicacionEstudiante(ctk.CTk):
         """Limpiar frame de respuesta"""
         for widget in self.frame_respuesta.winfo_children():
             widget.destroy()
+        self.caja_respuesta = None
     
     def mostrar_loading_respuesta(self):
         """Mostrar loading en respuesta"""
@@ -910,14 +1068,18 @@ class AplicacionEstudiante(ctk.CTk):
         )
         label.pack(pady=20)
     
-    def mostrar_respuesta(self, contenido):
-        """Mostrar respuesta de IA"""
-        self.limpiar_respuesta()
-        
-        textbox = ctk.CTkTextbox(self.frame_respuesta, width=700, height=300)
-        textbox.pack(pady=20, padx=20, fill="both", expand=True)
-        textbox.insert("1.0", contenido)
-        textbox.configure(state="disabled")
+    def escribir_respuesta(self, texto):
+        """Agregar texto a la respuesta de IA; el primer fragmento reemplaza al loading"""
+        if self.caja_respuesta is None:
+            self.limpiar_respuesta()
+            self.caja_respuesta = ctk.CTkTextbox(self.frame_respuesta, width=700, height=300)
+            self.caja_respuesta.pack(pady=20, padx=20, fill="both", expand=True)
+        self.agregar_al_final(self.caja_respuesta, texto)
+    
+    def terminar_respuesta(self, contenido):
+        """Quitar el loading si el modelo no devolvió texto"""
+        if not contenido:
+            self.limpiar_respuesta()
 
 if __name__ == "__main__":
     app = AplicacionEstudiante()
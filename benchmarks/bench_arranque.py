@@ -0,0 +1,120 @@
+"""Medir el arranque de la app de escritorio y fallar si supera el presupuesto
+
+En procesos nuevos mide:
+- el tiempo de `import app_estudiante` según `python -X importtime`, y que los
+  módulos diferidos (openai, matplotlib, numpy) no se importen al cargar
+- el tiempo hasta el primer cuadro: importar, crear la ventana y pintar el
+  login (necesita pantalla; sin ella se omite)
+
+Uso:
+    python benchmarks/bench_arranque.py [--repeticiones 5] [--presupuesto-importacion-ms 500]
+                                        [--presupuesto-cuadro-ms 1500]
+
+Termina con código 1 si la mediana supera algún presupuesto, para usarlo en CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Paquetes que no deben cargarse antes de pintar el login
+DIFERIDOS = ("openai", "matplotlib", "numpy")
+
+CODIGO_PRIMER_CUADRO = """
+import os, time
+inicio = time.perf_counter()
+import app_estudiante
+app = app_estudiante.AplicacionEstudiante()
+app.update()
+print(time.perf_counter() - inicio, flush=True)
+os._exit(0)
+"""
+
+
+def entorno(directorio):
+    variables = dict(os.environ, PYTHONPATH=RAIZ, METRICAS_JSONL="", LIBRO_TOKENS_JSONL="")
+    variables.pop("METRICAS_PUERTO", None)
+    return {"env": variables, "cwd": directorio, "capture_output": True, "text": True}
+
+
+def medir_importacion(directorio):
+    """Segundos acumulados de `import app_estudiante` y módulos importados (nombre -> µs)"""
+    resultado = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app_estudiante"],
+                               **entorno(directorio))
+    if resultado.returncode != 0:
+        raise RuntimeError(resultado.stderr[-2000:])
+    modulos = {}
+    directos = []
+    for linea in resultado.stderr.splitlines():
+        partes = linea[len("import time:"):].split("|")
+        if not linea.startswith("import time:") or len(partes) != 3 or not partes[1].strip().isdigit():
+            continue
+        nombre = partes[2].strip()
+        modulos[nombre] = int(partes[1])
+        # Importados directamente por app_estudiante (un nivel de sangría)
+        if len(partes[2]) - len(partes[2].lstrip()) == 3:
+            directos.append((int(partes[1]), nombre))
+    return modulos["app_estudiante"] / 1e6, modulos, sorted(directos, reverse=True)
+
+
+def medir_primer_cuadro(directorio):
+    """Segundos hasta pintar el login, o None si no hay pantalla"""
+    resultado = subprocess.run([sys.executable, "-c", CODIGO_PRIMER_CUADRO], **entorno(directorio))
+    if resultado.returncode != 0:
+        if "TclError" in resultado.stderr:
+            return None
+        raise RuntimeError(resultado.stderr[-2000:])
+    return float(resultado.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--presupuesto-importacion-ms", type=float, default=500.0)
+    parser.add_argument("--presupuesto-cuadro-ms", type=float, default=1500.0)
+    args = parser.parse_args()
+
+    fallas = []
+    with tempfile.TemporaryDirectory() as directorio:
+        # Una corrida previa para que los .pyc ya estén compilados
+        medir_importacion(directorio)
+        importaciones = []
+        for _ in range(args.repeticiones):
+            segundos, modulos, directos = medir_importacion(directorio)
+            importaciones.append(segundos)
+        cuadros = [medir_primer_cuadro(directorio) for _ in range(args.repeticiones)]
+
+    print("importados por app_estudiante (ms acumulados, última corrida):")
+    for microsegundos, nombre in directos[:8]:
+        print(f"  {nombre:<28}{microsegundos / 1000:>10.1f}")
+
+    cargados = sorted({nombre.split(".")[0] for nombre in modulos} & set(DIFERIDOS))
+    if cargados:
+        fallas.append(f"se importan al cargar: {', '.join(cargados)}")
+
+    importacion_ms = statistics.median(importaciones) * 1000
+    print(f"\n{'medida':<22}{'p50 ms':>10}{'presupuesto':>14}")
+    print(f"{'importación':<22}{importacion_ms:>10.1f}{args.presupuesto_importacion_ms:>14.0f}")
+    if importacion_ms > args.presupuesto_importacion_ms:
+        fallas.append(f"importación {importacion_ms:.0f} ms > {args.presupuesto_importacion_ms:.0f} ms")
+
+    if None in cuadros:
+        print(f"{'primer cuadro':<22}{'sin pantalla':>10}")
+    else:
+        cuadro_ms = statistics.median(cuadros) * 1000
+        print(f"{'primer cuadro':<22}{cuadro_ms:>10.1f}{args.presupuesto_cuadro_ms:>14.0f}")
+        if cuadro_ms > args.presupuesto_cuadro_ms:
+            fallas.append(f"primer cuadro {cuadro_ms:.0f} ms > {args.presupuesto_cuadro_ms:.0f} ms")
+
+    if fallas:
+        print("\nFuera de presupuesto: " + "; ".join(fallas))
+        sys.exit(1)
+    print("\nDentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
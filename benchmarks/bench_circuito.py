@@ -0,0 +1,94 @@
+"""Comprobar que el circuito interruptor compartido se recupera tras una prueba fallida
+
+Sin red: un cliente falso responde al instante. Abre el circuito con fallos
+seguidos, deja pasar la pausa y hace que la petición de prueba del estado
+semiabierto agote la espera del limitador antes de llegar al servicio. Después
+otro cliente con limitador libre, sobre el mismo circuito, debe poder pasar.
+También mide cuánto tarda el circuito en volver a cerrarse.
+
+Uso:
+    python benchmarks/bench_circuito.py [--segundos-abierto 0.2]
+
+Termina con código 1 si el circuito queda abierto, para usarlo en CI.
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("METRICAS_JSONL", "")
+
+from cliente_resiliente import (  # noqa: E402
+    CircuitoAbierto,
+    CircuitoInterruptor,
+    ClienteResiliente,
+    LimitadorTasa,
+    ServicioNoDisponible,
+)
+
+
+class ClienteFalso:
+    """Imita `chat.completions.create` y cuenta las peticiones que llegan"""
+
+    def __init__(self):
+        self.peticiones = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.crear))
+
+    def crear(self, **argumentos):
+        self.peticiones += 1
+        return "ok"
+
+
+def pedir(cliente, timeout=0.05):
+    return cliente.chat.completions.create(
+        etapa="comprobacion", timeout=timeout, max_tokens=10,
+        messages=[{"role": "user", "content": "hola"}])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segundos-abierto", type=float, default=0.2)
+    args = parser.parse_args()
+
+    circuito = CircuitoInterruptor(fallos_para_abrir=5, segundos_abierto=args.segundos_abierto)
+    for _ in range(circuito.fallos_para_abrir):
+        circuito.registrar_fallo()
+    inicio = time.monotonic()
+    time.sleep(args.segundos_abierto)
+
+    # Limitador sin cupo: una petición por minuto ya consumida
+    agotado = LimitadorTasa(peticiones_por_minuto=1, tokens_por_minuto=10 ** 9)
+    agotado.adquirir(1)
+    sin_cupo = ClienteResiliente(ClienteFalso(), limitador=agotado, circuito=circuito)
+    fallas = []
+    try:
+        pedir(sin_cupo)
+        fallas.append("la prueba debía agotar la espera del limitador")
+    except CircuitoAbierto:
+        fallas.append("la prueba no pasó al estado semiabierto")
+    except ServicioNoDisponible:
+        pass
+
+    libre = ClienteFalso()
+    con_cupo = ClienteResiliente(libre, limitador=LimitadorTasa(10 ** 6, 10 ** 9), circuito=circuito)
+    try:
+        pedir(con_cupo)
+    except CircuitoAbierto:
+        fallas.append("el circuito quedó abierto tras la prueba que no llegó al servicio")
+    recuperacion = time.monotonic() - inicio
+
+    print(f"{'medida':<34}{'valor':>10}")
+    print(f"{'peticiones al servicio':<34}{libre.peticiones:>10}")
+    print(f"{'circuito abierto al final':<34}{str(circuito.esta_abierto()):>10}")
+    print(f"{'recuperación ms':<34}{recuperacion * 1000:>10.1f}")
+    if fallas:
+        print("\nFalla: " + "; ".join(fallas))
+        sys.exit(1)
+    print("\nEl circuito se recupera")
+
+
+if __name__ == "__main__":
+    main()
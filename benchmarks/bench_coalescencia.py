@@ -0,0 +1,100 @@
+"""Comprobar que un vuelo abandonado no le quita la clave a un vuelo más nuevo
+
+Sin red: un cliente falso entrega chunks a ritmo fijo. Un lector abre un
+stream y lo cierra a medias (como una generación anticipada cancelada); llega
+una petición idéntica que empieza un vuelo nuevo; el líder del vuelo viejo
+termina; y una tercera petición idéntica, con el vuelo nuevo aún en curso,
+debe unirse a él en lugar de hacer otra llamada.
+
+Uso:
+    python benchmarks/bench_coalescencia.py [--chunks 20 --segundos-por-chunk 0.02]
+
+Termina con código 1 si llegan más llamadas al servicio de las esperadas.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("METRICAS_JSONL", "")
+
+from coalescencia import ClienteVueloUnico  # noqa: E402
+
+
+class ClienteFalso:
+    """Imita `chat.completions.create` con stream y cuenta las llamadas"""
+
+    def __init__(self, chunks, segundos_por_chunk):
+        self.chunks = chunks
+        self.segundos_por_chunk = segundos_por_chunk
+        self.llamadas = 0
+        self.cerradas = threading.Event()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.crear))
+
+    def crear(self, etapa="general", **argumentos):
+        self.llamadas += 1
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for i in range(self.chunks):
+                time.sleep(self.segundos_por_chunk)
+                yield f"chunk {i}"
+        finally:
+            self.cerradas.set()
+
+
+def pedir(cliente):
+    return cliente.chat.completions.create(
+        etapa="comprobacion", stream=True, messages=[{"role": "user", "content": "hola"}])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--segundos-por-chunk", type=float, default=0.02)
+    args = parser.parse_args()
+
+    servicio = ClienteFalso(args.chunks, args.segundos_por_chunk)
+    cliente = ClienteVueloUnico(servicio)
+    fallas = []
+
+    # Vuelo A: se lee un chunk y se cancela
+    cancelado = pedir(cliente)
+    next(cancelado)
+    cancelado.close()
+
+    # Vuelo B: petición idéntica después del abandono, se lee despacio
+    nuevo = pedir(cliente)
+    next(nuevo)
+
+    # Esperar a que el líder de A termine y limpie
+    if not servicio.cerradas.wait(timeout=5):
+        fallas.append("el stream abandonado no se cerró")
+    time.sleep(args.segundos_por_chunk * 2)
+
+    # Con B en curso, una tercera petición idéntica debe unirse a B
+    tercero = pedir(cliente)
+    recibidos = sum(1 for _ in tercero)
+    restantes = sum(1 for _ in nuevo) + 1
+
+    if servicio.llamadas != 2:
+        fallas.append(f"se esperaban 2 llamadas al servicio y hubo {servicio.llamadas}")
+    if recibidos != args.chunks or restantes != args.chunks:
+        fallas.append(f"streams incompletos: {recibidos} y {restantes} de {args.chunks} chunks")
+
+    print(f"{'medida':<34}{'valor':>10}")
+    print(f"{'llamadas al servicio':<34}{servicio.llamadas:>10}")
+    print(f"{'chunks del tercer lector':<34}{recibidos:>10}")
+    if fallas:
+        print("\nFalla: " + "; ".join(fallas))
+        sys.exit(1)
+    print("\nLas peticiones idénticas siguen compartiendo el vuelo nuevo")
+
+
+if __name__ == "__main__":
+    main()
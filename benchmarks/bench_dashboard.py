@@ -0,0 +1,112 @@
+"""Medir la latencia de refrescar las gráficas del dashboard de escritorio
+
+Compara la ruta anterior (crear dos figuras nuevas, calcular el layout y
+rasterizar en cada refresco) contra las figuras retenidas de
+`GraficasDashboard`, con datos que cambian (se actualizan los artistas) y con
+datos repetidos (la imagen sale de la cache). Todo se dibuja con Agg, sin Tk.
+
+Uso:
+    python benchmarks/bench_dashboard.py [--refrescos 30]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("METRICAS_JSONL", "")
+
+from matplotlib import style  # noqa: E402
+from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: E402
+from matplotlib.figure import Figure  # noqa: E402
+
+from graficas_dashboard import SERIES_PERIODO, TITULOS_DONUTS, GraficasDashboard  # noqa: E402
+
+# Los emojis de los títulos no están en la fuente por defecto de matplotlib
+warnings.filterwarnings("ignore", message="Glyph")
+
+
+def datos_aleatorios(generador):
+    metricas = [(generador.randint(0, 100), f"{generador.uniform(0, 9):.1f}h", "#22c55e") for _ in TITULOS_DONUTS]
+    dias = generador.randint(1, 7)
+    semana = {"fechas_cortas": ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"][:dias]}
+    for clave, _, _, _ in SERIES_PERIODO:
+        semana[clave] = [generador.randint(1, 10) for _ in range(dias)]
+    return metricas, semana
+
+
+def refrescar_recreando(metricas, semana):
+    """Ruta anterior: figuras nuevas, tight_layout y rasterizado completo"""
+    with style.context("dark_background"):
+        figura = Figure(figsize=(12, 3), facecolor="#2b2b2b")
+        canvas = FigureCanvasAgg(figura)
+        for i, ((porcentaje, texto, color), titulo) in enumerate(zip(metricas, TITULOS_DONUTS)):
+            ax = figura.add_subplot(1, 4, i + 1)
+            ax.pie([porcentaje, 100 - porcentaje], colors=[color, "#1e1e1e"], startangle=90,
+                   wedgeprops=dict(width=0.4, edgecolor="#2b2b2b", linewidth=2))
+            ax.text(0, 0.15, f"{porcentaje}%", ha="center", va="center", fontsize=20, fontweight="bold")
+            ax.text(0, -0.15, texto, ha="center", va="center", fontsize=10, color="gray")
+            ax.set_title(titulo, fontsize=11, fontweight="bold", pad=10)
+        figura.tight_layout(pad=2)
+        canvas.draw()
+
+        figura2 = Figure(figsize=(11, 2.5), facecolor="#2b2b2b")
+        canvas2 = FigureCanvasAgg(figura2)
+        ax = figura2.add_subplot(111)
+        x = range(len(semana["fechas_cortas"]))
+        for j, (clave, leyenda, color, escala) in enumerate(SERIES_PERIODO):
+            ax.bar([i + (j - 1.5) * 0.2 for i in x], [v * escala for v in semana[clave]], 0.2,
+                   label=leyenda, color=color, alpha=0.8)
+        ax.set_xticks(x)
+        ax.set_xticklabels(semana["fechas_cortas"])
+        ax.legend(loc="upper left", fontsize=9, ncol=4)
+        ax.set_ylim(0, 12)
+        figura2.tight_layout()
+        canvas2.draw()
+
+
+def medir(refrescar, datos):
+    tiempos = []
+    for metricas, semana in datos:
+        inicio = time.perf_counter()
+        refrescar(metricas, semana)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--refrescos", type=int, default=30)
+    args = parser.parse_args()
+
+    generador = random.Random(0)
+    distintos = [datos_aleatorios(generador) for _ in range(args.refrescos)]
+    repetidos = [distintos[0]] * args.refrescos
+
+    inicio = time.perf_counter()
+    graficas = GraficasDashboard(max_imagenes=2 * args.refrescos)
+    creacion = time.perf_counter() - inicio
+
+    def refrescar_retenidas(metricas, semana):
+        graficas.imagen_donuts(metricas)
+        graficas.imagen_periodo(semana)
+
+    refrescar_recreando(*distintos[0])
+    print(f"creación única de las figuras retenidas: {creacion * 1000:.1f} ms\n")
+    print(f"{'modo':<26}{'p50 ms':>10}{'p95 ms':>10}")
+    for nombre, refrescar, datos in (
+            ("recrear figuras", refrescar_recreando, distintos),
+            ("retenidas, datos nuevos", refrescar_retenidas, distintos),
+            ("retenidas, cache", refrescar_retenidas, repetidos)):
+        p50, p95 = medir(refrescar, datos)
+        print(f"{nombre:<26}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}")
+    print(f"\ncache de imágenes: {graficas.estadisticas()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Comparar tokens de salida y latencia por etapa entre el modo markdown y el modo JSON
+
+Por defecto usa el servidor simulado; con --real usa la API de OpenAI configurada
+en OPENAI_API_KEY (cuesta dinero: 2 modos x 3 etapas x iteraciones).
+
+Uso:
+    python benchmarks/bench_estructurado.py [--iteraciones 3] [--real] [--foto refri.jpg]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+DIRECTORIO_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_BENCH))
+sys.path.insert(0, DIRECTORIO_BENCH)
+
+from bench_preprocesamiento import imagen_sintetica  # noqa: E402
+from servidor_simulado import ConfiguracionSimulada, iniciar_servidor  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iteraciones", type=int, default=3)
+    parser.add_argument("--real", action="store_true", help="Usar la API real en lugar del servidor simulado")
+    parser.add_argument("--foto", help="Foto de refrigerador (por defecto una imagen sintética)")
+    args = parser.parse_args()
+
+    if not args.real:
+        _, url = iniciar_servidor(ConfiguracionSimulada(ttft=0.2, tokens_por_segundo=80))
+        os.environ["OPENAI_BASE_URL"] = url
+        os.environ["OPENAI_API_KEY"] = "simulada"
+
+    # Importar después de configurar el entorno para que las métricas vayan a un archivo temporal
+    ruta_metricas = os.path.join(tempfile.mkdtemp(), "metricas.jsonl")
+    os.environ["METRICAS_JSONL"] = ruta_metricas
+    from PIL import Image
+
+    import pipeline_recetas
+    from cache_recetas import CacheRecetas
+    from cache_vision import CacheVision
+    from pasarela_llm import crear_pasarela
+
+    cliente = crear_pasarela(os.environ["OPENAI_API_KEY"])
+    imagen = Image.open(args.foto) if args.foto else imagen_sintetica()
+    imagen.load()
+
+    for _ in range(args.iteraciones):
+        for estructurado in (False, True):
+            # Caches vacías para que cada llamada llegue a la API
+            cache_vision = CacheVision(carpeta=tempfile.mkdtemp(), max_entradas=0)
+            cache_recetas = CacheRecetas(max_entradas=0)
+            ingredientes = "".join(pipeline_recetas.analizar_imagen(cliente, imagen, cache_vision, estructurado))
+            "".join(pipeline_recetas.generar_recetas(cliente, ingredientes, cache_recetas, estructurado))
+            "".join(pipeline_recetas.sugerir_ingredientes(cliente, ingredientes, cache_recetas, estructurado))
+
+    completados = {}
+    with open(ruta_metricas, "r", encoding="utf-8") as f:
+        for linea in f:
+            evento = json.loads(linea)
+            if evento.get("fase") == "completado":
+                completados.setdefault(evento["etapa"], []).append(evento)
+
+    print(f"{'etapa':<14}{'tokens md':>11}{'tokens json':>13}{'reducción':>11}{'ms md':>9}{'ms json':>9}{'ahorro ms':>11}")
+    for etapa in ("ingredientes", "recetas", "sugerencias"):
+        markdown = completados.get(etapa, [])
+        estructurado = completados.get(f"{etapa}_json", [])
+        if not markdown or not estructurado:
+            continue
+        tokens_md = statistics.mean(e["tokens"] for e in markdown)
+        tokens_json = statistics.mean(e["tokens"] for e in estructurado)
+        ms_md = statistics.median(e["segundos"] for e in markdown) * 1000
+        ms_json = statistics.median(e["segundos"] for e in estructurado) * 1000
+        reduccion = 1 - tokens_json / tokens_md if tokens_md else 0.0
+        print(f"{etapa:<14}{tokens_md:>11.0f}{tokens_json:>13.0f}{reduccion:>10.0%} {ms_md:>9.0f}{ms_json:>9.0f}{ms_md - ms_json:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Medir cuánto bloquea al hilo de la interfaz guardar un registro diario
+
+Compara, con un historial de varios usuarios y días, la ruta anterior (volver
+a escribir todo el JSON con indent=2), la escritura directa en SQLite y la
+escritura diferida, que solo encola el cambio. Para la diferida también mide
+cuánto tarda el cambio en quedar en disco.
+
+Uso:
+    python benchmarks/bench_persistencia.py [--usuarios 50] [--dias 365] [--guardados 50]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("METRICAS_JSONL", "")
+
+from almacen_estudiante import AlmacenDiferido, AlmacenEstudiante  # noqa: E402
+
+
+def datos_sinteticos(usuarios, dias):
+    """Datos con el formato del JSON anterior"""
+    hoy = date.today()
+    return {
+        f"usuario{u}": {
+            "registros_diarios": {
+                (hoy - timedelta(days=d)).isoformat(): {
+                    "sueno": "7.5", "comidas": "avena, arroz con pollo", "agua": "6", "ejercicio": "30",
+                    "estres": 4, "estudio": "3", "notas": "día normal"
+                } for d in range(dias)
+            },
+            "historial_recetas": []
+        } for u in range(usuarios)
+    }
+
+
+def registro_nuevo(i):
+    return {"sueno": str(6 + i % 3), "comidas": "", "agua": "8", "ejercicio": "20",
+            "estres": 5, "estudio": "4", "notas": f"guardado {i}"}
+
+
+def medir_json(directorio, datos, guardados):
+    ruta = os.path.join(directorio, "datos_estudiante.json")
+    tiempos = []
+    for i in range(guardados):
+        inicio = time.perf_counter()
+        datos["usuario0"]["registros_diarios"][date.today().isoformat()] = registro_nuevo(i)
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos, None
+
+
+def medir_sqlite(almacen, guardados):
+    tiempos = []
+    for i in range(guardados):
+        inicio = time.perf_counter()
+        almacen.guardar_registro("usuario0", date.today().isoformat(), registro_nuevo(i))
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos, None
+
+
+def medir_diferido(almacen, guardados):
+    diferido = AlmacenDiferido(almacen, segundos_espera=0.05)
+    tiempos = []
+    for i in range(guardados):
+        inicio = time.perf_counter()
+        diferido.guardar_registro("usuario0", date.today().isoformat(), registro_nuevo(i))
+        tiempos.append(time.perf_counter() - inicio)
+    inicio = time.perf_counter()
+    diferido.vaciar()
+    durable = time.perf_counter() - inicio
+    diferido.cerrar()
+    return tiempos, durable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--guardados", type=int, default=50)
+    args = parser.parse_args()
+
+    datos = datos_sinteticos(args.usuarios, args.dias)
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_json = os.path.join(directorio, "datos_estudiante.json")
+        with open(ruta_json, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        almacen = AlmacenEstudiante(os.path.join(directorio, "datos_estudiante.db"), sincronizacion="FULL")
+        inicio = time.perf_counter()
+        importados = almacen.migrar_json(ruta_json)
+        print(f"migración: {importados} registros en {(time.perf_counter() - inicio) * 1000:.0f} ms\n")
+
+        print(f"{'modo':<18}{'p50 ms':>10}{'p95 ms':>10}{'máx ms':>10}{'a disco ms':>12}")
+        variantes = (
+            ("JSON completo", lambda: medir_json(directorio, datos, args.guardados)),
+            ("SQLite directo", lambda: medir_sqlite(almacen, args.guardados)),
+            ("SQLite diferido", lambda: medir_diferido(almacen, args.guardados)),
+        )
+        for nombre, medir in variantes:
+            tiempos, durable = medir()
+            tiempos.sort()
+            p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+            columna_durable = f"{durable * 1000:>12.1f}" if durable is not None else f"{'-':>12}"
+            print(f"{nombre:<18}{statistics.median(tiempos) * 1000:>10.3f}{p95 * 1000:>10.3f}"
+                  f"{tiempos[-1] * 1000:>10.3f}{columna_durable}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Medir la latencia de punta a punta del pipeline contra el servidor simulado
+
+Recorre analizar_imagen_para_ingredientes -> generar_recetas ->
+sugerir_ingredientes_adicionales de app.py y analizar_imagen_threading de
+app_estudiante.py, y reporta p50/p95 de codificación, TTFT y tiempo total
+(en escritorio, hasta el primer texto visible).
+También compara el tiempo hasta el primer token de recetas (desde el inicio
+del pipeline) entre el modo secuencial y la generación anticipada, alternando
+los dos modos en cada iteración y con una lista de ingredientes detallada, para
+que haya análisis por recorrer después del sexto ingrediente.
+
+El limitador de tasa se configura con `--tpm` (por defecto sin límite
+práctico): con el límite real sus esperas dominan la medición.
+
+Uso:
+    python benchmarks/bench_pipeline.py [--iteraciones 10] [--ttft 0.3] [--tokens-por-segundo 200] [--tpm 100000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+DIRECTORIO_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_BENCH))
+sys.path.insert(0, DIRECTORIO_BENCH)
+
+from bench_preprocesamiento import imagen_sintetica  # noqa: E402
+from servidor_simulado import (  # noqa: E402
+    RESPUESTA_INGREDIENTES,
+    RESPUESTA_INGREDIENTES_DETALLADA,
+    ConfiguracionSimulada,
+    iniciar_servidor,
+)
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+class Mediciones:
+    def __init__(self):
+        self.series = {}
+
+    def agregar(self, nombre, segundos):
+        self.series.setdefault(nombre, []).append(segundos)
+
+    def imprimir(self):
+        print(f"{'medición':<44}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}")
+        for nombre, valores in self.series.items():
+            print(f"{nombre:<44}{len(valores):>5}{percentil(valores, 50) * 1000:>10.1f}{percentil(valores, 95) * 1000:>10.1f}")
+
+
+def consumir_midiendo(mediciones, etapa, llamada):
+    """Llamar a una etapa que devuelve fragmentos y medir TTFT y tiempo total"""
+    inicio = time.perf_counter()
+    fragmentos = llamada()
+    texto = []
+    for fragmento in fragmentos or []:
+        if not texto:
+            mediciones.agregar(f"{etapa} TTFT", time.perf_counter() - inicio)
+        texto.append(fragmento)
+    mediciones.agregar(f"{etapa} total", time.perf_counter() - inicio)
+    return "".join(texto)
+
+
+def medir_app_web(mediciones, imagen, iteraciones, configuracion):
+    import app
+    from streaming import GeneracionEspeculativa
+    from cache_recetas import CacheRecetas
+    from cache_vision import CacheVision
+    from hash_perceptual import IndicePerceptual
+    from indice_recetas import IndiceRecetas
+
+    # Caches e índices vacíos en cada llamada para que cada iteración llegue al servidor
+    carpeta = tempfile.mkdtemp()
+    app.obtener_cache_vision = lambda: CacheVision(carpeta=carpeta, max_entradas=0)
+    app.obtener_cache_recetas = lambda: CacheRecetas(max_entradas=0)
+    app.obtener_indice_perceptual = lambda: IndicePerceptual(ruta=None)
+    app.obtener_indice_recetas = lambda: IndiceRecetas(ruta=None)
+
+    codificar_original = app.pipeline_recetas.codificar_imagen
+
+    def codificar_midiendo(imagen_pil):
+        preparada = codificar_original(imagen_pil)
+        mediciones.agregar("web codificación", preparada.segundos_codificacion)
+        return preparada
+
+    app.pipeline_recetas.codificar_imagen = codificar_midiendo
+    cliente = app.obtener_cliente_openai()
+
+    for _ in range(iteraciones):
+        inicio = time.perf_counter()
+        ingredientes = consumir_midiendo(
+            mediciones, "web ingredientes", lambda: app.analizar_imagen_para_ingredientes(cliente, imagen))
+        consumir_midiendo(mediciones, "web recetas", lambda: app.generar_recetas(cliente, ingredientes))
+        consumir_midiendo(
+            mediciones, "web sugerencias", lambda: app.sugerir_ingredientes_adicionales(cliente, ingredientes))
+        mediciones.agregar("web pipeline secuencial total", time.perf_counter() - inicio)
+
+    configuracion.respuesta_ingredientes = RESPUESTA_INGREDIENTES_DETALLADA
+    for _ in range(iteraciones):
+        for anticipar in (False, True):
+            modo = "anticipada" if anticipar else "secuencial"
+            inicio = time.perf_counter()
+            especulacion = GeneracionEspeculativa(lambda texto: app.generar_recetas(cliente, texto))
+            fragmentos = []
+            for fragmento in app.analizar_imagen_para_ingredientes(cliente, imagen):
+                fragmentos.append(fragmento)
+                if anticipar:
+                    especulacion.agregar(fragmento)
+            ingredientes = "".join(fragmentos)
+            recetas = especulacion.reconciliar(ingredientes)
+            next(iter(recetas), None)
+            mediciones.agregar(f"web primer token de recetas ({modo})", time.perf_counter() - inicio)
+            for _ in recetas:
+                pass
+    configuracion.respuesta_ingredientes = RESPUESTA_INGREDIENTES
+
+
+def medir_app_escritorio(mediciones, imagen, iteraciones):
+    import app_estudiante
+    from cache_vision import CacheVision
+    from indice_recetas import IndiceRecetas
+    from preprocesamiento import preparar_imagen
+    from tareas_escritorio import TokenCancelacion
+
+    clase = app_estudiante.AplicacionEstudiante
+
+    class TareasInmediatas:
+        """Entrega lo que publica la tarea en el mismo hilo, sin cola ni Tk"""
+
+        def publicar(self, token, funcion, *args):
+            funcion(*args)
+
+        def transmitir(self, token, fragmentos, destino):
+            partes = []
+            for fragmento in fragmentos:
+                partes.append(fragmento)
+                destino(fragmento)
+            return "".join(partes)
+
+    class AppSinInterfaz:
+        """Instancia mínima que ejecuta el flujo de la app de escritorio sin Tk"""
+        analizar_imagen_threading = clase.analizar_imagen_threading
+        analizar_imagen_openai = clase.analizar_imagen_openai
+        generar_recetas_openai = clase.generar_recetas_openai
+        obtener_cliente = clase.obtener_cliente
+
+        def __init__(self):
+            self.cliente_openai = None
+            self.candado_cliente = threading.Lock()
+            self.tareas = TareasInmediatas()
+            self.nombre_usuario = "bench"
+            self.cache_vision = CacheVision(carpeta=tempfile.mkdtemp(), max_entradas=0)
+            self.indice_recetas = IndiceRecetas(ruta=None)
+            self.resultados = []
+            self.primer_texto = None
+
+        def limpiar_resultados(self):
+            pass
+
+        def mostrar_loading(self, texto):
+            pass
+
+        def quitar_loading(self):
+            pass
+
+        def escribir_resultado(self, titulo, texto):
+            if self.primer_texto is None:
+                self.primer_texto = time.perf_counter()
+            if not self.resultados or self.resultados[-1] != titulo:
+                self.resultados.append(titulo)
+
+        def registrar_historial_recetas(self, ingredientes, recetas, origen):
+            pass
+
+    for _ in range(iteraciones):
+        mediciones.agregar("escritorio codificación", preparar_imagen(imagen).segundos_codificacion)
+        instancia = AppSinInterfaz()
+        inicio = time.perf_counter()
+        instancia.analizar_imagen_threading(TokenCancelacion("recetas", 1), imagen)
+        mediciones.agregar("escritorio analizar_imagen_threading", time.perf_counter() - inicio)
+        mediciones.agregar("escritorio primer texto visible", instancia.primer_texto - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iteraciones", type=int, default=10)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens-por-segundo", type=float, default=200.0)
+    parser.add_argument("--tasa-errores", type=float, default=0.0)
+    parser.add_argument("--tpm", type=int, default=10 ** 8, help="Tokens por minuto del limitador")
+    parser.add_argument("--sin-escritorio", action="store_true", help="No medir app_estudiante.py")
+    args = parser.parse_args()
+
+    configuracion = ConfiguracionSimulada(args.ttft, args.tokens_por_segundo, args.tasa_errores, retry_after=0)
+    servidor, url = iniciar_servidor(configuracion)
+    os.environ["OPENAI_BASE_URL"] = url
+    os.environ["OPENAI_API_KEY"] = "simulada"
+    # Antes de importar las apps: el limitador global se crea al importar cliente_resiliente
+    os.environ["OPENAI_TPM"] = str(args.tpm)
+    os.environ["OPENAI_RPM"] = str(max(args.tpm // 100, 1))
+
+    imagen = imagen_sintetica()
+    imagen.load()
+    mediciones = Mediciones()
+    medir_app_web(mediciones, imagen, args.iteraciones, configuracion)
+    if not args.sin_escritorio:
+        medir_app_escritorio(mediciones, imagen, args.iteraciones)
+    servidor.shutdown()
+
+    mediciones.imprimir()
+    print(f"\npeticiones al servidor: {configuracion.peticiones}, errores inyectados: {configuracion.errores}")
+
+
+if __name__ == "__main__":
+    main()
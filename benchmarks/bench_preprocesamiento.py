@@ -0,0 +1,107 @@
+"""Comparar el envío PNG original contra el preprocesamiento JPEG/WebP
+
+También compara la vista previa de la app: decodificar la foto completa y
+reducirla contra la decodificación reducida en modo draft de JPEG.
+
+Uso:
+    python benchmarks/bench_preprocesamiento.py [foto1.jpg foto2.jpg ...] [--mbps 10]
+
+Sin fotos se genera una imagen sintética de 12 MP (4000x3000).
+"""
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocesamiento import crear_miniatura, preparar_imagen  # noqa: E402
+
+
+def codificar_png_original(imagen):
+    """Ruta anterior: PNG sin pérdida a resolución completa"""
+    inicio = time.perf_counter()
+    buffer = BytesIO()
+    imagen.save(buffer, format="PNG")
+    datos = base64.b64encode(buffer.getvalue())
+    return len(datos), time.perf_counter() - inicio
+
+
+def codificar_preparada(imagen, formato, calidad):
+    preparada = preparar_imagen(imagen, formato=formato, calidad=calidad)
+    return len(preparada.base64), preparada.segundos_codificacion
+
+
+def imagen_sintetica():
+    """Crear una foto sintética de 12 MP con gradientes y ruido"""
+    ruido = Image.effect_noise((4000, 3000), 40).convert("L")
+    gradiente = Image.radial_gradient("L").resize((4000, 3000))
+    return Image.merge("RGB", (ruido, gradiente, Image.linear_gradient("L").resize((4000, 3000))))
+
+
+def vista_previa_completa(datos, lado_maximo=1024):
+    """Ruta anterior: decodificar todos los pixeles y luego reducir"""
+    imagen = Image.open(BytesIO(datos))
+    imagen.load()
+    imagen.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+    buffer = BytesIO()
+    imagen.convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def comparar_vistas_previas(imagenes, repeticiones):
+    print(f"\n{'vista previa':<14}{'ms':>10}")
+    fotos_jpeg = []
+    for imagen in imagenes:
+        buffer = BytesIO()
+        imagen.convert("RGB").save(buffer, format="JPEG", quality=90)
+        fotos_jpeg.append(buffer.getvalue())
+    for nombre, funcion in (("completa", vista_previa_completa), ("draft", crear_miniatura)):
+        tiempos = []
+        for datos in fotos_jpeg:
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                funcion(datos)
+                tiempos.append(time.perf_counter() - inicio)
+        print(f"{nombre:<14}{statistics.median(tiempos) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fotos", nargs="*")
+    parser.add_argument("--mbps", type=float, default=10.0, help="Ancho de banda de subida supuesto")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    imagenes = [Image.open(ruta) for ruta in args.fotos] or [imagen_sintetica()]
+    variantes = [
+        ("PNG original", codificar_png_original),
+        ("JPEG q85", lambda img: codificar_preparada(img, "JPEG", 85)),
+        ("WEBP q80", lambda img: codificar_preparada(img, "WEBP", 80)),
+    ]
+
+    print(f"{'variante':<14}{'bytes enviados':>16}{'codificación ms':>18}{'subida ms':>12}{'total ms':>12}")
+    for nombre, funcion in variantes:
+        tamanos, tiempos = [], []
+        for imagen in imagenes:
+            for _ in range(args.repeticiones):
+                imagen.load()
+                tamano, segundos = funcion(imagen)
+                tamanos.append(tamano)
+                tiempos.append(segundos)
+        tamano = statistics.mean(tamanos)
+        codificacion_ms = statistics.median(tiempos) * 1000
+        # Tiempo estimado para subir el cuerpo de la petición
+        subida_ms = tamano * 8 / (args.mbps * 1_000_000) * 1000
+        print(f"{nombre:<14}{tamano:>16,.0f}{codificacion_ms:>18.1f}{subida_ms:>12.1f}{codificacion_ms + subida_ms:>12.1f}")
+
+    comparar_vistas_previas(imagenes, args.repeticiones)
+
+
+if __name__ == "__main__":
+    main()
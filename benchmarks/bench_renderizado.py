@@ -0,0 +1,95 @@
+"""Medir mensajes al frontend y tiempo de CPU al renderizar una respuesta en streaming
+
+Compara el bucle anterior (markdown con todo el texto por cada fragmento) contra
+RenderizadorStream. Los fragmentos llegan con el ritmo indicado por --tokens-por-segundo.
+
+Uso:
+    python benchmarks/bench_renderizado.py [--tokens 1500] [--tokens-por-segundo 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import RenderizadorStream  # noqa: E402
+
+
+try:
+    from streamlit.proto.Markdown_pb2 import Markdown
+except ImportError:
+    Markdown = None
+
+
+class ContenedorSimulado:
+    """Contenedor que cuenta mensajes y bytes como si los enviara por el websocket"""
+
+    def __init__(self):
+        self.mensajes = 0
+        self.bytes_enviados = 0
+
+    def markdown(self, texto):
+        # Serializar el mismo protobuf que Streamlit manda al navegador
+        if Markdown is not None:
+            datos = Markdown(body=texto).SerializeToString()
+        else:
+            datos = texto.encode("utf-8")
+        self.mensajes += 1
+        self.bytes_enviados += len(datos)
+
+
+def generar_fragmentos(cantidad):
+    palabras = ["**Paso**", " corta", " el", " pollo", " en", " cubos", ",\n", "- ", "cebolla", " picada"]
+    return [palabras[i % len(palabras)] for i in range(cantidad)]
+
+
+class RelojSimulado:
+    """Reloj que avanza al ritmo de llegada de los tokens sin dormir de verdad"""
+
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def medir_anterior(fragmentos):
+    contenedor = ContenedorSimulado()
+    inicio = time.process_time()
+    texto = ""
+    for fragmento in fragmentos:
+        texto += fragmento
+        contenedor.markdown(texto)
+    return contenedor, time.process_time() - inicio
+
+
+def medir_renderizador(fragmentos, tokens_por_segundo):
+    contenedor = ContenedorSimulado()
+    reloj = RelojSimulado()
+    renderizador = RenderizadorStream(contenedor, reloj=reloj)
+    inicio = time.process_time()
+    for fragmento in fragmentos:
+        reloj.ahora += 1 / tokens_por_segundo
+        renderizador.agregar(fragmento)
+    renderizador.finalizar()
+    return contenedor, time.process_time() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=1500)
+    parser.add_argument("--tokens-por-segundo", type=float, default=60.0)
+    args = parser.parse_args()
+
+    fragmentos = generar_fragmentos(args.tokens)
+    print(f"{'variante':<22}{'mensajes':>10}{'bytes enviados':>16}{'CPU ms':>10}")
+    for nombre, (contenedor, segundos) in [
+        ("markdown por token", medir_anterior(fragmentos)),
+        ("RenderizadorStream", medir_renderizador(fragmentos, args.tokens_por_segundo)),
+    ]:
+        print(f"{nombre:<22}{contenedor.mensajes:>10}{contenedor.bytes_enviados:>16,}{segundos * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Medir cuánto recortan las peticiones de respaldo la cola del tiempo al primer token
+
+Usa el servidor simulado con una fracción de respuestas lentas y compara la
+pasarela sin respaldo contra la pasarela que duplica la petición cuando el
+primer token supera el p95 observado de la etapa.
+
+Uso:
+    python benchmarks/bench_respaldo.py [--peticiones 200] [--tasa-lentas 0.03] [--ttft-lenta 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+DIRECTORIO_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(DIRECTORIO_BENCH))
+sys.path.insert(0, DIRECTORIO_BENCH)
+
+from servidor_simulado import ConfiguracionSimulada, iniciar_servidor  # noqa: E402
+
+
+def medir(pasarela, peticiones):
+    """Pedir recetas en streaming y devolver los TTFT observados"""
+    tiempos = []
+    for _ in range(peticiones):
+        inicio = time.perf_counter()
+        stream = pasarela.chat.completions.create(
+            etapa="recetas", stream=True,
+            messages=[{"role": "user", "content": "Recetas con huevo y jitomate"}]
+        )
+        primero = None
+        for _chunk in stream:
+            if primero is None:
+                primero = time.perf_counter() - inicio
+        tiempos.append(primero)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--tasa-lentas", type=float, default=0.03)
+    parser.add_argument("--ttft-lenta", type=float, default=2.0)
+    args = parser.parse_args()
+
+    configuracion = ConfiguracionSimulada(args.ttft, 2000.0, tasa_lentas=args.tasa_lentas, ttft_lenta=args.ttft_lenta)
+    servidor, url = iniciar_servidor(configuracion)
+    os.environ["OPENAI_BASE_URL"] = url
+    os.environ["OPENAI_API_KEY"] = "simulada"
+    os.environ.setdefault("METRICAS_JSONL", "")
+
+    from cliente_resiliente import CircuitoInterruptor, LimitadorTasa, crear_cliente
+    from pasarela_llm import PasarelaLLM, percentil
+
+    print(f"{'modo':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    for nombre, respaldo in (("sin respaldo", False), ("con respaldo", True)):
+        # Limitador propio y generoso para medir solo la latencia del servidor
+        cliente = crear_cliente("simulada", limitador=LimitadorTasa(100000, 10 ** 9), circuito=CircuitoInterruptor())
+        # Segundos mínimos bajos para que el umbral siga al p95 del servidor simulado
+        pasarela = PasarelaLLM(cliente, respaldo=respaldo, segundos_minimos=0.05)
+        medir(pasarela, 30)
+        tiempos = medir(pasarela, args.peticiones)
+        print(f"{nombre:<14}" + "".join(f"{percentil(tiempos, p) * 1000:>10.1f}" for p in (50, 95, 99, 100)))
+
+    servidor.shutdown()
+    print(f"\npeticiones al servidor: {configuracion.peticiones}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Medir el cálculo de promedios y barras del dashboard sobre el historial diario
+
+Compara la ruta anterior (recorrer día por día el dict de registros y
+convertir cada campo con `float(... or 0)`) contra `SerieDiaria`, para
+ventanas de 7, 30 y 365 días, y el costo de actualizar la serie al guardar un
+registro contra reconstruirla completa.
+
+Uso:
+    python benchmarks/bench_series.py [--dias 1095] [--repeticiones 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("METRICAS_JSONL", "")
+
+from almacen_estudiante import CAMPOS_NUMERICOS  # noqa: E402
+from serie_diaria import SerieDiaria  # noqa: E402
+
+
+def registros_sinteticos(dias, generador):
+    """Historial con huecos, como lo devuelve `registros_entre`"""
+    hoy = date.today()
+    return {
+        (hoy - timedelta(days=d)).isoformat(): {
+            "sueno": round(generador.uniform(4, 9), 1), "agua": generador.randint(2, 10),
+            "ejercicio": generador.choice([None, 0, 15, 30, 45]), "estres": generador.randint(1, 10),
+            "estudio": round(generador.uniform(0, 8), 1)
+        } for d in range(dias) if generador.random() > 0.15
+    }
+
+
+def promedios_recorriendo(registros, ventana):
+    """Ruta anterior: un lookup y una conversión por día y campo"""
+    hoy = date.today()
+    sumas = {campo: 0.0 for campo in CAMPOS_NUMERICOS}
+    cuentas = {campo: 0 for campo in CAMPOS_NUMERICOS}
+    for i in range(ventana):
+        registro = registros.get((hoy - timedelta(days=i)).isoformat())
+        if not registro:
+            continue
+        for campo in CAMPOS_NUMERICOS:
+            if registro.get(campo) is not None:
+                sumas[campo] += float(registro.get(campo) or 0)
+                cuentas[campo] += 1
+    return {campo: sumas[campo] / cuentas[campo] if cuentas[campo] else None for campo in CAMPOS_NUMERICOS}
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dias", type=int, default=1095)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    generador = random.Random(0)
+    registros = registros_sinteticos(args.dias, generador)
+    serie = SerieDiaria(registros)
+
+    print(f"{len(registros)} registros en {args.dias} días\n")
+    print(f"{'medida':<30}{'recorriendo ms':>16}{'SerieDiaria ms':>16}")
+    for ventana in (7, 30, 365):
+        antes = medir(lambda: promedios_recorriendo(registros, ventana), args.repeticiones)
+        despues = medir(lambda: serie.promedios(ventana), args.repeticiones)
+        print(f"{f'promedios {ventana} días':<30}{antes * 1000:>16.3f}{despues * 1000:>16.3f}")
+    for periodo in ("semana", "mes", "anio"):
+        despues = medir(lambda: serie.agrupar(periodo), args.repeticiones)
+        print(f"{f'barras {periodo}':<30}{'-':>16}{despues * 1000:>16.3f}")
+    despues = medir(lambda: serie.resumen(), args.repeticiones)
+    print(f"{'resumen (4 ventanas + rachas)':<30}{'-':>16}{despues * 1000:>16.3f}")
+
+    hoy = date.today().isoformat()
+    reconstruir = medir(lambda: SerieDiaria(registros), max(args.repeticiones // 10, 1))
+    nuevo = {"sueno": 7.5, "agua": 8, "ejercicio": 30, "estres": 4, "estudio": 5}
+    actualizar = medir(lambda: serie.actualizar(hoy, nuevo), args.repeticiones)
+    print(f"\nguardar un día: reconstruir {reconstruir * 1000:.3f} ms, actualizar {actualizar * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
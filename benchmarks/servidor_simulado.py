@@ -0,0 +1,282 @@
+"""Servidor local que imita el endpoint /v1/chat/completions de OpenAI
+
+Permite medir el pipeline sin clave de API ni red: el tiempo hasta el primer
+token, los tokens por segundo y la tasa de errores son configurables.
+
+Uso:
+    python benchmarks/servidor_simulado.py --puerto 8765 --ttft 0.5 --tokens-por-segundo 60
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=simulada streamlit run app.py
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPUESTA_INGREDIENTES = """- pechuga de pollo
+- pimiento rojo
+- leche entera
+- huevos
+- queso manchego
+- tortillas de maíz
+- cebolla blanca
+- jitomate"""
+
+# Lista con detalles entre paréntesis, como suele responder el modelo con fotos reales:
+# más tokens por línea y un análisis más largo tras el sexto ingrediente
+RESPUESTA_INGREDIENTES_DETALLADA = """- pechuga de pollo (dos piezas en charola, aproximadamente medio kilo)
+- pimiento rojo (uno entero en el cajón de verduras, se ve fresco)
+- leche entera (envase de un litro abierto, a la mitad)
+- huevos (cartón de doce, quedan unos ocho)
+- queso manchego (bloque envuelto en plástico, unos 200 gramos)
+- tortillas de maíz (paquete cerrado en la puerta del refrigerador)
+- cebolla blanca (una grande y media cebolla envuelta en plástico)
+- jitomate (cuatro piezas maduras en una bolsa de papel)
+- cilantro (un manojo en un vaso con agua, hojas algo marchitas)"""
+
+RESPUESTA_TEXTO = """### 🌮 Tacos de Pollo con Pimiento
+**Ingredientes:** pechuga de pollo, pimiento rojo, cebolla blanca, tortillas de maíz
+**Instrucciones:**
+1. Corta el pollo en tiras y sazona con sal y pimienta.
+2. Saltea la cebolla y el pimiento por 5 minutos.
+3. Agrega el pollo y cocina hasta que esté dorado.
+4. Sirve en tortillas calientes.
+**Tiempo:** 25 minutos
+
+### 🍳 Huevos a la Mexicana
+**Ingredientes:** huevos, jitomate, cebolla blanca
+**Instrucciones:**
+1. Pica el jitomate y la cebolla.
+2. Sofríe las verduras y agrega los huevos batidos.
+3. Revuelve hasta que cuajen.
+**Tiempo:** 10 minutos
+"""
+
+# Respuestas del modo estructurado, según el nombre del json_schema pedido
+RESPUESTAS_JSON = {
+    "ingredientes": {"ingredientes": [
+        "pechuga de pollo", "pimiento rojo", "leche entera", "huevos",
+        "queso manchego", "tortillas de maíz", "cebolla blanca", "jitomate"
+    ]},
+    "recetas": {"recetas": [
+        {"nombre": "Tacos de Pollo con Pimiento",
+         "ingredientes": ["pechuga de pollo", "pimiento rojo", "cebolla blanca", "tortillas de maíz"],
+         "pasos": ["Corta el pollo en tiras y sazona.", "Saltea cebolla y pimiento 5 min.",
+                   "Agrega el pollo hasta dorar.", "Sirve en tortillas calientes."],
+         "minutos": 25},
+        {"nombre": "Huevos a la Mexicana",
+         "ingredientes": ["huevos", "jitomate", "cebolla blanca"],
+         "pasos": ["Pica jitomate y cebolla.", "Sofríe y agrega los huevos batidos.", "Revuelve hasta cuajar."],
+         "minutos": 10}
+    ]},
+    "sugerencias": {"sugerencias": [
+        {"ingrediente": "arroz", "razon": "Base económica que dura meses."},
+        {"ingrediente": "frijoles", "razon": "Proteína barata para muchos guisos."},
+        {"ingrediente": "ajo", "razon": "Da sabor a casi cualquier platillo."}
+    ]},
+}
+
+
+class ConfiguracionSimulada:
+    """Parámetros de latencia y errores del servidor simulado"""
+
+    def __init__(self, ttft=0.5, tokens_por_segundo=60.0, tasa_errores=0.0,
+                 codigo_error=429, retry_after=1, tasa_lentas=0.0, ttft_lenta=5.0, minimo_cache=1024,
+                 respuesta_ingredientes=RESPUESTA_INGREDIENTES):
+        self.ttft = ttft
+        # Fracción de peticiones con un primer token muy lento (cola de latencia)
+        self.tasa_lentas = tasa_lentas
+        self.ttft_lenta = ttft_lenta
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tasa_errores = tasa_errores
+        self.codigo_error = codigo_error
+        self.retry_after = retry_after
+        # Como la cache de prompts del proveedor: prefijos de al menos `minimo_cache`
+        # tokens ya vistos se reportan en bloques de 128 como tokens cacheados
+        self.minimo_cache = minimo_cache
+        # Texto de la respuesta a las peticiones con imagen (modo texto)
+        self.respuesta_ingredientes = respuesta_ingredientes
+        self.peticiones = 0
+        self.errores = 0
+        self._prefijos = []
+        self._candado = threading.Lock()
+
+    def tokens_cacheados(self, serializado):
+        """Tokens del prompt que coinciden con el prefijo de una petición anterior"""
+        with self._candado:
+            comun = max((len(os.path.commonprefix([serializado, previo])) for previo in self._prefijos), default=0)
+            self._prefijos = (self._prefijos + [serializado])[-256:]
+        tokens = comun // 4
+        return tokens // 128 * 128 if tokens >= self.minimo_cache else 0
+
+    def registrar(self, fallo):
+        with self._candado:
+            self.peticiones += 1
+            if fallo:
+                self.errores += 1
+
+
+def tiene_imagen(mensajes):
+    for mensaje in mensajes:
+        contenido = mensaje.get("content")
+        if isinstance(contenido, list) and any(parte.get("type") == "image_url" for parte in contenido):
+            return True
+    return False
+
+
+def dividir_en_tokens(texto):
+    """Dividir en fragmentos de ~4 caracteres, parecido a los tokens reales"""
+    return [texto[i:i + 4] for i in range(0, len(texto), 4)]
+
+
+class ManejadorSimulado(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    configuracion = ConfiguracionSimulada()
+
+    def log_message(self, formato, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._responder_json(404, {"error": {"message": "Ruta no encontrada"}})
+            return
+
+        longitud = int(self.headers.get("Content-Length", 0))
+        peticion = json.loads(self.rfile.read(longitud) or b"{}")
+        configuracion = self.configuracion
+
+        fallo = random.random() < configuracion.tasa_errores
+        configuracion.registrar(fallo)
+        if fallo:
+            self._responder_json(
+                configuracion.codigo_error,
+                {"error": {"message": "Error simulado", "type": "rate_limit_error"}},
+                {"Retry-After": str(configuracion.retry_after)}
+            )
+            return
+
+        esquema = ((peticion.get("response_format") or {}).get("json_schema") or {}).get("name")
+        if esquema in RESPUESTAS_JSON:
+            texto = json.dumps(RESPUESTAS_JSON[esquema], ensure_ascii=False, separators=(",", ":"))
+        elif tiene_imagen(peticion.get("messages", [])):
+            texto = configuracion.respuesta_ingredientes
+        else:
+            texto = RESPUESTA_TEXTO
+        tokens = dividir_en_tokens(texto)[:peticion.get("max_tokens") or None]
+        modelo = peticion.get("model", "gpt-4o")
+        serializado = json.dumps(peticion.get("messages", []), ensure_ascii=False)
+        uso = {
+            "prompt_tokens": len(serializado) // 4,
+            "completion_tokens": len(tokens),
+            "prompt_tokens_details": {"cached_tokens": configuracion.tokens_cacheados(serializado)},
+        }
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+
+        lenta = random.random() < configuracion.tasa_lentas
+        time.sleep(configuracion.ttft_lenta if lenta else configuracion.ttft)
+        if peticion.get("stream"):
+            self._responder_stream(tokens, modelo, uso, peticion)
+        else:
+            time.sleep(len(tokens) / configuracion.tokens_por_segundo)
+            self._responder_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": modelo,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": uso
+            })
+
+    def _responder_json(self, codigo, cuerpo, encabezados=None):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _responder_stream(self, tokens, modelo, uso, peticion):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        identificador = f"chatcmpl-{uuid.uuid4().hex}"
+        pausa = 1 / self.configuracion.tokens_por_segundo
+
+        def enviar(delta, finish_reason=None, usage=None):
+            chunk = {
+                "id": identificador,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": modelo,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if usage:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            enviar({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(pausa)
+                enviar({"content": token})
+            enviar({}, finish_reason="stop")
+            if (peticion.get("stream_options") or {}).get("include_usage"):
+                enviar(None, usage=uso)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente canceló el stream
+            pass
+
+
+def iniciar_servidor(configuracion=None, puerto=0):
+    """Iniciar el servidor en un hilo y devolverlo junto con su URL base"""
+    manejador = type("Manejador", (ManejadorSimulado,), {
+        "configuracion": configuracion or ConfiguracionSimulada()
+    })
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.5, help="Segundos hasta el primer token")
+    parser.add_argument("--tokens-por-segundo", type=float, default=60.0)
+    parser.add_argument("--tasa-errores", type=float, default=0.0, help="Probabilidad de responder con error")
+    parser.add_argument("--codigo-error", type=int, default=429)
+    parser.add_argument("--tasa-lentas", type=float, default=0.0, help="Probabilidad de un primer token lento")
+    parser.add_argument("--ttft-lenta", type=float, default=5.0)
+    parser.add_argument("--minimo-cache", type=int, default=1024, help="Tokens mínimos de prefijo para cachear")
+    args = parser.parse_args()
+
+    configuracion = ConfiguracionSimulada(args.ttft, args.tokens_por_segundo, args.tasa_errores, args.codigo_error,
+                                          tasa_lentas=args.tasa_lentas, ttft_lenta=args.ttft_lenta,
+                                          minimo_cache=args.minimo_cache)
+    servidor, url = iniciar_servidor(configuracion, args.puerto)
+    print(f"Servidor simulado en {url} (Ctrl+C para detener)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
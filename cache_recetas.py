@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from ingredientes import conjunto_canonico
+
+
+def calcular_clave_recetas(ingredientes, version_prompt):
+    """Calcular la clave a partir del conjunto canónico de ingredientes y la versión del prompt"""
+    canonico = "\n".join(conjunto_canonico(ingredientes))
+    return hashlib.sha256(f"{version_prompt}\0{canonico}".encode("utf-8")).hexdigest()
+
+
+class CacheRecetas:
+    """Cache LRU de respuestas de texto con persistencia opcional en un archivo JSON"""
+
+    def __init__(self, max_entradas=256, ruta=None):
+        self.max_entradas = max_entradas
+        self.ruta = ruta
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+        if ruta:
+            self._cargar()
+
+    def _cargar(self):
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                guardadas = json.load(f)
+        except (OSError, ValueError):
+            return
+        for clave, texto in guardadas[-self.max_entradas:]:
+            self._entradas[clave] = texto
+
+    def _persistir(self):
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        try:
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(list(self._entradas.items()), f, ensure_ascii=False)
+            os.replace(temporal, self.ruta)
+        except OSError:
+            pass
+
+    def obtener(self, clave):
+        """Obtener el texto guardado y marcarlo como usado recientemente"""
+        with self._candado:
+            if clave not in self._entradas:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return self._entradas[clave]
+
+    def guardar(self, clave, texto):
+        """Guardar un texto y descartar el menos usado si se excede el límite"""
+        with self._candado:
+            self._entradas[clave] = texto
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+            if self.ruta:
+                self._persistir()
+
+    def estadisticas(self):
+        """Obtener contadores de aciertos y fallos"""
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "entradas": len(self._entradas),
+            "tasa_aciertos": self.aciertos / total if total else 0.0
+        }
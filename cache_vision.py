@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Carpeta por defecto para guardar los análisis de imágenes
+CARPETA_CACHE_VISION = os.path.join(".cache", "vision")
+
+
+def calcular_clave_imagen(imagen, prompt, modelo):
+    """Calcular clave SHA-256 a partir de los pixeles, el prompt y el modelo"""
+    digest = hashlib.sha256()
+    digest.update(imagen.mode.encode("utf-8"))
+    digest.update(f"{imagen.width}x{imagen.height}".encode("utf-8"))
+    digest.update(imagen.tobytes())
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(modelo.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CacheVision:
+    """Cache en disco para los análisis de imágenes del modelo de visión"""
+
+    def __init__(self, carpeta=CARPETA_CACHE_VISION, max_entradas=500,
+                 max_bytes=50 * 1024 * 1024, max_edad_segundos=30 * 24 * 3600):
+        self.carpeta = carpeta
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.max_edad_segundos = max_edad_segundos
+        self.aciertos = 0
+        self.fallos = 0
+        self._candado = threading.Lock()
+        os.makedirs(self.carpeta, exist_ok=True)
+
+    def _ruta(self, clave):
+        return os.path.join(self.carpeta, f"{clave}.json")
+
+    def obtener(self, clave):
+        """Obtener el texto guardado para una clave o None si no existe"""
+        ruta = self._ruta(clave)
+        with self._candado:
+            try:
+                with open(ruta, "r", encoding="utf-8") as f:
+                    entrada = json.load(f)
+            except (OSError, ValueError):
+                self.fallos += 1
+                return None
+
+            if time.time() - entrada.get("creado", 0) > self.max_edad_segundos:
+                self._eliminar(ruta)
+                self.fallos += 1
+                return None
+
+            # Marcar como usado recientemente para la evicción
+            try:
+                os.utime(ruta, None)
+            except OSError:
+                pass
+            self.aciertos += 1
+            return entrada["texto"]
+
+    def guardar(self, clave, texto, modelo=""):
+        """Guardar el texto de un análisis y aplicar la política de evicción"""
+        entrada = {"texto": texto, "modelo": modelo, "creado": time.time()}
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._candado:
+            try:
+                with open(temporal, "w", encoding="utf-8") as f:
+                    json.dump(entrada, f, ensure_ascii=False)
+                os.replace(temporal, ruta)
+            except OSError:
+                self._eliminar(temporal)
+                return
+            self._aplicar_eviccion()
+
+    def _aplicar_eviccion(self):
+        """Eliminar entradas vencidas y las menos usadas si se excede el límite"""
+        ahora = time.time()
+        entradas = []
+        for nombre in os.listdir(self.carpeta):
+            if not nombre.endswith(".json"):
+                continue
+            ruta = os.path.join(self.carpeta, nombre)
+            try:
+                info = os.stat(ruta)
+            except OSError:
+                continue
+            if ahora - info.st_mtime > self.max_edad_segundos:
+                self._eliminar(ruta)
+                continue
+            entradas.append((info.st_mtime, info.st_size, ruta))
+
+        entradas.sort()
+        total_bytes = sum(tamano for _, tamano, _ in entradas)
+        while entradas and (len(entradas) > self.max_entradas or total_bytes > self.max_bytes):
+            _, tamano, ruta = entradas.pop(0)
+            self._eliminar(ruta)
+            total_bytes -= tamano
+
+    def _eliminar(self, ruta):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+    def estadisticas(self):
+        """Obtener contadores de aciertos y fallos"""
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": self.aciertos / total if total else 0.0
+        }
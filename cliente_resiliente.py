@@ -0,0 +1,267 @@
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import openai
+from openai import OpenAI
+
+from metricas import registro
+
+# Límites por defecto del nivel 1 de GPT-4o; se pueden ajustar por variable de entorno
+PETICIONES_POR_MINUTO = int(os.getenv("OPENAI_RPM", "500"))
+TOKENS_POR_MINUTO = int(os.getenv("OPENAI_TPM", "30000"))
+
+# Tiempo máximo de espera (segundos) por etapa; se busca la clave dentro del nombre de la etapa
+TIEMPOS_ESPERA_ETAPA = {
+    "ingredientes": 60.0,
+    "recetas": 90.0,
+    "sugerencias": 60.0,
+    "consejo": 45.0,
+}
+TIEMPO_ESPERA_DEFECTO = 60.0
+
+# Tokens que se suponen por imagen al estimar el consumo de una petición
+TOKENS_POR_IMAGEN = 800
+
+
+class ServicioNoDisponible(Exception):
+    """El servicio de IA no puede atender la petición en este momento"""
+
+
+class CircuitoAbierto(ServicioNoDisponible):
+    """Demasiados fallos seguidos: las peticiones fallan de inmediato por un tiempo"""
+
+    def __init__(self, segundos_restantes):
+        self.segundos_restantes = segundos_restantes
+        super().__init__(
+            f"El servicio de IA está saturado. Intenta de nuevo en {segundos_restantes:.0f} segundos."
+        )
+
+
+def tiempo_espera_etapa(etapa):
+    """Obtener el tiempo máximo de espera configurado para una etapa"""
+    for clave, segundos in TIEMPOS_ESPERA_ETAPA.items():
+        if clave in etapa:
+            return segundos
+    return TIEMPO_ESPERA_DEFECTO
+
+
+class CubetaTokens:
+    """Cubeta de tokens que se recarga de forma continua a `capacidad` por minuto"""
+
+    def __init__(self, capacidad_por_minuto):
+        self.capacidad = float(capacidad_por_minuto)
+        self.disponibles = self.capacidad
+        self.tasa = self.capacidad / 60.0
+        self.ultimo = time.monotonic()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.disponibles = min(self.capacidad, self.disponibles + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def espera_necesaria(self, cantidad):
+        """Segundos que faltan para poder consumir `cantidad` (0 si ya se puede)"""
+        self._recargar()
+        cantidad = min(cantidad, self.capacidad)
+        if self.disponibles >= cantidad:
+            return 0.0
+        return (cantidad - self.disponibles) / self.tasa
+
+    def consumir(self, cantidad):
+        self.disponibles -= min(cantidad, self.capacidad)
+
+
+class LimitadorTasa:
+    """Limitar peticiones y tokens por minuto para todo el proceso"""
+
+    def __init__(self, peticiones_por_minuto=PETICIONES_POR_MINUTO, tokens_por_minuto=TOKENS_POR_MINUTO):
+        self.peticiones = CubetaTokens(peticiones_por_minuto)
+        self.tokens = CubetaTokens(tokens_por_minuto)
+        self._candado = threading.Lock()
+
+    def adquirir(self, tokens, tiempo_maximo=None):
+        """Esperar hasta que haya cupo; devuelve los segundos dormidos por falta de cupo (0 si había)"""
+        inicio = time.monotonic()
+        dormido = 0.0
+        while True:
+            with self._candado:
+                espera = max(self.peticiones.espera_necesaria(1), self.tokens.espera_necesaria(tokens))
+                if espera <= 0:
+                    self.peticiones.consumir(1)
+                    self.tokens.consumir(tokens)
+                    return dormido
+            if tiempo_maximo is not None and time.monotonic() - inicio + espera > tiempo_maximo:
+                raise ServicioNoDisponible("Se alcanzó el límite de peticiones por minuto. Intenta en un momento.")
+            pausa = min(espera, 1.0)
+            time.sleep(pausa)
+            dormido += pausa
+
+
+class CircuitoInterruptor:
+    """Cortar las peticiones tras varios fallos seguidos y probar de nuevo tras una pausa"""
+
+    def __init__(self, fallos_para_abrir=5, segundos_abierto=30.0):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.segundos_abierto = segundos_abierto
+        self.fallos_seguidos = 0
+        self.abierto_desde = None
+        self._prueba_en_curso = False
+        self._candado = threading.Lock()
+
+    def verificar(self):
+        """Lanzar CircuitoAbierto si no se debe intentar la petición
+
+        Devuelve True si esta petición es la de prueba del estado semiabierto;
+        quien la recibe debe llamar a `liberar_prueba` al terminar.
+        """
+        with self._candado:
+            if self.abierto_desde is None:
+                return False
+            restante = self.abierto_desde + self.segundos_abierto - time.monotonic()
+            if restante > 0 or self._prueba_en_curso:
+                raise CircuitoAbierto(max(restante, 1.0))
+            # Semiabierto: dejar pasar una sola petición de prueba
+            self._prueba_en_curso = True
+            return True
+
+    def liberar_prueba(self):
+        """Soltar el turno de prueba si la petición terminó sin registrar éxito ni fallo"""
+        with self._candado:
+            self._prueba_en_curso = False
+
+    def registrar_exito(self):
+        with self._candado:
+            self.fallos_seguidos = 0
+            self.abierto_desde = None
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._candado:
+            self.fallos_seguidos += 1
+            if self._prueba_en_curso or self.fallos_seguidos >= self.fallos_para_abrir:
+                self.abierto_desde = time.monotonic()
+                self._prueba_en_curso = False
+
+    def esta_abierto(self):
+        with self._candado:
+            return self.abierto_desde is not None
+
+
+# Compartidos por todas las sesiones y ventanas del proceso
+LIMITADOR_GLOBAL = LimitadorTasa()
+CIRCUITO_GLOBAL = CircuitoInterruptor()
+
+
+def estimar_tokens(argumentos):
+    """Estimar los tokens de una petición (prompt aproximado + máximo de salida)"""
+    caracteres = 0
+    imagenes = 0
+    for mensaje in argumentos.get("messages", []):
+        contenido = mensaje.get("content")
+        if isinstance(contenido, str):
+            caracteres += len(contenido)
+            continue
+        for parte in contenido or []:
+            if parte.get("type") == "image_url":
+                imagenes += 1
+            else:
+                caracteres += len(json.dumps(parte.get("text", ""), ensure_ascii=False))
+    return caracteres // 4 + imagenes * TOKENS_POR_IMAGEN + (argumentos.get("max_tokens") or 0)
+
+
+def es_reintentable(error):
+    """Errores temporales: límite de tasa, tiempo de espera, conexión y errores 5xx"""
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+
+def leer_retry_after(error):
+    """Leer los encabezados Retry-After / retry-after-ms de la respuesta, si existen"""
+    respuesta = getattr(error, "response", None)
+    if respuesta is None:
+        return None
+    encabezados = respuesta.headers
+    try:
+        if encabezados.get("retry-after-ms"):
+            return float(encabezados["retry-after-ms"]) / 1000
+        if encabezados.get("retry-after"):
+            return float(encabezados["retry-after"])
+    except ValueError:
+        # Retry-After con fecha HTTP: usar el backoff normal
+        return None
+    return None
+
+
+class ClienteResiliente:
+    """Envolver un cliente OpenAI con limitador, reintentos con backoff y circuito interruptor
+
+    Expone `chat.completions.create(...)` igual que el cliente original, con un
+    argumento extra `etapa` para métricas y tiempos de espera por etapa.
+    """
+
+    def __init__(self, cliente, limitador=LIMITADOR_GLOBAL, circuito=CIRCUITO_GLOBAL,
+                 max_reintentos=4, espera_base=0.5, espera_maxima=20.0):
+        self.cliente = cliente
+        self.limitador = limitador
+        self.circuito = circuito
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.crear))
+
+    def calcular_espera(self, intento, error):
+        """Backoff exponencial con jitter completo, respetando Retry-After"""
+        retry_after = leer_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.espera_maxima * 3)
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+
+    def crear(self, etapa="general", **argumentos):
+        """Crear una respuesta de chat con reintentos ante errores temporales"""
+        try:
+            es_prueba = self.circuito.verificar()
+        except CircuitoAbierto:
+            registro.contar(etapa, "circuito_abierto")
+            raise
+
+        try:
+            return self._crear_con_reintentos(etapa, argumentos)
+        finally:
+            # Si la prueba no llegó al servicio (p. ej. el limitador agotó la espera)
+            # hay que soltar su turno o el circuito quedaría abierto para siempre
+            if es_prueba:
+                self.circuito.liberar_prueba()
+
+    def _crear_con_reintentos(self, etapa, argumentos):
+        argumentos.setdefault("timeout", tiempo_espera_etapa(etapa))
+        tokens = estimar_tokens(argumentos)
+        for intento in range(self.max_reintentos + 1):
+            if self.limitador.adquirir(tokens, tiempo_maximo=argumentos["timeout"]) > 0:
+                registro.contar(etapa, "limitado")
+            try:
+                respuesta = self.cliente.chat.completions.create(**argumentos)
+            except Exception as error:
+                if not es_reintentable(error):
+                    # El servicio respondió (p. ej. 400): no cuenta como caída
+                    self.circuito.registrar_exito()
+                    raise
+                self.circuito.registrar_fallo()
+                if intento == self.max_reintentos or self.circuito.esta_abierto():
+                    raise
+                registro.contar(etapa, "reintento")
+                time.sleep(self.calcular_espera(intento, error))
+                continue
+            self.circuito.registrar_exito()
+            return respuesta
+
+
+def crear_cliente(clave_api, **opciones):
+    """Crear el cliente OpenAI compartido (los reintentos los maneja el envoltorio)"""
+    return ClienteResiliente(OpenAI(api_key=clave_api, max_retries=0), **opciones)
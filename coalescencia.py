@@ -0,0 +1,147 @@
+import hashlib
+import json
+import threading
+from types import SimpleNamespace
+
+from metricas import registro
+
+
+def clave_peticion(argumentos):
+    """Calcular una clave estable para los argumentos de una petición de chat"""
+    # El usuario solo sirve para contabilizar tokens: no impide compartir la llamada
+    relevantes = {nombre: valor for nombre, valor in argumentos.items() if nombre not in ("timeout", "usuario")}
+    serializado = json.dumps(relevantes, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+class _VueloEnCurso:
+    """Petición compartida: guarda los chunks recibidos para todos los suscriptores"""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.error_inicial = None
+        self.resultado = None
+        # Lectores del stream; si todos lo abandonan a medias se corta la petición
+        self.suscriptores = 0
+        self.abandonado = False
+        self._chunks = []
+        self._terminado = False
+        self._error = None
+        self._condicion = threading.Condition()
+
+    def agregar(self, chunk):
+        with self._condicion:
+            self._chunks.append(chunk)
+            self._condicion.notify_all()
+
+    def finalizar(self, error=None):
+        with self._condicion:
+            self._terminado = True
+            self._error = error
+            self._condicion.notify_all()
+
+    def iterar(self):
+        """Reproducir los chunks desde el inicio y esperar los que falten"""
+        indice = 0
+        while True:
+            with self._condicion:
+                while indice >= len(self._chunks) and not self._terminado:
+                    self._condicion.wait()
+                if indice < len(self._chunks):
+                    chunk = self._chunks[indice]
+                    indice += 1
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            yield chunk
+
+
+class ClienteVueloUnico:
+    """Compartir una sola llamada a la API entre peticiones idénticas que están en curso
+
+    Cuando varias sesiones piden exactamente lo mismo a la vez (misma foto, mismo
+    prompt), solo la primera llega a la API; las demás reciben el mismo stream.
+    Si todos los que leen un stream lo cierran antes del final (p. ej. una
+    generación anticipada cancelada), se cierra también el stream de la API.
+    """
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self._en_curso = {}
+        self._candado = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.crear))
+
+    def crear(self, etapa="general", **argumentos):
+        """Crear una respuesta de chat, uniéndose a una petición idéntica si ya existe"""
+        clave = clave_peticion(argumentos)
+        with self._candado:
+            vuelo = self._en_curso.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = _VueloEnCurso()
+                self._en_curso[clave] = vuelo
+            vuelo.suscriptores += 1
+
+        if lider:
+            threading.Thread(
+                target=self._ejecutar, args=(clave, vuelo, etapa, argumentos), daemon=True
+            ).start()
+        else:
+            registro.contar(etapa, "coalescida")
+
+        vuelo.listo.wait()
+        if vuelo.error_inicial is not None:
+            raise vuelo.error_inicial
+        if not argumentos.get("stream"):
+            return vuelo.resultado
+        return self._leer(clave, vuelo)
+
+    def _leer(self, clave, vuelo):
+        try:
+            yield from vuelo.iterar()
+        except GeneratorExit:
+            self._abandonar(clave, vuelo)
+            raise
+
+    def _abandonar(self, clave, vuelo):
+        """Descontar un lector que cerró el stream; sin lectores se deja de pedir"""
+        with self._candado:
+            vuelo.suscriptores -= 1
+            if vuelo.suscriptores > 0:
+                return
+            vuelo.abandonado = True
+            # Las peticiones idénticas que lleguen desde ahora empiezan otra llamada
+            if self._en_curso.get(clave) is vuelo:
+                del self._en_curso[clave]
+
+    def _ejecutar(self, clave, vuelo, etapa, argumentos):
+        try:
+            try:
+                respuesta = self.cliente.chat.completions.create(etapa=etapa, **argumentos)
+            except Exception as error:
+                vuelo.error_inicial = error
+                return
+            if not argumentos.get("stream"):
+                vuelo.resultado = respuesta
+                return
+
+            vuelo.listo.set()
+            try:
+                for chunk in respuesta:
+                    if vuelo.abandonado:
+                        # Nadie lee ya este stream: cerrar la conexión en lugar de pagar el resto
+                        registro.contar(etapa, "abandonada")
+                        getattr(respuesta, "close", lambda: None)()
+                        break
+                    vuelo.agregar(chunk)
+            except Exception as error:
+                vuelo.finalizar(error)
+            else:
+                vuelo.finalizar()
+        finally:
+            vuelo.listo.set()
+            with self._candado:
+                # Si el vuelo fue abandonado, la clave puede ser ya de otro vuelo más nuevo
+                if self._en_curso.get(clave) is vuelo:
+                    del self._en_curso[clave]
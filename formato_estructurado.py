@@ -0,0 +1,102 @@
+import json
+
+
+class RespuestaEstructuradaInvalida(ValueError):
+    """La respuesta del modo estructurado no es un JSON completo con el formato esperado"""
+
+
+def _esquema(nombre, propiedades):
+    """Construir un response_format json_schema estricto con un objeto raíz"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": nombre,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": propiedades,
+                "required": list(propiedades),
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+def _objeto(propiedades):
+    return {
+        "type": "object",
+        "properties": propiedades,
+        "required": list(propiedades),
+        "additionalProperties": False
+    }
+
+
+_LISTA_TEXTO = {"type": "array", "items": {"type": "string"}}
+
+ESQUEMA_INGREDIENTES = _esquema("ingredientes", {"ingredientes": _LISTA_TEXTO})
+
+ESQUEMA_RECETAS = _esquema("recetas", {
+    "recetas": {
+        "type": "array",
+        "items": _objeto({
+            "nombre": {"type": "string"},
+            "ingredientes": _LISTA_TEXTO,
+            "pasos": _LISTA_TEXTO,
+            "minutos": {"type": "integer"}
+        })
+    }
+})
+
+ESQUEMA_SUGERENCIAS = _esquema("sugerencias", {
+    "sugerencias": {
+        "type": "array",
+        "items": _objeto({
+            "ingrediente": {"type": "string"},
+            "razon": {"type": "string"}
+        })
+    }
+})
+
+
+def renderizar_ingredientes(datos):
+    """Convertir {"ingredientes": [...]} en lista markdown con viñetas"""
+    return "\n".join(f"- {nombre}" for nombre in datos.get("ingredientes", []))
+
+
+def renderizar_recetas(datos):
+    """Convertir {"recetas": [...]} en markdown con encabezados por receta"""
+    bloques = []
+    for receta in datos.get("recetas", []):
+        lineas = [f"### {receta.get('nombre', 'Receta')}"]
+        if receta.get("minutos"):
+            lineas.append(f"⏱️ **Tiempo aproximado:** {receta['minutos']} minutos")
+        lineas.append("")
+        lineas.append("**Ingredientes:**")
+        lineas.extend(f"- {ingrediente}" for ingrediente in receta.get("ingredientes", []))
+        lineas.append("")
+        lineas.append("**Instrucciones:**")
+        lineas.extend(f"{i}. {paso}" for i, paso in enumerate(receta.get("pasos", []), start=1))
+        bloques.append("\n".join(lineas))
+    return "\n\n".join(bloques)
+
+
+def renderizar_sugerencias(datos):
+    """Convertir {"sugerencias": [...]} en lista markdown con su razón"""
+    return "\n".join(
+        f"- **{sugerencia.get('ingrediente', '')}**: {sugerencia.get('razon', '')}"
+        for sugerencia in datos.get("sugerencias", [])
+    )
+
+
+def renderizar_al_terminar(fragmentos, renderizar):
+    """Consumir los fragmentos JSON y emitir una sola vez el markdown renderizado"""
+    texto = "".join(fragmentos)
+    if not texto:
+        return
+    try:
+        markdown = renderizar(json.loads(texto))
+    except (ValueError, AttributeError, KeyError, TypeError) as error:
+        # Típicamente una respuesta cortada por max_tokens
+        raise RespuestaEstructuradaInvalida(
+            f"La respuesta JSON llegó incompleta o con otro formato ({len(texto)} caracteres)") from error
+    yield markdown
@@ -0,0 +1,153 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from matplotlib import style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from metricas import medir
+
+FONDO = "#2b2b2b"
+COLOR_VACIO = "#1e1e1e"
+TITULOS_DONUTS = ("💤 Sueño", "💧 Agua", "🏃 Ejercicio", "📚 Estudio")
+
+# (clave en los datos del periodo, leyenda, color, escala de la barra)
+SERIES_PERIODO = (
+    ("sueno", "💤 Sueño", "#3b82f6", 1.0),
+    ("agua", "💧 Agua", "#10b981", 1.0),
+    ("estres", "😰 Estrés", "#ef4444", 0.5),
+    ("estudio", "📚 Estudio", "#f59e0b", 1.0),
+)
+# Grupos de barras que caben en la gráfica (7 días, 5 semanas o 12 meses)
+MAX_GRUPOS = 12
+ANCHO_BARRA = 0.2
+
+
+def huella(datos):
+    """Hash estable de los datos que muestra una gráfica"""
+    serializado = json.dumps(datos, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+class GraficasDashboard:
+    """Gráficas del dashboard creadas una sola vez y actualizadas en su lugar
+
+    Las figuras se dibujan con Agg, fuera de Tk: al actualizar solo se cambian
+    los ángulos de los donuts, la altura de las barras y los textos, sin volver
+    a crear ejes ni calcular el layout. Cada imagen resultante se guarda por la
+    huella de sus datos, así que volver a mostrar los mismos datos (iniciar
+    sesión otra vez, guardar sin cambios) no vuelve a rasterizar nada.
+    `convertir` transforma la imagen PIL antes de guardarla (p. ej. a CTkImage).
+    """
+
+    def __init__(self, titulos=TITULOS_DONUTS, dpi=100, max_imagenes=16, convertir=None):
+        self.max_imagenes = max_imagenes
+        self.convertir = convertir or (lambda imagen: imagen)
+        self.aciertos = 0
+        self.fallos = 0
+        self._imagenes = OrderedDict()
+        # El estilo oscuro se aplica solo a estas figuras, no a todo matplotlib
+        with style.context("dark_background"):
+            self._crear_donuts(titulos, dpi)
+            self._crear_periodo(dpi)
+
+    def _crear_donuts(self, titulos, dpi):
+        self.figura_donuts = Figure(figsize=(11.5, 3), dpi=dpi, facecolor=FONDO)
+        FigureCanvasAgg(self.figura_donuts)
+        self._donuts = []
+        for i, titulo in enumerate(titulos):
+            ax = self.figura_donuts.add_subplot(1, len(titulos), i + 1)
+            cunas, _ = ax.pie([0, 100], colors=[COLOR_VACIO, COLOR_VACIO], startangle=90,
+                              wedgeprops=dict(width=0.4, edgecolor=FONDO, linewidth=2))
+            texto_porcentaje = ax.text(0, 0.15, "", ha="center", va="center",
+                                       fontsize=20, fontweight="bold", color="white")
+            texto_valor = ax.text(0, -0.15, "", ha="center", va="center", fontsize=10, color="gray")
+            ax.set_title(titulo, fontsize=11, fontweight="bold", pad=10)
+            self._donuts.append((cunas, texto_porcentaje, texto_valor))
+        self.figura_donuts.tight_layout(pad=2)
+
+    def _crear_periodo(self, dpi):
+        self.figura_periodo = Figure(figsize=(11, 2.5), dpi=dpi, facecolor=FONDO)
+        FigureCanvasAgg(self.figura_periodo)
+        ax = self.figura_periodo.add_subplot(111)
+        self._barras = []
+        for j, (clave, leyenda, color, escala) in enumerate(SERIES_PERIODO):
+            desplazamiento = (j - (len(SERIES_PERIODO) - 1) / 2) * ANCHO_BARRA
+            barras = ax.bar([i + desplazamiento for i in range(MAX_GRUPOS)], [0] * MAX_GRUPOS, ANCHO_BARRA,
+                            label=leyenda, color=color, alpha=0.8)
+            self._barras.append((clave, escala, barras))
+        ax.set_xticks(range(MAX_GRUPOS))
+        ax.legend(loc="upper left", fontsize=9, ncol=len(SERIES_PERIODO))
+        ax.set_ylabel("Valores", fontsize=10)
+        ax.grid(True, alpha=0.2, axis="y")
+        ax.set_ylim(0, 12)
+        self._ax_periodo = ax
+        self.figura_periodo.tight_layout()
+
+    def _rasterizar(self, figura):
+        figura.canvas.draw()
+        ancho, alto = figura.canvas.get_width_height()
+        # Copiar: Agg reutiliza el mismo buffer en el siguiente dibujo
+        return Image.frombuffer("RGBA", (ancho, alto), figura.canvas.buffer_rgba(), "raw", "RGBA", 0, 1).copy()
+
+    def _cacheada(self, datos, dibujar):
+        clave = huella(datos)
+        if clave in self._imagenes:
+            self._imagenes.move_to_end(clave)
+            self.aciertos += 1
+            return self._imagenes[clave]
+        self.fallos += 1
+        imagen = self.convertir(dibujar())
+        self._imagenes[clave] = imagen
+        while len(self._imagenes) > self.max_imagenes:
+            self._imagenes.popitem(last=False)
+        return imagen
+
+    def imagen_donuts(self, metricas):
+        """Imagen de los donuts de hoy; `metricas` es una lista de (porcentaje, texto, color)"""
+        return self._cacheada(["donuts", metricas], lambda: self._dibujar_donuts(metricas))
+
+    def _dibujar_donuts(self, metricas):
+        with medir("escritorio_dashboard", "donuts"):
+            for (cunas, texto_porcentaje, texto_valor), (porcentaje, texto, color) in zip(self._donuts, metricas):
+                avance, resto = cunas
+                angulo = 90 + 3.6 * porcentaje
+                avance.set_theta1(90)
+                avance.set_theta2(angulo)
+                avance.set_facecolor(color)
+                resto.set_theta1(angulo)
+                resto.set_theta2(450)
+                texto_porcentaje.set_text(f"{porcentaje}%")
+                texto_valor.set_text(texto)
+            return self._rasterizar(self.figura_donuts)
+
+    def imagen_periodo(self, datos_periodo):
+        """Imagen de las barras de un periodo a partir de `SerieDiaria.agrupar`"""
+        datos = {clave: datos_periodo[clave] for clave in ("fechas_cortas",) + tuple(s[0] for s in SERIES_PERIODO)}
+        return self._cacheada(["periodo", datos], lambda: self._dibujar_periodo(datos))
+
+    def _dibujar_periodo(self, datos):
+        with medir("escritorio_dashboard", "periodo"):
+            etiquetas = datos["fechas_cortas"][-MAX_GRUPOS:]
+            for clave, escala, barras in self._barras:
+                valores = datos[clave][-MAX_GRUPOS:]
+                for i, barra in enumerate(barras):
+                    # Solo se muestran los grupos con registro, juntos a la izquierda
+                    barra.set_visible(i < len(etiquetas))
+                    barra.set_height(valores[i] * escala if i < len(etiquetas) else 0)
+            self._ax_periodo.set_xticks(range(len(etiquetas)))
+            self._ax_periodo.set_xticklabels(etiquetas)
+            self._ax_periodo.set_xlim(-0.5, max(len(etiquetas), 1) - 0.5)
+            return self._rasterizar(self.figura_periodo)
+
+    def estadisticas(self):
+        """Obtener contadores de aciertos y fallos de la cache de imágenes"""
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "imagenes": len(self._imagenes),
+            "tasa_aciertos": self.aciertos / total if total else 0.0
+        }
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Índice por defecto de hashes de fotos ya analizadas
+RUTA_INDICE_PERCEPTUAL = os.path.join(".cache", "hashes_perceptuales.json")
+
+# Distancia de Hamming máxima (de 64 bits) para considerar dos fotos casi iguales
+UMBRAL_HAMMING = 8
+
+
+def _matriz_dct(n):
+    """Matriz de la DCT-II ortonormal de tamaño n x n"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matriz = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matriz[0, :] = np.sqrt(1.0 / n)
+    return matriz
+
+
+_DCT_32 = _matriz_dct(32)
+
+
+def _bits_a_entero(bits):
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def calcular_phash(imagen):
+    """pHash de 64 bits: signo de las frecuencias bajas de la DCT respecto a su mediana"""
+    gris = np.asarray(imagen.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    frecuencias = (_DCT_32 @ gris @ _DCT_32.T)[:8, :8]
+    # El componente DC (brillo promedio) no entra en la mediana para tolerar cambios de exposición
+    mediana = np.median(frecuencias.ravel()[1:])
+    return _bits_a_entero(frecuencias > mediana)
+
+
+def calcular_dhash(imagen):
+    """dHash de 64 bits: gradiente horizontal de una miniatura de 9x8"""
+    gris = np.asarray(imagen.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_a_entero(gris[:, 1:] > gris[:, :-1])
+
+
+ALGORITMOS = {"phash": calcular_phash, "dhash": calcular_dhash}
+
+
+class IndicePerceptual:
+    """Índice de hashes perceptuales de fotos ya analizadas, persistido en JSON"""
+
+    def __init__(self, ruta=RUTA_INDICE_PERCEPTUAL, algoritmo="phash", max_entradas=5000):
+        self.ruta = ruta
+        self.calcular_hash = ALGORITMOS[algoritmo]
+        self.max_entradas = max_entradas
+        self._entradas = []
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._candado = threading.Lock()
+        if ruta:
+            self._cargar()
+
+    def _cargar(self):
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                self._entradas = [tuple(entrada) for entrada in json.load(f)][-self.max_entradas:]
+        except (OSError, ValueError):
+            self._entradas = []
+        self._reconstruir()
+
+    def _reconstruir(self):
+        self._hashes = np.array([int(h, 16) for h, _, _ in self._entradas], dtype=np.uint64)
+
+    def _persistir(self):
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        try:
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(self._entradas, f)
+            os.replace(temporal, self.ruta)
+        except OSError:
+            pass
+
+    def buscar(self, hash_imagen, espacio, umbral=UMBRAL_HAMMING):
+        """Buscar la entrada más cercana del mismo espacio; devuelve (clave, distancia) o None"""
+        with self._candado:
+            if not len(self._hashes):
+                return None
+            diferencias = self._hashes ^ np.uint64(hash_imagen)
+            distancias = np.unpackbits(diferencias.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+            mejor = None
+            for indice in np.argsort(distancias, kind="stable"):
+                if distancias[indice] > umbral:
+                    break
+                _, espacio_entrada, clave = self._entradas[indice]
+                if espacio_entrada == espacio:
+                    mejor = (clave, int(distancias[indice]))
+                    break
+            return mejor
+
+    def agregar(self, hash_imagen, espacio, clave):
+        """Registrar el hash de una foto analizada junto con la clave de su análisis"""
+        with self._candado:
+            self._entradas.append((f"{hash_imagen:016x}", espacio, clave))
+            self._entradas = self._entradas[-self.max_entradas:]
+            self._reconstruir()
+            if self.ruta:
+                self._persistir()
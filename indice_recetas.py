@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from ingredientes import conjunto_canonico, extraer_ingredientes, normalizar_ingrediente
+
+# Índice por defecto de recetas ya generadas
+RUTA_INDICE_RECETAS = os.path.join(".cache", "indice_recetas.json")
+
+# Ingredientes de despensa que se suponen disponibles aunque no salgan en la foto
+BASICOS = {"sal", "pimienta", "aceite", "aceite de oliva", "aceite vegetal", "agua", "azucar"}
+
+# Palabras que no distinguen un ingrediente de otro
+_VACIAS = {"de", "del", "la", "el", "los", "las", "con", "y", "en", "al", "a", "o", "u", "gusto"}
+
+_ENCABEZADO = re.compile(r"^\s*#{1,6}\s+(.+)$")
+_ENCABEZADO_NEGRITA = re.compile(r"^\s*(?:\d+[.)]\s*)?\*\*([^*]+)\*\*\s*:?\s*$")
+_CANTIDAD = re.compile(
+    r"^(?:\d+\s*)+(?:(?:g|gr|gramos?|kg|kilos?|ml|l|litros?|tazas?|cucharadas?|cucharaditas?|"
+    r"piezas?|unidades?|dientes?|rebanadas?|latas?|pizcas?|manojos?)\s+)?(?:de\s+)?"
+)
+_SECCIONES_FIN = ("instrucciones", "preparacion", "pasos", "procedimiento", "modo de preparacion", "tiempo")
+
+
+def _normalizar_linea(linea):
+    return normalizar_ingrediente(linea.replace("*", " ").replace("#", " "))
+
+
+def _es_encabezado_receta(linea):
+    """Devolver el nombre si la línea abre una receta (y no una sección de la receta)"""
+    coincidencia = _ENCABEZADO.match(linea) or _ENCABEZADO_NEGRITA.match(linea)
+    if not coincidencia:
+        return None
+    normalizada = _normalizar_linea(coincidencia.group(1))
+    if normalizada.startswith(("ingredientes",) + _SECCIONES_FIN):
+        return None
+    return re.sub(r"^\d+[.)]\s*", "", coincidencia.group(1).replace("**", "").strip())
+
+
+def limpiar_ingrediente(nombre):
+    """Normalizar un ingrediente de receta quitando cantidades y unidades"""
+    normalizado = _CANTIDAD.sub("", normalizar_ingrediente(nombre))
+    return re.sub(r"\s+al gusto$", "", normalizado).strip()
+
+
+def palabras_clave(ingrediente):
+    """Palabras significativas de un ingrediente, sin plural"""
+    palabras = set()
+    for palabra in ingrediente.split():
+        if palabra in _VACIAS or palabra.isdigit():
+            continue
+        if len(palabra) > 3 and palabra.endswith("es"):
+            palabra = palabra[:-2]
+        elif len(palabra) > 3 and palabra.endswith("s"):
+            palabra = palabra[:-1]
+        palabras.add(palabra)
+    return frozenset(palabras)
+
+
+_PALABRAS_BASICAS = frozenset().union(*(palabras_clave(basico) for basico in BASICOS))
+
+
+def es_basico(ingrediente):
+    """Ingrediente de despensa ("sal y pimienta", "aceite de oliva")"""
+    palabras = palabras_clave(ingrediente)
+    return bool(palabras) and palabras <= _PALABRAS_BASICAS
+
+
+def _ingredientes_de_bloque(lineas):
+    """Extraer los ingredientes de la sección "Ingredientes" de una receta"""
+    seccion = []
+    dentro = False
+    for linea in lineas:
+        normalizada = _normalizar_linea(linea)
+        if normalizada.startswith("ingredientes"):
+            dentro = True
+            # Ingredientes en la misma línea: "**Ingredientes:** pollo, cebolla"
+            resto = linea.split(":", 1)[1] if ":" in linea else ""
+            resto = resto.replace("*", "").strip()
+            if resto:
+                seccion.extend(parte for parte in resto.split(",") if parte.strip())
+            continue
+        if dentro and normalizada.startswith(_SECCIONES_FIN):
+            break
+        if dentro:
+            seccion.append(linea)
+    nombres = extraer_ingredientes("\n".join(seccion)) if seccion else []
+    limpios = {limpiar_ingrediente(nombre) for nombre in nombres}
+    limpios.discard("")
+    return tuple(sorted(limpios))
+
+
+def dividir_recetas(texto):
+    """Separar el markdown de recetas en bloques (nombre, ingredientes, texto)"""
+    bloques = []
+    actual = None
+    for linea in texto.splitlines():
+        nombre = _es_encabezado_receta(linea)
+        if nombre is not None:
+            actual = {"nombre": nombre, "lineas": [linea]}
+            bloques.append(actual)
+        elif actual is not None:
+            actual["lineas"].append(linea)
+
+    recetas = []
+    for bloque in bloques:
+        ingredientes = _ingredientes_de_bloque(bloque["lineas"][1:])
+        if ingredientes:
+            recetas.append({
+                "nombre": bloque["nombre"],
+                "ingredientes": ingredientes,
+                "texto": "\n".join(bloque["lineas"]).strip()
+            })
+    return recetas
+
+
+class IndiceRecetas:
+    """Recetas ya generadas con un índice invertido de ingrediente a receta, persistidas en JSON
+
+    Permite responder sin llamar al modelo cuando las recetas guardadas se pueden
+    preparar casi por completo con los ingredientes detectados.
+    """
+
+    def __init__(self, ruta=RUTA_INDICE_RECETAS, max_recetas=2000):
+        self.ruta = ruta
+        self.max_recetas = max_recetas
+        self.aciertos = 0
+        self.fallos = 0
+        self._recetas = OrderedDict()
+        self._por_palabra = {}
+        self._candado = threading.Lock()
+        if ruta:
+            self._cargar()
+
+    def _cargar(self):
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                guardadas = json.load(f)
+        except (OSError, ValueError):
+            return
+        for receta in guardadas[-self.max_recetas:]:
+            receta["ingredientes"] = tuple(receta["ingredientes"])
+            self._recetas[receta["id"]] = receta
+        self._reconstruir()
+
+    def _reconstruir(self):
+        self._por_palabra = {}
+        for identificador, receta in self._recetas.items():
+            self._indexar(identificador, receta)
+
+    def _indexar(self, identificador, receta):
+        for ingrediente in receta["ingredientes"]:
+            for palabra in palabras_clave(ingrediente):
+                self._por_palabra.setdefault(palabra, set()).add(identificador)
+
+    def _persistir(self):
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        try:
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(list(self._recetas.values()), f, ensure_ascii=False)
+            os.replace(temporal, self.ruta)
+        except OSError:
+            pass
+
+    def agregar_texto(self, texto):
+        """Separar la respuesta del modelo en recetas e indexarlas; devuelve cuántas se guardaron"""
+        recetas = dividir_recetas(texto)
+        if not recetas:
+            return 0
+        with self._candado:
+            for receta in recetas:
+                nombre = normalizar_ingrediente(receta["nombre"])
+                contenido = "\0".join((nombre,) + receta["ingredientes"])
+                identificador = hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:16]
+                receta["id"] = identificador
+                self._recetas[identificador] = receta
+                self._recetas.move_to_end(identificador)
+            while len(self._recetas) > self.max_recetas:
+                self._recetas.popitem(last=False)
+            self._reconstruir()
+            if self.ruta:
+                self._persistir()
+        return len(recetas)
+
+    @staticmethod
+    def cobertura(receta, disponibles):
+        """Fracción de los ingredientes de la receta que están disponibles (0 a 1)"""
+        necesarios = [ingrediente for ingrediente in receta["ingredientes"] if not es_basico(ingrediente)]
+        if not necesarios:
+            return 0.0
+        cubiertos = 0
+        for ingrediente in necesarios:
+            palabras = palabras_clave(ingrediente)
+            # Solo lo específico cubre lo genérico: "tortillas de maíz" cubre "tortillas",
+            # pero "pollo" no cubre "caldo de pollo" ni "leche" a "leche de coco"
+            if ingrediente in disponibles or any(
+                    palabras and palabras <= otras
+                    for otras in disponibles.values() if otras):
+                cubiertos += 1
+        return cubiertos / len(necesarios)
+
+    def buscar(self, ingredientes, minimo_recetas=3, cobertura_minima=0.85):
+        """Buscar recetas guardadas que se puedan hacer con los ingredientes
+
+        Devuelve una lista de (cobertura, receta) o None si no hay suficientes.
+        """
+        disponibles = {
+            limpiar_ingrediente(nombre): palabras_clave(limpiar_ingrediente(nombre))
+            for nombre in conjunto_canonico(ingredientes)
+        }
+        with self._candado:
+            candidatos = set()
+            for palabras in disponibles.values():
+                for palabra in palabras:
+                    candidatos |= self._por_palabra.get(palabra, set())
+
+            puntuadas = []
+            for identificador in candidatos:
+                receta = self._recetas[identificador]
+                cobertura = self.cobertura(receta, disponibles)
+                if cobertura >= cobertura_minima:
+                    usados = len(receta["ingredientes"])
+                    puntuadas.append((cobertura, usados, identificador))
+            puntuadas.sort(reverse=True)
+
+            elegidas = []
+            nombres = set()
+            for cobertura, _, identificador in puntuadas:
+                receta = self._recetas[identificador]
+                nombre = normalizar_ingrediente(receta["nombre"])
+                if nombre in nombres:
+                    continue
+                nombres.add(nombre)
+                elegidas.append((cobertura, receta))
+                if len(elegidas) == minimo_recetas:
+                    break
+
+            if len(elegidas) < minimo_recetas:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            for _, receta in elegidas:
+                self._recetas.move_to_end(receta["id"])
+            return elegidas
+
+    def estadisticas(self):
+        """Obtener contadores de aciertos y fallos"""
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "recetas": len(self._recetas),
+            "tasa_aciertos": self.aciertos / total if total else 0.0
+        }
+
+
+def componer_texto(elegidas):
+    """Unir las recetas elegidas del índice en un solo markdown"""
+    return "\n\n".join(receta["texto"] for _, receta in elegidas)
+
+
+def nombres_recetas(texto):
+    """Nombres de las recetas de una respuesta, para el historial"""
+    return [receta["nombre"] for receta in dividir_recetas(texto)]
@@ -0,0 +1,44 @@
+import re
+import unicodedata
+
+# Viñetas y numeración al inicio de cada línea ("-", "*", "•", "1.", "2)")
+_VINETA = re.compile(r"^\s*(?:[-*•+]|\d+[.)])\s+")
+_PARENTESIS = re.compile(r"\([^)]*\)")
+_NO_PALABRA = re.compile(r"[^\w\s]")
+
+
+def quitar_acentos(texto):
+    """Quitar acentos y diacríticos conservando la ñ"""
+    texto = texto.replace("ñ", "\0").replace("Ñ", "\0")
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return sin_acentos.replace("\0", "ñ")
+
+
+def normalizar_ingrediente(nombre):
+    """Normalizar un nombre de ingrediente: minúsculas, sin acentos ni formato"""
+    nombre = _PARENTESIS.sub(" ", nombre)
+    nombre = quitar_acentos(nombre.lower())
+    nombre = _NO_PALABRA.sub(" ", nombre)
+    return " ".join(nombre.split())
+
+
+def extraer_ingredientes(texto):
+    """Extraer los nombres de una lista con viñetas (o separada por comas)"""
+    lineas = [linea for linea in texto.splitlines() if linea.strip()]
+    con_vineta = [linea for linea in lineas if _VINETA.match(linea)]
+    if con_vineta:
+        # Ignorar frases introductorias como "Estos son los ingredientes:"
+        return [_VINETA.sub("", linea) for linea in con_vineta]
+
+    nombres = []
+    for linea in lineas:
+        nombres.extend(parte for parte in linea.split(",") if parte.strip())
+    return nombres
+
+
+def conjunto_canonico(texto):
+    """Obtener la tupla ordenada y sin duplicados de ingredientes normalizados"""
+    normalizados = {normalizar_ingrediente(nombre) for nombre in extraer_ingredientes(texto)}
+    normalizados.discard("")
+    return tuple(sorted(normalizados))
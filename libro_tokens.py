@@ -0,0 +1,127 @@
+"""Libro de uso de tokens por llamada al modelo
+
+Cada llamada de ambas apps (a través de la pasarela) agrega una línea JSONL con
+los tokens de prompt, los tokens de prompt servidos desde la cache de prefijos
+del proveedor y los tokens de salida. Para ver los totales:
+
+    python libro_tokens.py --por etapa
+    python libro_tokens.py --por usuario
+    python libro_tokens.py --por dia
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import date
+
+# Archivo JSONL por defecto; LIBRO_TOKENS_JSONL="" desactiva la escritura
+RUTA_LIBRO = os.getenv("LIBRO_TOKENS_JSONL", os.path.join(".cache", "uso_tokens.jsonl"))
+
+DIMENSIONES = ("etapa", "usuario", "dia", "modelo")
+
+
+def leer_uso(uso):
+    """Extraer (prompt, cacheados, salida) del objeto usage de la API"""
+    detalles = getattr(uso, "prompt_tokens_details", None)
+    return (
+        getattr(uso, "prompt_tokens", 0) or 0,
+        getattr(detalles, "cached_tokens", 0) or 0,
+        getattr(uso, "completion_tokens", 0) or 0,
+    )
+
+
+class LibroTokens:
+    """Acumular el uso de tokens por etapa, usuario, día y modelo, y escribirlo en JSONL"""
+
+    def __init__(self, ruta=RUTA_LIBRO):
+        self.ruta = ruta
+        self._totales = {dimension: {} for dimension in DIMENSIONES}
+        self._candado = threading.Lock()
+
+    def registrar(self, etapa, modelo, uso, usuario=None):
+        """Registrar el uso reportado por la API para una llamada"""
+        if uso is None:
+            return
+        prompt, cacheados, salida = leer_uso(uso)
+        entrada = {
+            "ts": round(time.time(), 3),
+            "dia": date.today().isoformat(),
+            "etapa": etapa,
+            "modelo": modelo,
+            "usuario": usuario or "anonimo",
+            "prompt": prompt,
+            "cacheados": cacheados,
+            "salida": salida,
+        }
+        with self._candado:
+            self._acumular(entrada)
+            self._escribir(entrada)
+
+    def _acumular(self, entrada):
+        for dimension in DIMENSIONES:
+            totales = self._totales[dimension].setdefault(
+                entrada[dimension], {"peticiones": 0, "prompt": 0, "cacheados": 0, "salida": 0})
+            totales["peticiones"] += 1
+            totales["prompt"] += entrada["prompt"]
+            totales["cacheados"] += entrada["cacheados"]
+            totales["salida"] += entrada["salida"]
+
+    def _escribir(self, entrada):
+        if not self.ruta:
+            return
+        try:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    def cargar(self):
+        """Acumular las entradas ya escritas en el archivo (p. ej. de ejecuciones anteriores)"""
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                lineas = f.readlines()
+        except OSError:
+            return
+        with self._candado:
+            for linea in lineas:
+                try:
+                    self._acumular(json.loads(linea))
+                except (ValueError, KeyError):
+                    # Línea incompleta de una escritura interrumpida
+                    continue
+
+    def resumen(self, por="etapa"):
+        """Totales agrupados por una dimensión, con la tasa de aciertos de la cache de prefijos"""
+        with self._candado:
+            filas = []
+            for valor, totales in sorted(self._totales[por].items()):
+                fila = {por: valor, **totales}
+                fila["tasa_cache"] = totales["cacheados"] / totales["prompt"] if totales["prompt"] else 0.0
+                filas.append(fila)
+            return filas
+
+
+# Libro compartido por todo el proceso
+libro = LibroTokens()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--por", choices=DIMENSIONES, default="etapa")
+    parser.add_argument("--ruta", default=RUTA_LIBRO or os.path.join(".cache", "uso_tokens.jsonl"))
+    args = parser.parse_args()
+
+    registro = LibroTokens(args.ruta)
+    registro.cargar()
+    print(f"{args.por:<28}{'peticiones':>12}{'prompt':>12}{'cacheados':>12}{'salida':>12}{'cache':>8}")
+    for fila in registro.resumen(args.por):
+        print(f"{fila[args.por]:<28}{fila['peticiones']:>12}{fila['prompt']:>12}"
+              f"{fila['cacheados']:>12}{fila['salida']:>12}{fila['tasa_cache']:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Procesar carpetas de fotos de refrigerador sin interfaz
+
+Detecta ingredientes y genera recetas para cada imagen con un grupo acotado de
+hilos y escribe un resultado JSONL por imagen. Si se interrumpe, al volver a
+ejecutarlo con el mismo archivo de salida se omiten las imágenes ya procesadas.
+
+Uso:
+    python lote.py fotos/ --salida resultados.jsonl --concurrencia 8
+    python lote.py manifiesto.txt --salida resultados.jsonl --sugerencias
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+from PIL import Image
+
+import pipeline_recetas
+from cache_recetas import CacheRecetas
+from cache_vision import CacheVision
+from hash_perceptual import IndicePerceptual
+from indice_recetas import IndiceRecetas
+from pasarela_llm import ClienteDeUsuario, crear_pasarela
+from ingredientes import conjunto_canonico
+
+EXTENSIONES = (".png", ".jpg", ".jpeg")
+
+
+def listar_imagenes(entrada):
+    """Listar las imágenes de una carpeta o de un manifiesto (una ruta por línea)"""
+    if os.path.isdir(entrada):
+        rutas = []
+        for raiz, _, archivos in os.walk(entrada):
+            rutas.extend(os.path.join(raiz, nombre) for nombre in archivos if nombre.lower().endswith(EXTENSIONES))
+        return sorted(rutas)
+
+    base = os.path.dirname(os.path.abspath(entrada))
+    rutas = []
+    with open(entrada, "r", encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea or linea.startswith("#"):
+                continue
+            # Aceptar también manifiestos JSONL con un campo "ruta"
+            ruta = json.loads(linea)["ruta"] if linea.startswith("{") else linea
+            rutas.append(ruta if os.path.isabs(ruta) else os.path.join(base, ruta))
+    return rutas
+
+
+def cargar_procesadas(salida):
+    """Obtener las rutas que ya tienen un resultado exitoso en el archivo de salida"""
+    procesadas = set()
+    if not os.path.exists(salida):
+        return procesadas
+    with open(salida, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                resultado = json.loads(linea)
+            except ValueError:
+                # Línea incompleta de una ejecución interrumpida
+                continue
+            if resultado.get("estado") == "ok":
+                procesadas.add(resultado["ruta"])
+    return procesadas
+
+
+def procesar_imagen(cliente, ruta, cache_vision, cache_recetas, con_sugerencias, estructurado=False, indice=None,
+                    indice_recetas=None):
+    """Ejecutar el pipeline completo para una imagen y devolver el resultado"""
+    inicio = time.perf_counter()
+    resultado = {"ruta": ruta}
+    try:
+        with Image.open(ruta) as imagen:
+            imagen.load()
+            ingredientes = "".join(pipeline_recetas.analizar_imagen(
+                cliente, imagen, cache_vision, estructurado, indice=indice,
+                al_reutilizar=lambda distancia: resultado.update(casi_duplicado=distancia)))
+        resultado["ingredientes"] = ingredientes
+        resultado["ingredientes_canonicos"] = list(conjunto_canonico(ingredientes))
+        resultado["recetas"] = "".join(
+            pipeline_recetas.generar_recetas(cliente, ingredientes, cache_recetas, estructurado, indice_recetas))
+        if con_sugerencias:
+            resultado["sugerencias"] = "".join(
+                pipeline_recetas.sugerir_ingredientes(cliente, ingredientes, cache_recetas, estructurado))
+        resultado["estado"] = "ok"
+    except Exception as error:
+        resultado["estado"] = "error"
+        resultado["error"] = f"{type(error).__name__}: {error}"
+    resultado["segundos"] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("entrada", help="Carpeta de imágenes o manifiesto con una ruta por línea")
+    parser.add_argument("--salida", default="resultados.jsonl")
+    parser.add_argument("--concurrencia", type=int, default=8, help="Imágenes procesadas a la vez")
+    parser.add_argument("--sugerencias", action="store_true", help="Generar también ingredientes sugeridos")
+    parser.add_argument("--estructurado", action="store_true", help="Pedir respuestas JSON compactas")
+    parser.add_argument("--sin-casi-duplicados", action="store_true",
+                        help="Analizar cada foto aunque se parezca a otra ya analizada")
+    parser.add_argument("--sin-indice-recetas", action="store_true",
+                        help="Pedir siempre recetas nuevas al modelo en lugar de reutilizar las guardadas")
+    parser.add_argument("--reintentos", type=int, default=3, help="Reintentos del cliente ante errores de la API")
+    args = parser.parse_args()
+
+    load_dotenv()
+    clave_api = os.getenv("OPENAI_API_KEY")
+    if not clave_api:
+        print("⚠️ Por favor configura tu clave de API de OpenAI (OPENAI_API_KEY)", file=sys.stderr)
+        return 1
+
+    rutas = listar_imagenes(args.entrada)
+    procesadas = cargar_procesadas(args.salida)
+    pendientes = [ruta for ruta in rutas if ruta not in procesadas]
+    print(f"{len(rutas)} imágenes, {len(rutas) - len(pendientes)} ya procesadas, {len(pendientes)} pendientes")
+
+    cliente = ClienteDeUsuario(crear_pasarela(clave_api, max_reintentos=args.reintentos), "lote")
+    cache_vision = CacheVision()
+    cache_recetas = CacheRecetas(ruta=os.path.join(".cache", "recetas.json"))
+    indice = None if args.sin_casi_duplicados else IndicePerceptual()
+    indice_recetas = None if args.sin_indice_recetas else IndiceRecetas()
+
+    exitos = errores = 0
+    inicio = time.perf_counter()
+    with open(args.salida, "a", encoding="utf-8") as salida, \
+            ThreadPoolExecutor(max_workers=args.concurrencia) as grupo:
+        en_curso = set()
+        iterador = iter(pendientes)
+        while True:
+            # Mantener acotada la cola de trabajos para no cargar miles de futuros
+            for ruta in iterador:
+                en_curso.add(grupo.submit(
+                    procesar_imagen, cliente, ruta, cache_vision, cache_recetas,
+                    args.sugerencias, args.estructurado, indice, indice_recetas))
+                if len(en_curso) >= args.concurrencia * 2:
+                    break
+            if not en_curso:
+                break
+
+            terminados, en_curso = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                resultado = futuro.result()
+                salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                salida.flush()
+                if resultado["estado"] == "ok":
+                    exitos += 1
+                else:
+                    errores += 1
+                    print(f"❌ {resultado['ruta']}: {resultado['error']}", file=sys.stderr)
+
+    segundos = time.perf_counter() - inicio
+    print(f"✅ {exitos} correctas, {errores} con error en {segundos:.1f}s")
+    return 0 if not errores else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
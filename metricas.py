@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites (segundos) de los histogramas expuestos en formato Prometheus
+LIMITES_HISTOGRAMA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+# Archivo JSONL por defecto; METRICAS_JSONL="" desactiva la escritura
+RUTA_JSONL = os.getenv("METRICAS_JSONL", os.path.join(".cache", "metricas.jsonl"))
+
+
+class RegistroMetricas:
+    """Acumular tramos de tiempo por etapa y fase, y escribirlos en un archivo JSONL"""
+
+    def __init__(self, ruta_jsonl=RUTA_JSONL):
+        self.ruta_jsonl = ruta_jsonl
+        self._candado = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+        self._tokens = {}
+        self._tokens_por_segundo = {}
+
+    def registrar(self, etapa, fase, segundos, **atributos):
+        """Registrar la duración de una fase de una etapa"""
+        evento = {"ts": round(time.time(), 3), "etapa": etapa, "fase": fase,
+                  "segundos": round(segundos, 6)}
+        evento.update(atributos)
+        with self._candado:
+            cubetas, suma, cantidad = self._histogramas.get((etapa, fase), ([0] * len(LIMITES_HISTOGRAMA), 0.0, 0))
+            for i, limite in enumerate(LIMITES_HISTOGRAMA):
+                if segundos <= limite:
+                    cubetas[i] += 1
+            self._histogramas[(etapa, fase)] = (cubetas, suma + segundos, cantidad + 1)
+
+            if "tokens" in atributos:
+                self._tokens[etapa] = self._tokens.get(etapa, 0) + atributos["tokens"]
+            if "tokens_por_segundo" in atributos:
+                self._tokens_por_segundo[etapa] = atributos["tokens_por_segundo"]
+
+            self._escribir(evento)
+
+    def contar(self, etapa, evento):
+        """Incrementar un contador de eventos (aciertos de cache, errores...)"""
+        with self._candado:
+            self._contadores[(etapa, evento)] = self._contadores.get((etapa, evento), 0) + 1
+            self._escribir({"ts": round(time.time(), 3), "etapa": etapa, "evento": evento})
+
+    def _escribir(self, evento):
+        if not self.ruta_jsonl:
+            return
+        try:
+            directorio = os.path.dirname(self.ruta_jsonl)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            with open(self.ruta_jsonl, "a", encoding="utf-8") as f:
+                f.write(json.dumps(evento, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+
+    def texto_prometheus(self):
+        """Exportar las métricas acumuladas en formato de texto de Prometheus"""
+        lineas = [
+            "# HELP pipeline_fase_segundos Duración de cada fase por etapa del pipeline",
+            "# TYPE pipeline_fase_segundos histogram",
+        ]
+        with self._candado:
+            for (etapa, fase), (cubetas, suma, cantidad) in sorted(self._histogramas.items()):
+                etiquetas = f'etapa="{etapa}",fase="{fase}"'
+                for limite, valor in zip(LIMITES_HISTOGRAMA, cubetas):
+                    lineas.append(f'pipeline_fase_segundos_bucket{{{etiquetas},le="{limite}"}} {valor}')
+                lineas.append(f'pipeline_fase_segundos_bucket{{{etiquetas},le="+Inf"}} {cantidad}')
+                lineas.append(f"pipeline_fase_segundos_sum{{{etiquetas}}} {suma:.6f}")
+                lineas.append(f"pipeline_fase_segundos_count{{{etiquetas}}} {cantidad}")
+
+            lineas.append("# HELP pipeline_tokens_total Tokens de salida recibidos por etapa")
+            lineas.append("# TYPE pipeline_tokens_total counter")
+            for etapa, valor in sorted(self._tokens.items()):
+                lineas.append(f'pipeline_tokens_total{{etapa="{etapa}"}} {valor}')
+
+            lineas.append("# HELP pipeline_tokens_por_segundo Velocidad del último stream por etapa")
+            lineas.append("# TYPE pipeline_tokens_por_segundo gauge")
+            for etapa, valor in sorted(self._tokens_por_segundo.items()):
+                lineas.append(f'pipeline_tokens_por_segundo{{etapa="{etapa}"}} {valor:.3f}')
+
+            lineas.append("# HELP pipeline_eventos_total Eventos por etapa")
+            lineas.append("# TYPE pipeline_eventos_total counter")
+            for (etapa, evento), valor in sorted(self._contadores.items()):
+                lineas.append(f'pipeline_eventos_total{{etapa="{etapa}",evento="{evento}"}} {valor}')
+        return "\n".join(lineas) + "\n"
+
+
+# Registro compartido por todo el proceso
+registro = RegistroMetricas()
+
+
+@contextmanager
+def medir(etapa, fase):
+    """Medir un bloque; los atributos agregados al dict se guardan con el tramo"""
+    atributos = {}
+    inicio = time.perf_counter()
+    try:
+        yield atributos
+    finally:
+        registro.registrar(etapa, fase, time.perf_counter() - inicio, **atributos)
+
+
+def medir_stream(etapa, fragmentos, inicio):
+    """Reemitir fragmentos registrando el tiempo al primer token y los tokens por segundo"""
+    primero = None
+    tokens = 0
+    for fragmento in fragmentos:
+        if primero is None:
+            primero = time.perf_counter()
+            registro.registrar(etapa, "ttft", primero - inicio)
+        tokens += 1
+        yield fragmento
+    fin = time.perf_counter()
+    duracion_stream = fin - primero if primero is not None else 0.0
+    registro.registrar(
+        etapa, "completado", fin - inicio,
+        tokens=tokens,
+        tokens_por_segundo=round(tokens / duracion_stream, 3) if duracion_stream > 0 else 0.0
+    )
+
+
+def registrar_respuesta(etapa, respuesta, inicio):
+    """Registrar una respuesta no streaming usando los tokens reportados por la API"""
+    segundos = time.perf_counter() - inicio
+    uso = getattr(respuesta, "usage", None)
+    tokens = getattr(uso, "completion_tokens", 0) or 0
+    registro.registrar(
+        etapa, "completado", segundos,
+        tokens=tokens,
+        tokens_por_segundo=round(tokens / segundos, 3) if segundos > 0 else 0.0
+    )
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def log_message(self, formato, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        datos = registro.texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+
+def iniciar_servidor_metricas(puerto=None):
+    """Exponer /metrics en 127.0.0.1 si METRICAS_PUERTO (o `puerto`) está definido"""
+    puerto = puerto or os.getenv("METRICAS_PUERTO")
+    if not puerto:
+        return None
+    try:
+        servidor = ThreadingHTTPServer(("127.0.0.1", int(puerto)), _ManejadorMetricas)
+    except OSError:
+        # Otra instancia ya ocupa el puerto
+        return None
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
@@ -0,0 +1,251 @@
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from types import SimpleNamespace
+
+from cliente_resiliente import crear_cliente
+from libro_tokens import libro
+from metricas import registro
+
+Ruta = namedtuple("Ruta", ["modelo", "max_tokens"])
+
+# Modelo y presupuesto de tokens de salida por etapa. Se busca primero la etapa
+# exacta (sin el sufijo "_json") y luego una clave contenida en su nombre.
+# Cada modelo se puede cambiar con MODELO_<ETAPA>, p. ej. MODELO_SUGERENCIAS=gpt-4o
+RUTAS_ETAPA = {
+    "ingredientes": Ruta("gpt-4o", 500),
+    "recetas": Ruta("gpt-4o", 1500),
+    "sugerencias": Ruta("gpt-4o-mini", 800),
+    "escritorio_ingredientes": Ruta("gpt-4o", 500),
+    "escritorio_recetas": Ruta("gpt-4o", 1000),
+    "escritorio_consejo": Ruta("gpt-4o-mini", 500),
+}
+RUTA_DEFECTO = Ruta("gpt-4o", 1000)
+
+# Peticiones de respaldo: se lanza un duplicado cuando el primer token tarda más
+# que el p95 observado de la etapa (LLM_RESPALDO=0 lo desactiva)
+RESPALDO_ACTIVO = os.getenv("LLM_RESPALDO", "1") != "0"
+MUESTRAS_MINIMAS_RESPALDO = 20
+SEGUNDOS_MINIMOS_RESPALDO = 0.5
+
+# Marca de fin de un intento dentro de la cola compartida
+_FIN = object()
+
+
+def ruta_etapa(etapa):
+    """Obtener el modelo y el máximo de tokens configurados para una etapa"""
+    base = etapa[:-len("_json")] if etapa.endswith("_json") else etapa
+    ruta = RUTAS_ETAPA.get(base)
+    if ruta is None:
+        ruta = next((ruta for clave, ruta in RUTAS_ETAPA.items() if clave in base), RUTA_DEFECTO)
+    modelo = os.getenv(f"MODELO_{base.upper()}")
+    return ruta._replace(modelo=modelo) if modelo else ruta
+
+
+def modelo_etapa(etapa):
+    """Modelo que atiende una etapa (también forma parte de las claves de cache)"""
+    return ruta_etapa(etapa).modelo
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+class PasarelaLLM:
+    """Punto único de llamadas al modelo para ambas apps
+
+    Expone `chat.completions.create(etapa=..., **argumentos)` como el resto de
+    envoltorios: completa `model` y `max_tokens` según la etapa y, cuando el
+    primer token (o la respuesta, sin streaming) tarda más que el p95 observado,
+    lanza una petición duplicada y se queda con la que responda primero.
+    El uso de tokens de cada llamada se anota en el libro con el argumento
+    opcional `usuario` (que no se envía a la API).
+    """
+
+    def __init__(self, cliente, respaldo=RESPALDO_ACTIVO, muestras=200,
+                 muestras_minimas=MUESTRAS_MINIMAS_RESPALDO, segundos_minimos=SEGUNDOS_MINIMOS_RESPALDO,
+                 libro_tokens=libro):
+        self.cliente = cliente
+        self.libro_tokens = libro_tokens
+        self.respaldo = respaldo
+        self.muestras_minimas = muestras_minimas
+        self.segundos_minimos = segundos_minimos
+        self._ttft = {}
+        self._maximo_muestras = muestras
+        self._candado = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.crear))
+
+    def umbral_respaldo(self, etapa):
+        """Segundos tras los que conviene lanzar el duplicado (None si aún no hay datos)"""
+        with self._candado:
+            muestras = list(self._ttft.get(etapa, ()))
+        if not self.respaldo or len(muestras) < self.muestras_minimas:
+            return None
+        return max(self.segundos_minimos, percentil(muestras, 95))
+
+    def _observar(self, etapa, segundos):
+        with self._candado:
+            self._ttft.setdefault(etapa, deque(maxlen=self._maximo_muestras)).append(segundos)
+
+    def crear(self, etapa="general", usuario=None, **argumentos):
+        """Crear una respuesta de chat con el modelo de la etapa"""
+        ruta = ruta_etapa(etapa)
+        argumentos.setdefault("model", ruta.modelo)
+        argumentos.setdefault("max_tokens", ruta.max_tokens)
+        if argumentos.get("stream"):
+            # Pedir el uso de tokens en el último chunk del stream
+            argumentos.setdefault("stream_options", {"include_usage": True})
+
+        umbral = self.umbral_respaldo(etapa)
+        if umbral is None:
+            respuesta = self._sin_respaldo(etapa, argumentos)
+        else:
+            respuesta = self._con_respaldo(etapa, argumentos, umbral)
+
+        if argumentos.get("stream"):
+            return self._anotar_stream(etapa, argumentos["model"], usuario, respuesta)
+        self.libro_tokens.registrar(etapa, argumentos["model"], getattr(respuesta, "usage", None), usuario)
+        return respuesta
+
+    def _anotar_stream(self, etapa, modelo, usuario, stream):
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    self.libro_tokens.registrar(etapa, modelo, chunk.usage, usuario)
+                yield chunk
+        finally:
+            # Quien deja de leer a medias cierra también la conexión de la API
+            getattr(stream, "close", lambda: None)()
+
+    def _sin_respaldo(self, etapa, argumentos):
+        inicio = time.perf_counter()
+        respuesta = self.cliente.chat.completions.create(etapa=etapa, **argumentos)
+        if not argumentos.get("stream"):
+            self._observar(etapa, time.perf_counter() - inicio)
+            return respuesta
+        return self._observar_stream(etapa, respuesta, inicio)
+
+    def _observar_stream(self, etapa, stream, inicio):
+        primero = True
+        try:
+            for chunk in stream:
+                if primero:
+                    self._observar(etapa, time.perf_counter() - inicio)
+                    primero = False
+                yield chunk
+        finally:
+            getattr(stream, "close", lambda: None)()
+
+    def _con_respaldo(self, etapa, argumentos, umbral):
+        inicio = time.perf_counter()
+        cola = queue.Queue()
+        iniciado = threading.Event()
+        errores_iniciales = []
+        cancelados = set()
+
+        def intentar(numero):
+            try:
+                respuesta = self.cliente.chat.completions.create(etapa=etapa, **argumentos)
+                if numero == 0:
+                    iniciado.set()
+                if not argumentos.get("stream"):
+                    cola.put((numero, respuesta))
+                    return
+                for chunk in respuesta:
+                    if numero in cancelados:
+                        # Cerrar la conexión del intento que perdió
+                        getattr(respuesta, "close", lambda: None)()
+                        return
+                    cola.put((numero, chunk))
+            except Exception as error:
+                if numero == 0 and not iniciado.is_set():
+                    errores_iniciales.append(error)
+                cola.put((numero, error))
+            finally:
+                iniciado.set()
+                cola.put((numero, _FIN))
+
+        def lanzar(numero):
+            threading.Thread(target=intentar, args=(numero,), daemon=True).start()
+
+        lanzar(0)
+        if argumentos.get("stream"):
+            # Esperar (a lo sumo hasta el umbral) a que la API acepte la petición para
+            # que los errores inmediatos (400, circuito abierto) se lancen aquí y no al iterar
+            iniciado.wait(umbral)
+            if errores_iniciales:
+                raise errores_iniciales[0]
+
+        def esperar_ganador():
+            activos = {0}
+            respaldo_lanzado = False
+            error = None
+            while True:
+                espera = None if respaldo_lanzado else max(0.0, inicio + umbral - time.perf_counter())
+                try:
+                    numero, elemento = cola.get(timeout=espera)
+                except queue.Empty:
+                    registro.contar(etapa, "respaldo_lanzado")
+                    respaldo_lanzado = True
+                    activos.add(1)
+                    lanzar(1)
+                    continue
+                if elemento is _FIN:
+                    activos.discard(numero)
+                    if not activos:
+                        raise error or RuntimeError("La petición terminó sin respuesta")
+                    continue
+                if isinstance(elemento, Exception):
+                    error = elemento
+                    continue
+                self._observar(etapa, time.perf_counter() - inicio)
+                cancelados.update(activos - {numero})
+                if numero == 1:
+                    registro.contar(etapa, "respaldo_ganador")
+                return numero, elemento
+
+        if not argumentos.get("stream"):
+            return esperar_ganador()[1]
+
+        def reemitir():
+            ganador, primero = esperar_ganador()
+            try:
+                yield primero
+                while True:
+                    numero, elemento = cola.get()
+                    if numero != ganador:
+                        continue
+                    if elemento is _FIN:
+                        return
+                    if isinstance(elemento, Exception):
+                        raise elemento
+                    yield elemento
+            except GeneratorExit:
+                # Cerrado a medias: el hilo del ganador también deja de leer
+                cancelados.add(ganador)
+                raise
+
+        return reemitir()
+
+
+class ClienteDeUsuario:
+    """Anotar el usuario en cada llamada hecha con un cliente compartido"""
+
+    def __init__(self, cliente, usuario):
+        self.cliente = cliente
+        self.usuario = usuario
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.crear))
+
+    def crear(self, etapa="general", **argumentos):
+        argumentos.setdefault("usuario", self.usuario)
+        return self.cliente.chat.completions.create(etapa=etapa, **argumentos)
+
+
+def crear_pasarela(clave_api, **opciones):
+    """Crear la pasarela sobre el cliente resiliente compartido"""
+    return PasarelaLLM(crear_cliente(clave_api, **opciones))
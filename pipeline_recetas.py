@@ -0,0 +1,250 @@
+import hashlib
+import time
+
+from cache_recetas import calcular_clave_recetas
+from cache_vision import calcular_clave_imagen
+from hash_perceptual import UMBRAL_HAMMING
+from indice_recetas import componer_texto
+from formato_estructurado import (
+    ESQUEMA_INGREDIENTES,
+    ESQUEMA_RECETAS,
+    ESQUEMA_SUGERENCIAS,
+    renderizar_al_terminar,
+    renderizar_ingredientes,
+    renderizar_recetas,
+    renderizar_sugerencias,
+)
+from metricas import medir, medir_stream, registro
+from pasarela_llm import modelo_etapa
+from preprocesamiento import preparar_imagen, url_datos
+from streaming import emitir_y_acumular, extraer_texto
+
+# Cambiar la versión al modificar un prompt invalida sus respuestas guardadas
+VERSION_PROMPT_RECETAS = "recetas-v2"
+VERSION_PROMPT_SUGERENCIAS = "sugerencias-v2"
+
+PROMPT_INGREDIENTES = """Analiza esta imagen de un refrigerador o alimentos. 
+                            Lista todos los ingredientes y alimentos que puedas identificar.
+                            Formatea tu respuesta como una lista simple con viñetas con solo los nombres de los ingredientes.
+                            Sé específico pero conciso (ej: 'pechuga de pollo', 'pimiento rojo', 'leche entera').
+                            Solo lista elementos que puedas identificar claramente."""
+
+# Prompts del modo estructurado: piden JSON compacto y el markdown se arma localmente
+PROMPT_INGREDIENTES_JSON = (
+    "Lista los ingredientes y alimentos que identifiques claramente en esta imagen de un refrigerador. "
+    "Nombres específicos pero concisos (ej: 'pechuga de pollo', 'pimiento rojo')."
+)
+
+PROMPT_RECETAS_JSON = (
+    "Eres un asistente chef útil que crea recetas prácticas y deliciosas. "
+    "Sugiere 3 recetas con los ingredientes disponibles que indique el usuario. Para cada una: nombre atractivo, "
+    "ingredientes de la lista, pasos breves y minutos aproximados de cocción."
+)
+
+PROMPT_SUGERENCIAS_JSON = (
+    "Eres un asesor culinario útil. "
+    "Sugiere 5-7 ingredientes adicionales prácticos, de uso común y buena vida útil que complementen "
+    "los ingredientes que indique el usuario y permitan muchas más recetas. Razón en 1 oración."
+)
+
+# Las instrucciones fijas van primero (mensaje de sistema) y la lista de ingredientes
+# al final: así el prefijo de cada petición es idéntico y el proveedor lo puede cachear
+PROMPT_RECETAS = """Eres un asistente chef útil que crea recetas prácticas y deliciosas.
+
+Sugiere 3 recetas que se puedan hacer con los ingredientes disponibles que indique el usuario. Para cada receta:
+1. Dale un nombre atractivo
+2. Lista los ingredientes necesarios (de la lista disponible)
+3. Proporciona instrucciones breves paso a paso
+4. Menciona el tiempo aproximado de cocción
+
+Formatea cada receta claramente con encabezados y hazla fácil de seguir."""
+
+PROMPT_SUGERENCIAS = """Eres un asesor culinario útil.
+
+Sugiere 5-7 ingredientes adicionales que:
+1. Complementen los ingredientes actuales que indique el usuario
+2. Permitan muchas más posibilidades de recetas
+3. Sean prácticos y de uso común
+4. Tengan buena vida útil
+
+Para cada sugerencia, explica brevemente (en 1 oración) por qué es útil."""
+
+def etapa_metricas(etapa, estructurado):
+    """Nombre de la etapa en las métricas, separado por modo para poder compararlos"""
+    return f"{etapa}_json" if estructurado else etapa
+
+def pedir_stream(cliente, etapa, argumentos, estructurado, esquema, renderizar):
+    """Enviar la petición en streaming, medirla y renderizar el JSON si aplica"""
+    if estructurado:
+        argumentos["response_format"] = esquema
+    inicio = time.perf_counter()
+    stream = cliente.chat.completions.create(etapa=etapa, stream=True, **argumentos)
+    registro.registrar(etapa, "envio", time.perf_counter() - inicio)
+    fragmentos = medir_stream(etapa, extraer_texto(stream), inicio)
+    if estructurado:
+        return renderizar_al_terminar(fragmentos, renderizar)
+    return fragmentos
+
+def clave_recetas(ingredientes, estructurado=False):
+    """Clave de las entradas de la etapa de recetas: conjunto canónico, versión del prompt y modelo"""
+    etapa = etapa_metricas("recetas", estructurado)
+    return calcular_clave_recetas(ingredientes, f"{VERSION_PROMPT_RECETAS}-{etapa}-{modelo_etapa(etapa)}")
+
+def clave_sugerencias(ingredientes, estructurado=False):
+    """Clave de las entradas de la etapa de sugerencias: conjunto canónico, versión del prompt y modelo"""
+    etapa = etapa_metricas("sugerencias", estructurado)
+    return calcular_clave_recetas(ingredientes, f"{VERSION_PROMPT_SUGERENCIAS}-{etapa}-{modelo_etapa(etapa)}")
+
+def codificar_imagen(imagen):
+    """Orientar, reducir y codificar imagen PIL como JPEG en base64"""
+    return preparar_imagen(imagen)
+
+def analizar_imagen(cliente, imagen, cache, estructurado=False, indice=None,
+                    umbral=UMBRAL_HAMMING, forzar=False, al_reutilizar=None, al_usar_cache=None):
+    """Usar GPT-4 Vision para identificar ingredientes en la imagen (devuelve fragmentos de texto)
+
+    Con `indice` se reutiliza el análisis de una foto casi igual (distancia de
+    Hamming <= `umbral`) y se llama a `al_reutilizar(distancia)`. Si el texto
+    sale de la cache (exacta o por foto casi igual) se llama a `al_usar_cache()`
+    antes de devolverlo. Con `forzar` se ignoran las caches y se analiza de nuevo.
+    """
+    etapa = etapa_metricas("ingredientes", estructurado)
+    prompt = PROMPT_INGREDIENTES_JSON if estructurado else PROMPT_INGREDIENTES
+    modelo = modelo_etapa(etapa)
+    clave = calcular_clave_imagen(imagen, prompt, modelo)
+    if not forzar:
+        texto_guardado = cache.obtener(clave)
+        if texto_guardado is not None:
+            registro.contar(etapa, "cache_acierto")
+            if al_usar_cache:
+                al_usar_cache()
+            return iter([texto_guardado])
+    
+    espacio = f"{modelo}:{hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]}"
+    hash_imagen = None
+    if indice is not None:
+        with medir(etapa, "hash_perceptual"):
+            hash_imagen = indice.calcular_hash(imagen)
+        similar = None if forzar else indice.buscar(hash_imagen, espacio, umbral)
+        if similar is not None:
+            clave_similar, distancia = similar
+            texto_similar = cache.obtener(clave_similar)
+            if texto_similar is not None:
+                registro.contar(etapa, "casi_duplicado")
+                if al_reutilizar:
+                    al_reutilizar(distancia)
+                if al_usar_cache:
+                    al_usar_cache()
+                return iter([texto_similar])
+    
+    with medir(etapa, "codificacion") as atributos:
+        imagen_preparada = codificar_imagen(imagen)
+        atributos["bytes"] = imagen_preparada.bytes_codificados
+    
+    argumentos = dict(
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": url_datos(imagen_preparada)
+                        }
+                    }
+                ]
+            }
+        ]
+    )
+    fragmentos = pedir_stream(cliente, etapa, argumentos, estructurado, ESQUEMA_INGREDIENTES, renderizar_ingredientes)
+    
+    def guardar(texto):
+        cache.guardar(clave, texto, modelo)
+        if hash_imagen is not None:
+            indice.agregar(hash_imagen, espacio, clave)
+    
+    return emitir_y_acumular(fragmentos, guardar)
+
+def generar_recetas(cliente, ingredientes, cache, estructurado=False, indice=None):
+    """Generar recetas basadas en ingredientes disponibles con streaming
+
+    Con `indice` primero se buscan recetas ya generadas que cubran los
+    ingredientes; el modelo solo se usa si no hay suficientes.
+    """
+    etapa = etapa_metricas("recetas", estructurado)
+    clave = clave_recetas(ingredientes, estructurado)
+    texto_guardado = cache.obtener(clave)
+    if texto_guardado is not None:
+        registro.contar(etapa, "cache_acierto")
+        return iter([texto_guardado])
+    
+    if indice is not None:
+        with medir(etapa, "indice"):
+            elegidas = indice.buscar(ingredientes)
+        if elegidas:
+            registro.contar(etapa, "indice_acierto")
+            return iter([componer_texto(elegidas)])
+    
+    argumentos = dict(
+        messages=[
+            {
+                "role": "system",
+                "content": PROMPT_RECETAS_JSON if estructurado else PROMPT_RECETAS
+            },
+            {
+                "role": "user",
+                "content": f"Ingredientes disponibles:\n\n{ingredientes}"
+            }
+        ]
+    )
+    fragmentos = pedir_stream(cliente, etapa, argumentos, estructurado, ESQUEMA_RECETAS, renderizar_recetas)
+    
+    def guardar(texto):
+        cache.guardar(clave, texto)
+        if indice is not None:
+            indice.agregar_texto(texto)
+    
+    return emitir_y_acumular(fragmentos, guardar)
+
+def reconciliar_recetas(especulacion, ingredientes, cache):
+    """Recetas para la lista final cuando ya se empezó una generación anticipada
+
+    Si la lista final ya está en la cache se descarta la especulación. Si se
+    acepta la especulación, su texto se guarda también con la clave de la
+    lista final, para que la misma foto no vuelva a pedir recetas.
+    """
+    clave = clave_recetas(ingredientes)
+    texto_guardado = cache.obtener(clave)
+    if texto_guardado is not None:
+        especulacion.cancelar()
+        registro.contar("recetas", "cache_acierto")
+        return iter([texto_guardado])
+    return especulacion.reconciliar(ingredientes, al_aceptar=lambda texto: cache.guardar(clave, texto))
+
+def sugerir_ingredientes(cliente, ingredientes_actuales, cache, estructurado=False):
+    """Sugerir ingredientes para comprar para más variedad de recetas con streaming"""
+    etapa = etapa_metricas("sugerencias", estructurado)
+    clave = clave_sugerencias(ingredientes_actuales, estructurado)
+    texto_guardado = cache.obtener(clave)
+    if texto_guardado is not None:
+        registro.contar(etapa, "cache_acierto")
+        return iter([texto_guardado])
+    
+    argumentos = dict(
+        messages=[
+            {
+                "role": "system",
+                "content": PROMPT_SUGERENCIAS_JSON if estructurado else PROMPT_SUGERENCIAS
+            },
+            {
+                "role": "user",
+                "content": f"Ingredientes actuales:\n\n{ingredientes_actuales}"
+            }
+        ]
+    )
+    fragmentos = pedir_stream(cliente, etapa, argumentos, estructurado, ESQUEMA_SUGERENCIAS, renderizar_sugerencias)
+    return emitir_y_acumular(fragmentos, lambda texto: cache.guardar(clave, texto))
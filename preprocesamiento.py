@@ -0,0 +1,81 @@
+import base64
+import time
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# GPT-4o en modo "high" ajusta la imagen a 2048x2048 y luego su lado corto a 768px,
+# así que cualquier resolución mayor solo agrega bytes a la petición
+LADO_MAXIMO = 2048
+LADO_CORTO_MAXIMO = 768
+
+ImagenPreparada = namedtuple(
+    "ImagenPreparada",
+    ["base64", "tipo_mime", "bytes_codificados", "segundos_codificacion", "ancho", "alto"]
+)
+
+TIPOS_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def calcular_tamano_objetivo(ancho, alto, lado_maximo=LADO_MAXIMO, lado_corto_maximo=LADO_CORTO_MAXIMO):
+    """Calcular el tamaño que realmente usa el modelo de visión"""
+    escala = min(1.0, lado_maximo / max(ancho, alto))
+    escala = min(escala, lado_corto_maximo / min(ancho, alto))
+    return max(1, round(ancho * escala)), max(1, round(alto * escala))
+
+
+def preparar_imagen(imagen, formato="JPEG", calidad=85,
+                    lado_maximo=LADO_MAXIMO, lado_corto_maximo=LADO_CORTO_MAXIMO):
+    """Orientar, reducir y codificar una imagen PIL para enviarla al modelo de visión"""
+    inicio = time.perf_counter()
+
+    # Aplicar la orientación EXIF de las fotos tomadas con el teléfono
+    imagen = ImageOps.exif_transpose(imagen)
+
+    tamano = calcular_tamano_objetivo(imagen.width, imagen.height, lado_maximo, lado_corto_maximo)
+    if tamano != imagen.size:
+        imagen = imagen.resize(tamano, Image.LANCZOS)
+
+    if formato in ("JPEG", "WEBP") and imagen.mode not in ("RGB", "L"):
+        imagen = imagen.convert("RGB")
+
+    buffer = BytesIO()
+    if formato == "PNG":
+        imagen.save(buffer, format="PNG")
+    else:
+        imagen.save(buffer, format=formato, quality=calidad, optimize=True)
+    datos = buffer.getvalue()
+
+    return ImagenPreparada(
+        base64=base64.b64encode(datos).decode('utf-8'),
+        tipo_mime=TIPOS_MIME[formato],
+        bytes_codificados=len(datos),
+        segundos_codificacion=time.perf_counter() - inicio,
+        ancho=imagen.width,
+        alto=imagen.height
+    )
+
+
+def url_datos(preparada):
+    """Construir la URL data: que espera el endpoint de chat"""
+    return f"data:{preparada.tipo_mime};base64,{preparada.base64}"
+
+
+def crear_miniatura(datos, lado_maximo=1024, calidad=85):
+    """Decodificar una vista previa reducida de los bytes de una foto y codificarla
+
+    En JPEG se usa el modo draft, que decodifica directamente a 1/2, 1/4 o 1/8
+    de la resolución sin pasar nunca por los pixeles completos.
+    """
+    with Image.open(BytesIO(datos)) as imagen:
+        imagen.draft("RGB", (lado_maximo, lado_maximo))
+        miniatura = ImageOps.exif_transpose(imagen)
+        miniatura.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+
+    buffer = BytesIO()
+    if miniatura.mode in ("RGBA", "LA", "P"):
+        miniatura.save(buffer, format="PNG", optimize=True)
+    else:
+        miniatura.convert("RGB").save(buffer, format="JPEG", quality=calidad)
+    return buffer.getvalue()
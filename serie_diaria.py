@@ -0,0 +1,243 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from almacen_estudiante import CAMPOS_NUMERICOS
+
+# Objetivos diarios (100 %); en las métricas inversas menos es mejor
+OBJETIVOS = {
+    "sueno": 8,      # 8 horas
+    "agua": 8,       # 8 vasos
+    "ejercicio": 30, # 30 min
+    "estudio": 6,    # 6 horas
+    "estres": 10     # 10 es máximo
+}
+INVERSOS = {"estres"}
+
+# Un día cumple la meta con el mismo porcentaje que el dashboard pinta de verde
+UMBRAL_CUMPLIDO = 75
+
+VENTANAS = (7, 30, 90, 365)
+
+# Valor que muestran las barras cuando un día registrado no tiene el campo
+VALORES_FALTANTES = {"estres": 5}
+
+DIAS_CORTOS = ("Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom")
+MESES_CORTOS = ("Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic")
+PERIODOS = ("semana", "mes", "anio")
+
+
+def _a_numero(valor):
+    return np.nan if valor is None else float(valor)
+
+
+def porcentajes_objetivo(valores, campo):
+    """Porcentaje del objetivo (0-100) de cada día, igual que `calcular_porcentaje_metrica`"""
+    proporcion = valores / OBJETIVOS[campo] * 100
+    porcentaje = np.clip(100 - proporcion if campo in INVERSOS else proporcion, 0, 100)
+    # Sin dato o en cero cuenta como 0 %
+    return np.where(np.isnan(valores) | (valores == 0), 0, np.round(porcentaje))
+
+
+class SerieDiaria:
+    """Registros diarios de un usuario en columnas de NumPy indexadas por día
+
+    Cada métrica es un arreglo con un lugar por día desde el primer registro
+    (NaN si no hay dato). Junto a cada una se guardan sumas acumuladas de valor,
+    días con dato y días que cumplen el objetivo, así cualquier promedio o tasa
+    de una ventana sale de dos restas, y guardar un día solo ajusta los
+    acumulados desde ese día en adelante.
+    """
+
+    def __init__(self, registros=None):
+        self.inicio = None
+        self.presente = np.zeros(0, dtype=bool)
+        self.valores = {campo: np.zeros(0) for campo in CAMPOS_NUMERICOS}
+        self._acumulados = {campo: np.zeros((3, 1)) for campo in CAMPOS_NUMERICOS}
+        if registros:
+            self._construir(registros)
+
+    def __len__(self):
+        return len(self.presente)
+
+    def _construir(self, registros):
+        fechas = sorted(registros)
+        self.inicio = date.fromisoformat(fechas[0])
+        dias = (date.fromisoformat(fechas[-1]) - self.inicio).days + 1
+        indices = np.array([(date.fromisoformat(fecha) - self.inicio).days for fecha in fechas])
+        self.presente = np.zeros(dias, dtype=bool)
+        self.presente[indices] = True
+        for campo in CAMPOS_NUMERICOS:
+            valores = np.full(dias, np.nan)
+            valores[indices] = [_a_numero(registros[fecha].get(campo)) for fecha in fechas]
+            self.valores[campo] = valores
+            self._acumulados[campo] = self._acumular(campo, valores)
+
+    def _contribuciones(self, campo, valores):
+        """Filas (valor, tiene dato, cumple objetivo) de cada día"""
+        con_dato = ~np.isnan(valores)
+        cumplido = porcentajes_objetivo(valores, campo) >= UMBRAL_CUMPLIDO
+        return np.vstack([np.where(con_dato, valores, 0.0), con_dato, cumplido])
+
+    def _acumular(self, campo, valores):
+        acumulado = np.zeros((3, len(valores) + 1))
+        np.cumsum(self._contribuciones(campo, valores), axis=1, out=acumulado[:, 1:])
+        return acumulado
+
+    def _extender(self, dias):
+        faltan = dias - len(self.presente)
+        self.presente = np.concatenate([self.presente, np.zeros(faltan, dtype=bool)])
+        for campo in CAMPOS_NUMERICOS:
+            self.valores[campo] = np.concatenate([self.valores[campo], np.full(faltan, np.nan)])
+            acumulado = self._acumulados[campo]
+            self._acumulados[campo] = np.concatenate([acumulado, np.repeat(acumulado[:, -1:], faltan, axis=1)], axis=1)
+
+    def registros(self):
+        """Volver a armar {fecha: registro} con los días registrados"""
+        return {
+            (self.inicio + timedelta(days=int(i))).isoformat(): {
+                campo: None if np.isnan(self.valores[campo][i]) else self.valores[campo][i].item()
+                for campo in CAMPOS_NUMERICOS
+            } for i in np.flatnonzero(self.presente)
+        }
+
+    def actualizar(self, fecha, registro):
+        """Agregar o reemplazar el registro de un día ajustando solo los acumulados siguientes"""
+        dia = date.fromisoformat(fecha)
+        if self.inicio is None or dia < self.inicio:
+            # Un día anterior al primero (poco común): se reconstruye todo
+            registros = self.registros() if self.inicio is not None else {}
+            registros[fecha] = registro
+            self._construir(registros)
+            return
+        i = (dia - self.inicio).days
+        if i >= len(self.presente):
+            self._extender(i + 1)
+        self.presente[i] = True
+        for campo in CAMPOS_NUMERICOS:
+            self.valores[campo][i] = _a_numero(registro.get(campo))
+            acumulado = self._acumulados[campo]
+            anterior = acumulado[:, i + 1] - acumulado[:, i]
+            nuevo = self._contribuciones(campo, self.valores[campo][i:i + 1])[:, 0]
+            acumulado[:, i + 1:] += (nuevo - anterior)[:, None]
+
+    def _rango(self, desde, hasta):
+        """Índices [a, b) de los días entre dos fechas, recortados a los datos"""
+        if self.inicio is None:
+            return 0, 0
+        a = min(max((desde - self.inicio).days, 0), len(self))
+        b = min(max((hasta - self.inicio).days + 1, 0), len(self))
+        return a, max(a, b)
+
+    def _totales(self, ventana, hasta):
+        hasta = hasta or date.today()
+        a, b = self._rango(hasta - timedelta(days=ventana - 1), hasta)
+        return {campo: acumulado[:, b] - acumulado[:, a] for campo, acumulado in self._acumulados.items()}
+
+    def promedios(self, ventana, hasta=None):
+        """Promedio de cada métrica en los últimos `ventana` días (None si no hay datos)"""
+        return {
+            campo: suma / cuenta if cuenta else None
+            for campo, (suma, cuenta, _) in self._totales(ventana, hasta).items()
+        }
+
+    def tasas_cumplimiento(self, ventana, hasta=None):
+        """Fracción de los días con dato de la ventana que cumplieron el objetivo"""
+        return {
+            campo: cumplidos / cuenta if cuenta else None
+            for campo, (_, cuenta, cumplidos) in self._totales(ventana, hasta).items()
+        }
+
+    def _cumplidos_hasta(self, campo, hasta):
+        """Días que cumplen el objetivo desde el primer registro hasta `hasta` (inclusive)"""
+        dias = (hasta - self.inicio).days + 1
+        cumplidos = np.zeros(max(dias, 0), dtype=bool)
+        n = min(dias, len(self))
+        if n > 0:
+            cumplidos[:n] = porcentajes_objetivo(self.valores[campo][:n], campo) >= UMBRAL_CUMPLIDO
+        return cumplidos
+
+    def racha(self, campo, hasta=None):
+        """Días seguidos cumpliendo el objetivo; si hoy aún no hay registro se cuenta desde ayer"""
+        if self.inicio is None:
+            return 0
+        hasta = hasta or date.today()
+        indice = (hasta - self.inicio).days
+        if not (0 <= indice < len(self) and self.presente[indice]):
+            hasta -= timedelta(days=1)
+        cumplidos = self._cumplidos_hasta(campo, hasta)
+        fallos = np.flatnonzero(~cumplidos)
+        return int(len(cumplidos) - (fallos[-1] + 1 if len(fallos) else 0))
+
+    def racha_maxima(self, campo):
+        """Mayor cantidad de días seguidos cumpliendo el objetivo"""
+        if not len(self):
+            return 0
+        cumplidos = np.concatenate([[False], self._cumplidos_hasta(campo, self.inicio + timedelta(days=len(self) - 1)), [False]])
+        cambios = np.flatnonzero(np.diff(cumplidos.astype(np.int8)))
+        return int((cambios[1::2] - cambios[::2]).max()) if len(cambios) else 0
+
+    def resumen(self, ventanas=VENTANAS, hasta=None):
+        """Promedios y tasas de cumplimiento por ventana, y rachas, de cada métrica"""
+        promedios = {ventana: self.promedios(ventana, hasta) for ventana in ventanas}
+        tasas = {ventana: self.tasas_cumplimiento(ventana, hasta) for ventana in ventanas}
+        return {
+            campo: {
+                "promedios": {ventana: promedios[ventana][campo] for ventana in ventanas},
+                "cumplimiento": {ventana: tasas[ventana][campo] for ventana in ventanas},
+                "racha": self.racha(campo, hasta),
+                "racha_maxima": self.racha_maxima(campo)
+            } for campo in CAMPOS_NUMERICOS
+        }
+
+    def agrupar(self, periodo="semana", hasta=None):
+        """Datos para las barras del dashboard
+
+        semana: cada uno de los últimos 7 días con registro; mes: promedio de
+        cada una de las últimas 5 semanas (lunes a domingo); anio: promedio de
+        cada uno de los últimos 12 meses. Se omiten los grupos sin registros.
+        """
+        hasta = hasta or date.today()
+        if periodo == "semana":
+            desde = hasta - timedelta(days=6)
+        elif periodo == "mes":
+            desde = hasta - timedelta(days=28 + hasta.weekday())
+        elif periodo == "anio":
+            mes = hasta.year * 12 + hasta.month - 1 - 11
+            desde = date(mes // 12, mes % 12 + 1, 1)
+        else:
+            raise ValueError(f"Periodo desconocido: {periodo}")
+
+        datos = {"fechas": [], "fechas_cortas": [], **{campo: [] for campo in CAMPOS_NUMERICOS}}
+        a, b = self._rango(desde, hasta)
+        if a == b:
+            return datos
+        dias = np.datetime64(self.inicio) + np.arange(a, b)
+        if periodo == "semana":
+            claves = dias
+        elif periodo == "mes":
+            # El 1970-01-01 fue jueves: restar (días + 3) % 7 lleva al lunes
+            claves = dias - (dias.astype(np.int64) + 3) % 7
+        else:
+            claves = dias.astype("datetime64[M]")
+        grupos, inverso = np.unique(claves, return_inverse=True)
+        con_registro = np.bincount(inverso, weights=self.presente[a:b], minlength=len(grupos)) > 0
+
+        for campo in CAMPOS_NUMERICOS:
+            valores = self.valores[campo][a:b]
+            con_dato = ~np.isnan(valores)
+            sumas = np.bincount(inverso, weights=np.where(con_dato, valores, 0.0), minlength=len(grupos))
+            cuentas = np.bincount(inverso, weights=con_dato, minlength=len(grupos))
+            promedios = np.divide(sumas, cuentas, out=np.full(len(grupos), float(VALORES_FALTANTES.get(campo, 0))),
+                                  where=cuentas > 0)
+            datos[campo] = promedios[con_registro].tolist()
+
+        for clave in grupos[con_registro].astype(object):
+            datos["fechas"].append(clave)
+            if periodo == "semana":
+                datos["fechas_cortas"].append(DIAS_CORTOS[clave.weekday()])
+            elif periodo == "mes":
+                datos["fechas_cortas"].append(f"{clave.day:02d}/{clave.month:02d}")
+            else:
+                datos["fechas_cortas"].append(MESES_CORTOS[clave.month - 1])
+        return datos
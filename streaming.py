@@ -0,0 +1,223 @@
+import queue
+import threading
+import time
+
+from ingredientes import conjunto_canonico
+from metricas import registro
+
+# Marca de fin de un stream dentro de la cola compartida
+_FIN = object()
+
+
+def extraer_texto(stream):
+    """Emitir solo el texto de cada chunk de un stream de chat"""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def emitir_y_acumular(fragmentos, al_terminar):
+    """Reemitir fragmentos de texto y entregar el texto completo al terminar"""
+    acumulados = []
+    for fragmento in fragmentos:
+        acumulados.append(fragmento)
+        yield fragmento
+    if acumulados:
+        al_terminar("".join(acumulados))
+
+
+def multiplexar_streams(fabricas, preparar_hilo=None):
+    """Ejecutar varias peticiones en paralelo y emitir (nombre, fragmento) según llegan
+
+    `fabricas` es un dict nombre -> función sin argumentos que devuelve un
+    iterable de fragmentos de texto (o None si la petición falló). Si un stream se interrumpe se emite
+    (nombre, excepción) en lugar de un fragmento de texto.
+    """
+    cola = queue.Queue()
+
+    def consumir(nombre, fabrica):
+        try:
+            stream = fabrica()
+            if stream is not None:
+                for fragmento in stream:
+                    cola.put((nombre, fragmento))
+        except Exception as error:
+            cola.put((nombre, error))
+        finally:
+            cola.put((nombre, _FIN))
+
+    for nombre, fabrica in fabricas.items():
+        hilo = threading.Thread(target=consumir, args=(nombre, fabrica), daemon=True)
+        if preparar_hilo:
+            preparar_hilo(hilo)
+        hilo.start()
+
+    pendientes = len(fabricas)
+    while pendientes:
+        nombre, fragmento = cola.get()
+        if fragmento is _FIN:
+            pendientes -= 1
+        else:
+            yield nombre, fragmento
+
+
+class RenderizadorStream:
+    """Agrupar fragmentos y actualizar el contenedor por ventana de tiempo o cantidad
+
+    Evita reenviar todo el markdown acumulado por cada token: el contenedor se
+    actualiza como máximo cada `intervalo_segundos` o cada `max_fragmentos`
+    fragmentos, y siempre una última vez al llamar a `finalizar()`.
+    """
+
+    def __init__(self, contenedor, intervalo_segundos=0.1, max_fragmentos=40, reloj=time.monotonic):
+        self.contenedor = contenedor
+        self.intervalo_segundos = intervalo_segundos
+        self.max_fragmentos = max_fragmentos
+        self.reloj = reloj
+        self.envios = 0
+        self._fragmentos = []
+        self._pendientes = 0
+        # El primer fragmento se muestra de inmediato
+        self._ultimo_envio = float("-inf")
+
+    @property
+    def texto(self):
+        """Texto acumulado hasta el momento"""
+        if len(self._fragmentos) > 1:
+            self._fragmentos = ["".join(self._fragmentos)]
+        return self._fragmentos[0] if self._fragmentos else ""
+
+    def agregar(self, fragmento):
+        """Agregar un fragmento y volcar si se cumplió la ventana"""
+        self._fragmentos.append(fragmento)
+        self._pendientes += 1
+        if (self._pendientes >= self.max_fragmentos
+                or self.reloj() - self._ultimo_envio >= self.intervalo_segundos):
+            self._volcar()
+
+    def finalizar(self):
+        """Volcar lo pendiente y devolver el texto completo"""
+        if self._pendientes:
+            self._volcar()
+        return self.texto
+
+    def _volcar(self):
+        self.contenedor.markdown(self.texto)
+        self.envios += 1
+        self._pendientes = 0
+        self._ultimo_envio = self.reloj()
+
+
+def cambio_material(especulado, final, contencion_minima=0.8, cobertura_minima=0.6):
+    """Decidir si la lista final invalida las recetas generadas con la lista parcial
+
+    Las recetas siguen sirviendo si casi todos los ingredientes especulados
+    siguen en la lista final y estos cubren buena parte de ella; los que se
+    agregan al final solo quedan sin usar.
+    """
+    especulado, final = set(especulado), set(final)
+    if not especulado or not final:
+        return True
+    comunes = len(especulado & final)
+    return comunes / len(especulado) < contencion_minima or comunes / len(final) < cobertura_minima
+
+
+class GeneracionEspeculativa:
+    """Empezar a generar recetas con la lista parcial de ingredientes mientras llega el resto
+
+    Se alimenta con los fragmentos del stream de ingredientes. Cuando la lista
+    llega a `minimo_ingredientes` líneas completas, o deja de crecer durante
+    `segundos_estable` con al menos 3, se lanza `iniciar(texto_parcial)` en un
+    hilo que guarda los fragmentos. Al terminar el stream, `reconciliar` reutiliza
+    esa generación salvo que la lista final cambie de forma material (ver
+    `cambio_material`), en cuyo caso la cancela y empieza otra.
+    """
+
+    def __init__(self, iniciar, minimo_ingredientes=6, segundos_estable=0.75,
+                 etapa="recetas", preparar_hilo=None, reloj=time.monotonic):
+        self.iniciar = iniciar
+        self.minimo_ingredientes = minimo_ingredientes
+        self.segundos_estable = segundos_estable
+        self.etapa = etapa
+        self.preparar_hilo = preparar_hilo
+        self.reloj = reloj
+        self.conjunto_especulado = None
+        self._texto = ""
+        self._cantidad = 0
+        self._ultimo_cambio = reloj()
+        self._cola = queue.Queue()
+        self._cancelada = threading.Event()
+        self._hilo = None
+
+    @property
+    def iniciada(self):
+        return self._hilo is not None
+
+    def agregar(self, fragmento):
+        """Agregar un fragmento del stream de ingredientes y especular si ya conviene"""
+        self._texto += fragmento
+        if self.iniciada or "\n" not in fragmento and self._cantidad < 3:
+            return
+        # Solo cuentan las líneas completas: la última puede estar a medias
+        completas = self._texto[:self._texto.rfind("\n") + 1]
+        cantidad = len(conjunto_canonico(completas))
+        ahora = self.reloj()
+        if cantidad != self._cantidad:
+            self._cantidad = cantidad
+            self._ultimo_cambio = ahora
+        if (cantidad >= self.minimo_ingredientes
+                or cantidad >= 3 and ahora - self._ultimo_cambio >= self.segundos_estable):
+            self._lanzar(completas)
+
+    def _lanzar(self, texto):
+        self.conjunto_especulado = conjunto_canonico(texto)
+        registro.contar(self.etapa, "especulacion_iniciada")
+        self._hilo = threading.Thread(target=self._consumir, args=(texto,), daemon=True)
+        if self.preparar_hilo:
+            self.preparar_hilo(self._hilo)
+        self._hilo.start()
+
+    def _consumir(self, texto):
+        try:
+            fragmentos = self.iniciar(texto)
+            for fragmento in fragmentos or ():
+                if self._cancelada.is_set():
+                    # Cerrar el generador suelta la suscripción en ClienteVueloUnico, que
+                    # cierra el stream de la API si nadie más espera esa misma petición
+                    getattr(fragmentos, "close", lambda: None)()
+                    return
+                self._cola.put(fragmento)
+        except Exception as error:
+            self._cola.put(error)
+        finally:
+            self._cola.put(_FIN)
+
+    def cancelar(self):
+        """Descartar la generación especulativa en curso"""
+        self._cancelada.set()
+
+    def reconciliar(self, texto_final, al_aceptar=None):
+        """Devolver los fragmentos de recetas para la lista final de ingredientes
+
+        Si se reutiliza la especulación y hay `al_aceptar`, se le entrega el
+        texto completo al terminar (p. ej. para guardarlo con la clave final).
+        """
+        if not self.iniciada:
+            return self.iniciar(texto_final)
+        if cambio_material(self.conjunto_especulado, conjunto_canonico(texto_final)):
+            self.cancelar()
+            registro.contar(self.etapa, "especulacion_cancelada")
+            return self.iniciar(texto_final)
+        registro.contar(self.etapa, "especulacion_aceptada")
+        if al_aceptar:
+            return emitir_y_acumular(self._reproducir(), al_aceptar)
+        return self._reproducir()
+
+    def _reproducir(self):
+        while True:
+            elemento = self._cola.get()
+            if elemento is _FIN:
+                return
+            if isinstance(elemento, Exception):
+                raise elemento
+            yield elemento
@@ -0,0 +1,166 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import medir, registro
+
+ETAPA = "escritorio_tareas"
+
+
+class TareaCancelada(Exception):
+    """La tarea fue cancelada o reemplazada por una más nueva de su canal"""
+
+
+class TokenCancelacion:
+    """Marca compartida entre quien lanza una tarea y el hilo que la ejecuta"""
+
+    def __init__(self, canal, generacion):
+        self.canal = canal
+        self.generacion = generacion
+        self.terminada = False
+        self._cancelada = threading.Event()
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    def cancelar(self):
+        self._cancelada.set()
+
+    def verificar(self):
+        """Lanzar `TareaCancelada` si ya no vale la pena seguir (p. ej. antes de otra llamada a la API)"""
+        if self._cancelada.is_set():
+            raise TareaCancelada(self.canal)
+
+
+class EjecutorTareas:
+    """Hilos acotados para las tareas de IA de la app de escritorio
+
+    Cada tarea pertenece a un canal ("recetas", "consejo"): lanzar otra en el
+    mismo canal cancela la anterior y sube la generación, así una foto elegida
+    mientras se analizaba otra no termina pisada por el resultado viejo. La
+    tarea recibe su `TokenCancelacion` como primer argumento para dejar de
+    trabajar (y no gastar más llamadas) en cuanto la reemplazan. Todo lo que
+    toca la interfaz pasa por una cola (`publicar`, `transmitir`) que el hilo
+    de Tk vacía con `drenar` desde un `after` periódico; al vaciarla se
+    descarta lo de generaciones que ya no son las vigentes.
+    """
+
+    def __init__(self, max_hilos=2, etapa=ETAPA):
+        self.etapa = etapa
+        self._salida = queue.Queue()
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="tarea")
+        self._candado = threading.Lock()
+        self._generaciones = itertools.count(1)
+        self._vigentes = {}
+
+    def lanzar(self, canal, funcion, *args, al_terminar=None, al_fallar=None):
+        """Encolar `funcion(token, *args)` reemplazando la tarea anterior del canal
+
+        `al_terminar(resultado)` y `al_fallar(error)` se ejecutan en el hilo de
+        la interfaz, solo si la tarea sigue vigente.
+        """
+        with self._candado:
+            anterior = self._vigentes.get(canal)
+            if anterior is not None and not anterior.cancelada:
+                if not anterior.terminada:
+                    registro.contar(self.etapa, "reemplazada")
+                anterior.cancelar()
+            token = TokenCancelacion(canal, next(self._generaciones))
+            self._vigentes[canal] = token
+        self._ejecutor.submit(self._ejecutar, token, funcion, args, al_terminar, al_fallar)
+        return token
+
+    def vigente(self, token):
+        """Si la tarea no fue cancelada y sigue siendo la última de su canal"""
+        with self._candado:
+            actual = self._vigentes.get(token.canal)
+            return not token.cancelada and actual is not None and actual.generacion == token.generacion
+
+    def publicar(self, token, funcion, *args):
+        """Ejecutar `funcion(*args)` en el hilo de la interfaz si la tarea sigue vigente"""
+        self._salida.put((token, funcion, args, False))
+
+    def transmitir(self, token, fragmentos, destino):
+        """Enviar los fragmentos de un stream a `destino(texto)` y devolver el texto completo
+
+        Si la tarea se cancela a medias se cierra el stream (y su conexión) y
+        se lanza `TareaCancelada`.
+        """
+        partes = []
+        try:
+            for fragmento in fragmentos:
+                token.verificar()
+                partes.append(fragmento)
+                self._salida.put((token, destino, fragmento, True))
+        finally:
+            getattr(fragmentos, "close", lambda: None)()
+        return "".join(partes)
+
+    def drenar(self, max_elementos=500):
+        """Ejecutar en el hilo de la interfaz lo que publicaron las tareas
+
+        Los fragmentos seguidos hacia el mismo destino se unen en una sola
+        llamada: un stream rápido se vuelca con una inserción por ciclo en lugar
+        de una por token. `max_elementos` acota el trabajo de cada ciclo para
+        no bloquear la ventana; lo que quede sale en el siguiente.
+        """
+        token_texto, destino_texto, texto = None, None, []
+        for _ in range(max_elementos):
+            try:
+                token, funcion, argumentos, es_fragmento = self._salida.get_nowait()
+            except queue.Empty:
+                break
+            if es_fragmento and token is token_texto and funcion == destino_texto:
+                texto.append(argumentos)
+                continue
+            if texto:
+                self._entregar(token_texto, destino_texto, ("".join(texto),))
+            token_texto, destino_texto, texto = None, None, []
+            if es_fragmento:
+                token_texto, destino_texto, texto = token, funcion, [argumentos]
+            else:
+                self._entregar(token, funcion, argumentos)
+        if texto:
+            self._entregar(token_texto, destino_texto, ("".join(texto),))
+
+    def _entregar(self, token, funcion, argumentos):
+        # Se comprueba al entregar: pudo reemplazarse mientras esperaba en la cola
+        if self.vigente(token):
+            funcion(*argumentos)
+        else:
+            registro.contar(self.etapa, "resultado_descartado")
+
+    def _ejecutar(self, token, funcion, args, al_terminar, al_fallar):
+        if token.cancelada:
+            # Reemplazada antes de que hubiera un hilo libre
+            registro.contar(self.etapa, "omitida")
+            return
+        try:
+            with medir(self.etapa, token.canal):
+                resultado = funcion(token, *args)
+        except TareaCancelada:
+            registro.contar(self.etapa, "cancelada")
+            return
+        except Exception as error:
+            if al_fallar:
+                self.publicar(token, al_fallar, error)
+            return
+        finally:
+            token.terminada = True
+        if al_terminar:
+            self.publicar(token, al_terminar, resultado)
+
+    def cancelar(self, canal=None):
+        """Cancelar la tarea vigente de un canal, o de todos"""
+        with self._candado:
+            tokens = list(self._vigentes.values()) if canal is None else [self._vigentes.get(canal)]
+        for token in tokens:
+            if token is not None:
+                token.cancelar()
+
+    def cerrar(self):
+        """Cancelar todo y soltar los hilos sin esperar a las llamadas en curso"""
+        self.cancelar()
+        self._ejecutor.shutdown(wait=False, cancel_futures=True)